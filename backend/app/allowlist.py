@@ -0,0 +1,223 @@
+import logging
+import os
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Used when no public suffix list file is configured: common multi-label
+# ICANN suffixes and hosting platforms that give each customer a subdomain.
+# Any single label (com, uk, ...) is a public suffix by the PSL default rule.
+DEFAULT_PUBLIC_SUFFIXES = (
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'ltd.uk', 'plc.uk', 'net.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'co.nz', 'org.nz', 'net.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'go.jp', 'co.kr', 'or.kr', 'ac.kr',
+    'com.cn', 'net.cn', 'org.cn', 'gov.cn', 'edu.cn', 'com.hk', 'com.tw', 'com.sg',
+    'com.br', 'net.br', 'org.br', 'gov.br', 'com.mx', 'com.ar', 'com.co', 'com.tr',
+    'co.in', 'net.in', 'org.in', 'gov.in', 'co.za', 'org.za', 'co.il', 'co.id',
+    'com.ru', 'org.ru', 'net.ru', 'com.ua', 'com.pl', 'com.vn', 'com.my', 'com.ph',
+    'github.io', 'gitlab.io', 'blogspot.com', 'appspot.com', 'herokuapp.com',
+    'azurewebsites.net', 'cloudfront.net', 'netlify.app', 'vercel.app',
+    'pages.dev', 'workers.dev', 'web.app', 'firebaseapp.com', 'glitch.me',
+    'ngrok.io', 'duckdns.org', 'no-ip.org', 'ddns.net', '000webhostapp.com',
+)
+
+def _normalize(domain: str) -> str:
+    return domain.strip().lower()
+
+def _suffixes(host: str) -> Iterator[str]:
+    """host, then each parent domain: a.b.c, b.c, c"""
+    yield host
+    dot = host.find('.')
+    while dot != -1:
+        yield host[dot + 1:]
+        dot = host.find('.', dot + 1)
+
+class PublicSuffixList:
+    """Public suffix rules (publicsuffix.org format) with O(labels) lookups.
+
+    Supports normal, wildcard (*.ck) and exception (!www.ck) rules.
+    """
+
+    def __init__(self, rules: Iterable[str] = DEFAULT_PUBLIC_SUFFIXES):
+        self.rules = set()
+        self.wildcards = set()
+        self.exceptions = set()
+        for rule in rules:
+            rule = _normalize(rule.split()[0]) if rule.strip() else ''
+            if not rule or rule.startswith('//'):
+                continue
+            if rule.startswith('!'):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith('*.'):
+                self.wildcards.add(rule[2:])
+            else:
+                self.rules.add(rule)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'PublicSuffixList':
+        with open(path, encoding='utf-8') as f:
+            return cls(f)
+
+    def public_suffix(self, host: str) -> str:
+        """The longest public suffix of host ('co.uk' for 'a.b.co.uk')"""
+        suffixes = list(_suffixes(_normalize(host).rstrip('.')))
+        # Longest first, so the first rule that applies is the prevailing one
+        for candidate, parent in zip(suffixes, suffixes[1:]):
+            if candidate in self.exceptions:
+                return parent
+            if candidate in self.rules or parent in self.wildcards:
+                return candidate
+        return suffixes[-1]
+
+    def registered_domain(self, host: str) -> Optional[str]:
+        """The public suffix plus one label ('evil.co.uk' for 'a.evil.co.uk').
+
+        Returns None when host is itself a public suffix.
+        """
+        host = _normalize(host).rstrip('.')
+        suffix = self.public_suffix(host)
+        if host == suffix:
+            return None
+        label = host[:-len(suffix) - 1].rsplit('.', 1)[-1]
+        return f'{label}.{suffix}'
+
+_default_public_suffixes = None
+
+def default_public_suffixes() -> PublicSuffixList:
+    """The list named by PUBLIC_SUFFIX_LIST, or DEFAULT_PUBLIC_SUFFIXES"""
+    global _default_public_suffixes
+    if _default_public_suffixes is None:
+        path = os.environ.get('PUBLIC_SUFFIX_LIST')
+        _default_public_suffixes = PublicSuffixList.from_file(path) if path else PublicSuffixList()
+    return _default_public_suffixes
+
+def registered_domain(host: str) -> Optional[str]:
+    """Registered domain of host under the default public suffix list"""
+    return default_public_suffixes().registered_domain(host)
+
+class DomainAllowlist:
+    """A set of domains that also covers all of their subdomains.
+
+    A host is listed if it or any parent domain is in the set, found by
+    hashing each of its suffixes: O(labels) whatever the list size. With
+    public_suffixes, entries at or above a public suffix (github.io,
+    co.uk) never match, so one listed hosting platform doesn't hide every
+    customer subdomain on it.
+    """
+
+    def __init__(self, domains: Iterable[str] = (), public_suffixes: Optional[PublicSuffixList] = None):
+        self.domains = {_normalize(domain) for domain in domains}
+        self.public_suffixes = public_suffixes
+
+    def __contains__(self, host: str) -> bool:
+        domains = self.domains
+        if self.public_suffixes is None:
+            if host in domains:
+                return True
+            dot = host.find('.')
+            while dot != -1:
+                if host[dot + 1:] in domains:
+                    return True
+                dot = host.find('.', dot + 1)
+            return False
+
+        shortest = self.public_suffixes.registered_domain(host)
+        if shortest is None:
+            return False
+        for suffix in _suffixes(host):
+            if suffix in domains:
+                return True
+            if len(suffix) == len(shortest):
+                return False
+        return False
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.domains)
+
+    def add(self, domain: str):
+        self.domains.add(_normalize(domain))
+
+    def discard(self, domain: str):
+        self.domains.discard(_normalize(domain))
+
+def read_domains(path: str) -> Iterator[str]:
+    """Domains from a file, one per line: plain lists, '#' comments, or
+    ranked CSV such as the Tranco/Umbrella top-1M lists (rank,domain)"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield line.rsplit(',', 1)[-1].strip()
+
+class FileAllowlist(DomainAllowlist):
+    """A DomainAllowlist loaded from files and reloaded when they change.
+
+    Modification times are checked at most every reload_interval seconds,
+    on lookup. A reload builds the new set aside and swaps it in, so
+    concurrent lookups never see a partial list; a file that fails to load
+    keeps the previous contents.
+    """
+
+    def __init__(self, paths: Sequence[str], reload_interval: float = 30.0,
+                 public_suffixes: Optional[PublicSuffixList] = None):
+        super().__init__(public_suffixes=public_suffixes or default_public_suffixes())
+        self.paths = list(paths)
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._next_check = 0.0
+        self.reload()
+
+    def _current_mtimes(self) -> List[Optional[float]]:
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def reload(self, force: bool = True) -> bool:
+        """Reload the files (if changed, unless force); returns whether it did"""
+        with self._lock:
+            return self._reload(force)
+
+    def _reload(self, force: bool) -> bool:
+        mtimes = self._current_mtimes()
+        self._next_check = time.monotonic() + self.reload_interval
+        if not force and mtimes == self._mtimes:
+            return False
+        domains = set()
+        try:
+            for path in self.paths:
+                domains.update(_normalize(domain) for domain in read_domains(path))
+        except OSError:
+            logger.exception('Failed to load allowlist; keeping %d entries', len(self.domains))
+            return False
+        self.domains = domains
+        self._mtimes = mtimes
+        logger.info('Loaded %d allowlisted domains from %s', len(domains), ', '.join(self.paths))
+        return True
+
+    def __contains__(self, host: str) -> bool:
+        # Lookups never wait for a reload another thread is already doing
+        if (self.reload_interval > 0 and time.monotonic() >= self._next_check
+                and self._lock.acquire(blocking=False)):
+            try:
+                self._reload(force=False)
+            finally:
+                self._lock.release()
+        return super().__contains__(host)
+
+def allowlists_from_environment() -> List[DomainAllowlist]:
+    """File allowlists named by ALLOWLIST_FILES (os.pathsep-separated)"""
+    paths = [path for path in os.environ.get('ALLOWLIST_FILES', '').split(os.pathsep) if path]
+    if not paths:
+        return []
+    interval = float(os.environ.get('ALLOWLIST_RELOAD_INTERVAL', 30))
+    return [FileAllowlist(paths, reload_interval=interval)]
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+import weakref
+import aiohttp
+from yarl import URL
+from concurrent.futures import Executor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from app.ipfilter import IPRangeSet
+from app.scrapers import CONTEXT_SIZE, ScrapeTimings, WebScraper
+
+class AsyncWebScraper:
+    """Fetch many URLs concurrently and feed them to the WebScraper pipeline.
+
+    All requests share one connection pool with a global and a per-host
+    connection limit and a DNS cache. Parsing and extraction are CPU-bound,
+    so they run in an executor to keep the event loop free for I/O, or with
+    pool, an ExtractionPool, in worker processes fed the raw bytes.
+
+    A request waits untimed for one of the per_host slots of its host;
+    only then do timeout (the whole request and body read) and
+    connect_timeout (opening the socket) apply. Timed on the session, they
+    would also count the wait for a pooled connection, failing requests
+    queued behind a busy host.
+    """
+
+    def __init__(self, scraper: Optional[WebScraper] = None, concurrency: int = 50,
+                 per_host: int = 4, timeout: float = 30, connect_timeout: float = 10,
+                 dns_cache_ttl: int = 300, executor: Optional[Executor] = None, pool=None):
+        self.scraper = scraper or WebScraper()
+        self.concurrency = concurrency
+        self.per_host = per_host
+        # Passed to each request once it holds a slot of its host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.dns_cache_ttl = dns_cache_ttl
+        self.executor = executor
+        self.pool = pool
+        self.headers = {'User-Agent': self.scraper.session.headers['User-Agent']}
+        # Per-host semaphores of each open session, whose event loop they belong to
+        self._host_slots = weakref.WeakKeyDictionary()
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        return aiohttp.ClientSession(connector=connector, headers=self.headers)
+
+    def _host_slot(self, session: aiohttp.ClientSession, url: str) -> asyncio.Semaphore:
+        """The semaphore limiting session's requests to url's host to per_host"""
+        parsed = URL(url)
+        slots = self._host_slots.setdefault(session, {})
+        key = (parsed.scheme, parsed.host, parsed.port)
+        if key not in slots:
+            slots[key] = asyncio.Semaphore(self.per_host)
+        return slots[key]
+
+    async def scrape_url(self, session: aiohttp.ClientSession, url: str,
+                         include_private_ips: bool = False,
+                         excluded_networks: Optional[IPRangeSet] = None,
+                         context_size: int = CONTEXT_SIZE, validators: Optional[Dict] = None,
+                         keep_document: bool = False) -> Dict:
+        """Scrape a URL; returns the same result dict as WebScraper.scrape_url,
+        which validators and keep_document are as for.
+
+        Bodies are read whole rather than streamed, so unchanged non-HTML
+        content is recognized by its digest before extraction. fetch is
+        timed from the request until the body is read and decoded; waiting
+        for a free slot of the host comes before it.
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        timings = ScrapeTimings()
+        try:
+            async with self._host_slot(session, url):
+                started = time.perf_counter()
+                async with session.get(url, headers=headers, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    new_validators = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'body_digest': validators.get('body_digest'),
+                        'content_digest': validators.get('content_digest')
+                    }
+                    status_code = response.status
+                    if status_code == 304:
+                        timings.add('fetch', time.perf_counter() - started)
+                        return {
+                            'success': True,
+                            'skipped': 'not_modified',
+                            'iocs': [],
+                            'validators': {key: value or validators.get(key) for key, value in new_validators.items()},
+                            'status_code': status_code,
+                            **timings.to_dict()
+                        }
+                    content_type = response.headers.get('content-type', '').lower()
+                    raw_content = await response.read()
+                    if self.pool is not None:
+                        encoding = response.get_encoding()
+                    else:
+                        text = await response.text(errors='replace')
+                    timings.add('fetch', time.perf_counter() - started)
+                    timings.bytes_fetched = len(raw_content)
+
+            is_html = 'html' in content_type
+            new_validators['body_digest'] = hashlib.sha256(raw_content).hexdigest()
+            if new_validators['body_digest'] == validators.get('body_digest'):
+                result = {
+                    'success': True,
+                    'skipped': 'unchanged',
+                    'iocs': [],
+                    'content_length': len(raw_content),
+                    'content_type': 'html_visible' if is_html else 'raw'
+                }
+            else:
+                # As with WebScraper.scrape_url, only HTML has a separate digest of its visible text
+                content_digest = validators.get('content_digest') if is_html else None
+                loop = asyncio.get_running_loop()
+                if self.pool is not None:
+                    # The executor thread only waits on the pool
+                    result = await loop.run_in_executor(
+                        self.executor, self.pool.process, raw_content, content_type, encoding, include_private_ips,
+                        content_digest, excluded_networks, context_size, keep_document
+                    )
+                else:
+                    result = await loop.run_in_executor(
+                        self.executor, self.scraper.process_content, text, content_type, include_private_ips,
+                        content_digest, excluded_networks, context_size, keep_document
+                    )
+            result.update(timings.merge(result).to_dict())
+            new_validators['content_digest'] = result.pop('content_digest', new_validators['content_digest'])
+            if not is_html:
+                new_validators['content_digest'] = new_validators['body_digest']
+            result['validators'] = new_validators
+            result['status_code'] = status_code
+            return result
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {
+                'success': False,
+                'error': str(e) or e.__class__.__name__,
+                'iocs': []
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f"Unexpected error: {str(e)}",
+                'iocs': []
+            }
+
+    async def scrape_urls(self, urls: Iterable[str], include_private_ips: bool = False,
+                          excluded_networks: Optional[IPRangeSet] = None,
+                          context_size: int = CONTEXT_SIZE) -> List[Dict]:
+        """Scrape URLs concurrently; results are returned in input order"""
+        async with self._create_session() as session:
+            return await asyncio.gather(
+                *(self.scrape_url(session, url, include_private_ips, excluded_networks, context_size) for url in urls)
+            )
+
+    def scrape_many(self, urls: Iterable[str], include_private_ips: bool = False,
+                    excluded_networks: Optional[IPRangeSet] = None,
+                    context_size: int = CONTEXT_SIZE) -> List[Dict]:
+        """Blocking wrapper around scrape_urls for synchronous callers"""
+        return asyncio.run(self.scrape_urls(urls, include_private_ips, excluded_networks, context_size))
+
+    def scrape_as_completed(self, targets: Sequence[Tuple[str, Optional[Dict]]], include_private_ips: bool = False,
+                            excluded_networks: Optional[IPRangeSet] = None, context_size: int = CONTEXT_SIZE,
+                            keep_document: bool = False) -> Iterator[List[Tuple[int, Dict]]]:
+        """Scrape (url, validators) targets concurrently for a synchronous
+        caller, which gets the results as they finish.
+
+        The event loop runs in a background thread. Each iteration blocks
+        until at least one result is in and yields all that are, as a list
+        of (target index, result), so the caller can handle them in groups
+        while the rest are fetched.
+        """
+        results = queue.Queue()
+        done = object()
+
+        async def scrape_all():
+            async with self._create_session() as session:
+                async def scrape(index, url, validators):
+                    results.put((index, await self.scrape_url(
+                        session, url, include_private_ips, excluded_networks, context_size, validators, keep_document
+                    )))
+                await asyncio.gather(*(scrape(index, url, validators) for index, (url, validators) in enumerate(targets)))
+
+        def run():
+            try:
+                asyncio.run(scrape_all())
+            finally:
+                results.put(done)
+
+        threading.Thread(target=run, name='scrape-batch', daemon=True).start()
+        finished = False
+        while not finished:
+            group = [results.get()]
+            while not results.empty():
+                group.append(results.get_nowait())
+            if group[-1] is done:
+                group.pop()
+                finished = True
+            if group:
+                yield group
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+import re
+import uuid
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence
+from sqlalchemy import select
+from app import db
+from app.models import IOC, IOCSighting, IOCType
+
+# Rows fetched per round trip of the server-side cursor, and written per
+# chunk of the response
+CHUNK_ROWS = 2000
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'stix': ('application/stix+json;version=2.1', 'json'),
+}
+
+CSV_FIELDS = ('id', 'ioc_type', 'value', 'confidence', 'sighting_count', 'first_seen', 'last_seen')
+
+# STIX indicator ids are derived from the IOC's type and normalized value,
+# so exporting the same indicator again updates it rather than duplicating it
+STIX_NAMESPACE = uuid.UUID('00abedb4-aa42-466c-9c01-fed23315a9b7')
+STIX_HASHES = {32: 'MD5', 40: 'SHA-1', 64: 'SHA-256', 128: 'SHA-512'}
+STIX_STRING = re.compile(r"['\\]")
+
+def export_query(ioc_type: Optional[IOCType] = None, since: Optional[datetime] = None,
+                 min_confidence: Optional[float] = None, session_id: Optional[int] = None,
+                 include_context: bool = False):
+    """SELECT of the exported IOC columns in id order, as plain rows.
+
+    since matches IOCs seen since then (last_seen); session_id those found
+    by that session. Contexts stored as document offsets are cut out by the
+    database, as for /iocs.
+    """
+    columns = [IOC.id, IOC.ioc_type, IOC.value, IOC.value_hash, IOC.confidence, IOC.sighting_count,
+               IOC.first_seen, IOC.last_seen]
+    if include_context:
+        columns.append(db.func.coalesce(IOC.context, IOC.document_context).label('context'))
+    statement = select(*columns).order_by(IOC.id)
+    if ioc_type is not None:
+        statement = statement.where(IOC.ioc_type == ioc_type)
+    if since is not None:
+        statement = statement.where(IOC.last_seen >= since)
+    if min_confidence is not None:
+        statement = statement.where(IOC.confidence >= min_confidence)
+    if session_id is not None:
+        statement = statement.where(IOC.id.in_(
+            select(IOCSighting.ioc_id).where(IOCSighting.scrape_session_id == session_id)
+        ))
+    return statement
+
+def iter_chunks(statement, chunk_rows: int = CHUNK_ROWS) -> Iterator[Sequence]:
+    """Rows of statement in lists of chunk_rows, read through a server-side
+    cursor on PostgreSQL so memory stays flat however many rows match"""
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=chunk_rows))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+def _timestamp(value: datetime) -> str:
+    """STIX timestamp: UTC with millisecond precision"""
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+def _fields(row) -> dict:
+    fields = {
+        'id': row.id,
+        'ioc_type': row.ioc_type.value,
+        'value': row.value,
+        'confidence': row.confidence,
+        'sighting_count': row.sighting_count,
+        'first_seen': row.first_seen.isoformat(),
+        'last_seen': row.last_seen.isoformat()
+    }
+    if 'context' in row._fields:
+        fields['context'] = row.context
+    return fields
+
+def stix_pattern(ioc_type: IOCType, value: str) -> str:
+    """STIX 2.1 pattern matching an IOC value"""
+    if ioc_type == IOCType.ASN:
+        return f"[autonomous-system:number = {value[2:].lstrip('0') or '0'}]"
+    quoted = "'" + STIX_STRING.sub(lambda match: '\\' + match.group(), value) + "'"
+    if ioc_type == IOCType.IP_ADDRESS:
+        return f"[{'ipv6-addr' if ':' in value else 'ipv4-addr'}:value = {quoted}]"
+    if ioc_type == IOCType.DOMAIN:
+        return f'[domain-name:value = {quoted}]'
+    if ioc_type == IOCType.URL:
+        return f'[url:value = {quoted}]'
+    if ioc_type == IOCType.HASH and len(value) in STIX_HASHES:
+        return f"[file:hashes.'{STIX_HASHES[len(value)]}' = {quoted.lower()}]"
+    return f'[file:name = {quoted}]'
+
+def stix_indicator(row) -> dict:
+    indicator = {
+        'type': 'indicator',
+        'spec_version': '2.1',
+        'id': f'indicator--{uuid.uuid5(STIX_NAMESPACE, f"{row.ioc_type.value}:{row.value_hash}")}',
+        'created': _timestamp(row.first_seen),
+        'modified': _timestamp(row.last_seen),
+        'name': row.value,
+        'indicator_types': ['malicious-activity'],
+        'pattern': stix_pattern(row.ioc_type, row.value),
+        'pattern_type': 'stix',
+        'valid_from': _timestamp(row.first_seen),
+        'confidence': round((row.confidence or 0) * 100),
+        'labels': [row.ioc_type.value]
+    }
+    if 'context' in row._fields and row.context:
+        indicator['description'] = row.context
+    return indicator
+
+def ndjson_lines(chunks: Iterable[Sequence]) -> Iterator[str]:
+    for rows in chunks:
+        yield ''.join(json.dumps(_fields(row)) + '\n' for row in rows)
+
+def csv_lines(chunks: Iterable[Sequence], include_context: bool = False) -> Iterator[str]:
+    fields = CSV_FIELDS + ('context',) if include_context else CSV_FIELDS
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields)
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows(_fields(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stix_bundle(chunks: Iterable[Sequence]) -> Iterator[str]:
+    """A STIX 2.1 bundle, written object by object"""
+    yield f'{{"type": "bundle", "id": "bundle--{uuid.uuid4()}", "objects": ['
+    separator = ''
+    for rows in chunks:
+        yield separator + ', '.join(json.dumps(stix_indicator(row)) for row in rows)
+        separator = ', '
+    yield ']}\n'
+
+def export_iocs(export_format: str, statement, include_context: bool = False) -> Iterator[str]:
+    """The IOCs selected by statement (see export_query) in export_format,
+    as chunks of text for a streamed response"""
+    chunks = iter_chunks(statement)
+    if export_format == 'ndjson':
+        return ndjson_lines(chunks)
+    if export_format == 'csv':
+        return csv_lines(chunks, include_context)
+    if export_format == 'stix':
+        return stix_bundle(chunks)
+    raise ValueError(f'Unknown export format: {export_format}')
@@ -0,0 +1,287 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from app.ipfilter import IPRangeSet
+from app.feeds import SNIFF_SIZE
+from app.scrapers import CONTEXT_SIZE, RUN_CHARS, ExtractionBudget, ScrapeTimings, WebScraper
+
+logger = logging.getLogger(__name__)
+
+# The WebScraper of a worker process, built once by _initialize
+_scraper: Optional[WebScraper] = None
+
+def _initialize():
+    global _scraper
+    _scraper = WebScraper()
+
+def _ready() -> int:
+    return os.getpid()
+
+def _decode(raw: bytes, encoding: Optional[str]) -> str:
+    try:
+        return raw.decode(encoding or 'utf-8', errors='replace')
+    except LookupError:
+        # Unknown charset in the Content-Type header
+        return raw.decode('utf-8', errors='replace')
+
+def _process(raw: bytes, content_type: str, encoding: Optional[str], include_private_ips: bool,
+             content_digest: Optional[str], excluded_networks: Optional[IPRangeSet],
+             context_size: int, keep_document: bool) -> Dict:
+    return _scraper.process_content(
+        _decode(raw, encoding), content_type, include_private_ips, content_digest,
+        excluded_networks, context_size, keep_document
+    )
+
+def _analyze(raw: bytes, content_type: str, encoding: Optional[str]) -> Tuple[str, str, int]:
+    text = _decode(raw, encoding)
+    return (*_scraper.analyzed_text(text, content_type), len(text))
+
+def _budget(seconds: Optional[float]) -> Optional[ExtractionBudget]:
+    return ExtractionBudget(seconds).start() if seconds is not None else None
+
+def _extract(text: str, include_private_ips: bool, excluded_networks: Optional[IPRangeSet],
+             context_size: int, budget_seconds: Optional[float] = None) -> Tuple[List[Dict], bool, Dict]:
+    """IOCs of text, whether budget_seconds ran out, and the timings of
+    the extraction as ScrapeTimings.to_dict's"""
+    budget = _budget(budget_seconds)
+    timings = ScrapeTimings()
+    iocs = _scraper.extractor.extract_iocs(
+        text, include_private_ips, excluded_networks, context_size, budget=budget, timings=timings
+    )
+    return iocs, budget is not None and budget.exhausted, timings.to_dict()
+
+def _extract_chunk(window: str, base: int, start: int, stop: int, include_private_ips: bool,
+                   excluded_networks: Optional[IPRangeSet], context_size: int,
+                   budget_seconds: Optional[float] = None) -> tuple:
+    """Scan window[start:stop], where window starts at offset base of the text.
+
+    Returns the first match start and the resume offset of every pattern,
+    for ExtractionPool._merge_chunks to check the chunk against the one
+    before it, the (pattern index, start, ioc) of the IOCs found, whether
+    budget_seconds ran out, and the timings as for _extract.
+    """
+    extractor = _scraper.extractor
+    budget = _budget(budget_seconds)
+    timings = ScrapeTimings()
+    next_start = [0] * len(extractor._pattern_types)
+    with timings.stage('extract'):
+        spans = extractor._scan(window, start, stop, next_start, budget=budget)
+    first_starts = [pattern_spans[0][0] + base if pattern_spans else None for pattern_spans in spans]
+    last_ends = [position + base for position in next_start]
+    with timings.stage('validate'):
+        iocs = list(extractor._build_indexed_iocs(
+            window, spans, include_private_ips, excluded_networks, set(), context_size, base, timings
+        ))
+    return first_starts, last_ends, iocs, budget is not None and budget.exhausted, timings.to_dict()
+
+class ExtractionPool:
+    """Parse HTML and extract IOCs in a pool of worker processes.
+
+    Both are CPU-bound and hold the GIL, so threads don't scale them. Each
+    worker builds one WebScraper, with its extractor, allowlists and
+    excluded networks, when it starts and keeps it for every document it
+    is sent. Documents go over as raw bytes and are decoded in the worker.
+
+    Texts of split_size characters or more are cut into chunks of about
+    chunk_size, each scanned by a worker with overlap characters of
+    lookahead, and the results are merged into the list a single scan
+    would return. Like IOCExtractor.iter_iocs, matches longer than the
+    overlap may be truncated.
+
+    Workers are started with start_method ('spawn' by default, as forking
+    a process that runs threads is unsafe) when the first document is
+    submitted; warm() starts all of them up front.
+    """
+
+    def __init__(self, workers: Optional[int] = None, split_size: int = 4 * 1024 * 1024,
+                 chunk_size: int = 1024 * 1024, overlap: int = 4096, start_method: str = 'spawn'):
+        self.workers = workers or os.cpu_count() or 1
+        self.split_size = split_size
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        # Builds results and merges chunks in the calling process
+        self.scraper = WebScraper()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(start_method),
+            initializer=_initialize
+        )
+
+    def warm(self):
+        """Start every worker and wait until each has built its scraper"""
+        wait([self._executor.submit(_ready) for _ in range(self.workers)])
+
+    def close(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, raw: bytes, content_type: str, encoding: Optional[str] = None,
+               include_private_ips: bool = False, content_digest: Optional[str] = None,
+               excluded_networks: Optional[IPRangeSet] = None, context_size: int = CONTEXT_SIZE,
+               keep_document: bool = False) -> Future:
+        """Process a body in one worker; the future resolves to the
+        WebScraper.process_content result. Use process for huge bodies."""
+        return self._executor.submit(
+            _process, raw, content_type, encoding, include_private_ips, content_digest,
+            excluded_networks, context_size, keep_document
+        )
+
+    def process(self, raw: bytes, content_type: str, encoding: Optional[str] = None,
+                include_private_ips: bool = False, content_digest: Optional[str] = None,
+                excluded_networks: Optional[IPRangeSet] = None, context_size: int = CONTEXT_SIZE,
+                keep_document: bool = False) -> Dict:
+        """WebScraper.process_content for a raw body, in the pool.
+
+        Bodies of split_size bytes or more are decoded (and for HTML
+        reduced to visible text) in one worker and extracted in all of them,
+        except structured feeds, which are parsed in one worker.
+        """
+        if len(raw) < self.split_size or self._is_feed(raw, content_type, encoding):
+            return self.submit(
+                raw, content_type, encoding, include_private_ips, content_digest,
+                excluded_networks, context_size, keep_document
+            ).result()
+
+        timings = ScrapeTimings()
+        with timings.stage('parse'):
+            text, content_type_used, content_length = self._executor.submit(
+                _analyze, raw, content_type, encoding
+            ).result()
+        return self.scraper.process_text(
+            text, content_type_used, content_length, include_private_ips, content_digest,
+            excluded_networks, context_size, keep_document, self.extract_iocs, timings
+        )
+
+    def _is_feed(self, raw: bytes, content_type: str, encoding: Optional[str]) -> bool:
+        """Whether a body is a structured feed, whose parser keeps state
+        from record to record"""
+        return self.scraper.feed_format(_decode(raw[:SNIFF_SIZE], encoding), content_type) is not None
+
+    def extract_iocs(self, text: str, include_private_ips: bool = False,
+                     excluded_networks: Optional[IPRangeSet] = None,
+                     context_size: int = CONTEXT_SIZE, budget: Optional[ExtractionBudget] = None,
+                     timings: Optional[ScrapeTimings] = None) -> List[Dict]:
+        """IOCExtractor.extract_iocs in the pool, split across workers if text is huge.
+
+        A budget is shared out evenly between the chunks of a split text,
+        so the workers together spend no more than its seconds. The stages
+        timed in the workers are added to timings.
+        """
+        timings = timings or ScrapeTimings()
+        if len(text) < self.split_size:
+            iocs, exhausted, report = self._executor.submit(
+                _extract, text, include_private_ips, excluded_networks, context_size,
+                budget.seconds if budget is not None else None
+            ).result()
+            if exhausted:
+                budget.exhausted = True
+            timings.merge(report)
+            return iocs
+
+        lookbehind = max(context_size, CONTEXT_SIZE) + 1
+        lookahead = self.overlap + lookbehind
+        bounds = self._chunk_bounds(text)
+        chunk_seconds = budget.seconds / len(bounds) if budget is not None else None
+        futures = [
+            self._executor.submit(
+                _extract_chunk, text[max(0, start - lookbehind):stop + lookahead], max(0, start - lookbehind),
+                min(start, lookbehind), min(start, lookbehind) + stop - start,
+                include_private_ips, excluded_networks, context_size, chunk_seconds
+            )
+            for start, stop in bounds
+        ]
+        return self._merge_chunks(
+            text, bounds, futures, include_private_ips, excluded_networks, context_size, budget, timings
+        )
+
+    def _chunk_bounds(self, text: str) -> List[Tuple[int, int]]:
+        """[start, stop) ranges of about chunk_size covering text.
+
+        Chunks end where a run of filename characters ends, so run
+        patterns, which are resolved from the last tail in their run, never
+        see part of a run.
+        """
+        bounds = []
+        start = 0
+        while start < len(text):
+            stop = min(len(text), start + self.chunk_size)
+            stop = RUN_CHARS.match(text, stop).end()
+            bounds.append((start, stop))
+            start = stop
+        return bounds
+
+    def _merge_chunks(self, text: str, bounds: List[Tuple[int, int]], futures: List[Future],
+                      include_private_ips: bool, excluded_networks: Optional[IPRangeSet],
+                      context_size: int, budget: Optional[ExtractionBudget] = None,
+                      timings: Optional[ScrapeTimings] = None) -> List[Dict]:
+        """Combine chunk results into the IOC list of a single scan.
+
+        A single scan doesn't let a pattern match again before the end of
+        its previous match. A chunk's worker starts afresh, so if it found a
+        pattern's first match inside a match crossing into the chunk from
+        the one before, the chunk is scanned again here, resuming where the
+        previous chunk left off. IOCs are then ordered by pattern and
+        position, and duplicates dropped, as in IOCExtractor._build_iocs.
+        If any chunk ran out of its share of budget, the budget is marked
+        exhausted and no chunk is rescanned. The chunks' timings and those
+        of rescans are added to timings; a rescanned chunk's matches count
+        twice.
+        """
+        timings = timings or ScrapeTimings()
+        extractor = self.scraper.extractor
+        run_patterns = extractor._run_patterns
+        carry = [0] * len(extractor._pattern_types)
+        indexed = []
+        for (start, stop), future in zip(bounds, futures):
+            first_starts, last_ends, iocs, exhausted, report = future.result()
+            timings.merge(report)
+            if exhausted:
+                budget.exhausted = True
+            rescan = any(first is not None and first < carry[index] and index not in run_patterns
+                         for index, first in enumerate(first_starts))
+            if rescan and (budget is None or not budget.exhausted):
+                logger.debug('Rescanning chunk at %d after a match crossing into it', start)
+                next_start = list(carry)
+                with timings.stage('extract'):
+                    spans = extractor._scan(text, start, stop, next_start)
+                with timings.stage('validate'):
+                    iocs = list(extractor._build_indexed_iocs(
+                        text, spans, include_private_ips, excluded_networks, set(), context_size, timings=timings
+                    ))
+                last_ends = next_start
+            carry = [max(previous, end) for previous, end in zip(carry, last_ends)]
+            indexed.extend(iocs)
+
+        indexed.sort(key=lambda item: (item[0], item[1]))
+        seen = set()
+        results = []
+        for _, _, ioc in indexed:
+            key = (ioc['type'], ioc['value'])
+            if key not in seen:
+                seen.add(key)
+                results.append(ioc)
+        return results
+
+# The pool shared by everything in this process, see extraction_pool_from_environment
+_shared_pool: Optional[ExtractionPool] = None
+
+def extraction_pool_from_environment() -> Optional[ExtractionPool]:
+    """A process-wide ExtractionPool with EXTRACTION_WORKERS workers, or
+    None when it is unset or 0"""
+    global _shared_pool
+    workers = int(os.environ.get('EXTRACTION_WORKERS', 0) or 0)
+    if workers <= 0:
+        return None
+    if _shared_pool is None:
+        _shared_pool = ExtractionPool(
+            workers, split_size=int(os.environ.get('EXTRACTION_SPLIT_SIZE', 4 * 1024 * 1024))
+        )
+        logger.info('Extraction pool with %d worker processes', workers)
+    return _shared_pool
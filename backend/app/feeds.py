@@ -0,0 +1,496 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.models import IOCType
+
+# Feed fields whose values are indicators of a known type. Field names are
+# compared lowercased with everything but letters and digits removed, so
+# 'SHA-256', 'sha_256' and 'sha256' are the same field.
+FIELD_TYPES = {
+    **dict.fromkeys(('ip', 'ipaddress', 'ipaddr', 'ipv4', 'ipv6', 'ipv4addr', 'ipv6addr', 'srcip', 'dstip',
+                     'sourceip', 'destinationip'), IOCType.IP_ADDRESS),
+    **dict.fromkeys(('domain', 'domainname', 'hostname', 'host', 'fqdn'), IOCType.DOMAIN),
+    **dict.fromkeys(('url', 'uri', 'link'), IOCType.URL),
+    **dict.fromkeys(('hash', 'filehash', 'md5', 'sha1', 'sha256', 'sha512', 'md5hash', 'sha1hash',
+                     'sha256hash'), IOCType.HASH),
+    **dict.fromkeys(('filename', 'file'), IOCType.FILENAME),
+    **dict.fromkeys(('asn', 'asnumber'), IOCType.ASN),
+}
+# Fields holding an indicator of any type. Values of these and of unknown
+# fields are taken whole if they are one indicator and scanned as text if
+# not; the names help recognize CSV headers.
+GENERIC_FIELDS = frozenset(('ioc', 'iocvalue', 'indicator', 'indicatorvalue', 'observable', 'value', 'data'))
+# Identifiers, timestamps and other bookkeeping never holding indicators;
+# so are fields ending in 'ref' or 'refs', references to STIX objects
+SKIPPED_FIELDS = frozenset((
+    'id', 'type', 'specversion', 'created', 'modified', 'validfrom', 'validuntil', 'firstseen', 'lastseen',
+    'dateadded', 'date', 'timestamp', 'patterntype', 'patternversion', 'lang', 'confidence', 'revoked',
+    'status', 'urlstatus', 'port', 'count', 'score',
+))
+# STIX 2.1 indicator patterns: [ipv4-addr:value = '198.51.100.1'],
+# [file:hashes.'SHA-256' = '...'] and so on, joined by AND and OR
+STIX_PATTERN = 'pattern'
+STIX_COMPARISON = re.compile(r"([a-z0-9-]+):([\w.'-]+)\s*=\s*'([^'\\]*)'", re.IGNORECASE)
+STIX_OBJECT_TYPES = {
+    'ipv4-addr': IOCType.IP_ADDRESS,
+    'ipv6-addr': IOCType.IP_ADDRESS,
+    'domain-name': IOCType.DOMAIN,
+    'url': IOCType.URL,
+}
+
+FEED_FORMATS = ('json', 'csv', 'list')
+CSV_DELIMITERS = (',', ';', '\t', '|')
+# How much of a body is looked at to recognize a feed
+SNIFF_SIZE = 64 * 1024
+# Feeds repeat the same tags, malware names and descriptions; the text
+# scans of fields up to this long are cached
+CACHED_TEXT_SIZE = 1024
+TEXT_CACHE_ENTRIES = 8192
+
+# A JSON string, and whether it is an object key
+JSON_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"(\s*:)?')
+# The rest of a JSON string cut by a window boundary
+JSON_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"')
+
+
+def _is_word(character: str) -> bool:
+    """Whether a character is one \\w matches"""
+    return character.isalnum() or character == '_'
+
+
+def field_name(name: str) -> str:
+    """A field name as looked up in FIELD_TYPES, GENERIC_FIELDS and SKIPPED_FIELDS"""
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def peek(chunks: Iterable[str], size: int = SNIFF_SIZE) -> Tuple[str, Iterator[str]]:
+    """The first size or so characters of a chunk stream, and the whole stream"""
+    chunks = iter(chunks)
+    head = []
+    length = 0
+    for chunk in chunks:
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return ''.join(head), chain(head, chunks)
+
+
+class FeedParser:
+    """Typed spans for structured feeds: JSON (STIX 2.1 bundles and NDJSON
+    included), CSV and plain lists of indicators, one per line.
+
+    A text scan tries every pattern at every word boundary of a feed that
+    mostly consists of bare indicators. Here values are taken from the
+    fields holding them and matched whole against the patterns of their
+    field's type, or against all of them for other fields and list lines;
+    only values that aren't one indicator, like descriptions, are scanned
+    as text. The spans go through the extractor's validation,
+    deduplication, scoring and context like scanned ones, and contexts are
+    cut from the feed text as usual.
+    """
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        branches = {}
+        for index, (ioc_type, pattern) in enumerate(
+                (ioc_type, pattern) for ioc_type, patterns in extractor.patterns.items() for pattern in patterns):
+            if index in extractor._run_patterns:
+                # A value is one token: filenames with spaces are left to the text scan
+                pattern = pattern.replace(r'[\w\-. ]+', r'[\w\-.]+', 1)
+            branches.setdefault(ioc_type, []).append(f'(?P<p{index}>{pattern})')
+        self._group_indexes = {f'p{index}': index for index in range(len(extractor._pattern_types))}
+        values = '|'.join(branch for type_branches in branches.values() for branch in type_branches)
+        # Values are matched in pattern order; the first pattern matching
+        # the whole value gives its type
+        self._value = re.compile(f'(?:{values})', re.IGNORECASE)
+        self._typed_values = {
+            ioc_type: re.compile('(?:' + '|'.join(type_branches) + ')', re.IGNORECASE)
+            for ioc_type, type_branches in branches.items()
+        }
+        # A list line holding one value, with any blank lines before it
+        self._line = re.compile(rf'^(?:[ \t]*\r?\n)*[ \t]*(?:{values})[ \t]*\r?(?:\n|\Z)',
+                                re.IGNORECASE | re.MULTILINE)
+        # Domains with a file extension for a TLD (evil.com, dropper.zip)
+        # are filenames too, as in a text scan
+        self._domain_indexes = {index for index, ioc_type in enumerate(extractor._pattern_types)
+                                if ioc_type == IOCType.DOMAIN}
+        self._filename_index = extractor._pattern_types.index(IOCType.FILENAME)
+        self._filename = self._typed_values[IOCType.FILENAME]
+        self._field_names = {}
+        self._text_spans = lru_cache(maxsize=TEXT_CACHE_ENTRIES)(self._scan_field)
+
+    def detect(self, text: str, content_type: str = '') -> Optional[str]:
+        """The feed format of a body from its content type and first
+        characters, or None to scan it as text"""
+        content_type = content_type.lower()
+        if 'html' in content_type or 'xml' in content_type:
+            return None
+        head = text[:SNIFF_SIZE].lstrip('﻿ \t\r\n')
+        if head[:1] in ('{', '[') and ('json' in content_type or JSON_TOKEN.search(head)):
+            return 'json'
+        if 'json' in content_type:
+            return None
+
+        lines = head.splitlines()
+        if len(head) == SNIFF_SIZE and len(lines) > 1:
+            # The last line may be cut
+            lines.pop()
+        if 'csv' in content_type or self._csv_header(lines) is not None:
+            return 'csv'
+
+        values = [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+        if values and sum(self._value.fullmatch(value) is not None for value in values) * 2 >= len(values):
+            return 'list'
+        return None
+
+    def scanner(self, feed_format: str) -> 'FeedScanner':
+        """A scanner for one document of a feed_format from detect"""
+        if feed_format == 'json':
+            return JsonScanner(self)
+        if feed_format == 'csv':
+            return CsvScanner(self)
+        if feed_format == 'list':
+            return ListScanner(self)
+        raise ValueError(f'Unknown feed format: {feed_format}')
+
+    def field(self, name: str) -> str:
+        """field_name, cached: feeds repeat the same few names"""
+        normalized = self._field_names.get(name)
+        if normalized is None:
+            normalized = self._field_names[name] = field_name(name)
+        return normalized
+
+    def _csv_header(self, lines: List[str]) -> Optional[Tuple[int, str]]:
+        """(line number, delimiter) of a CSV header among the first lines.
+
+        Comment lines are headers too (abuse.ch feeds comment theirs out);
+        a header has at least two cells and names a known field.
+        """
+        for number, line in enumerate(lines[:20]):
+            cells_line = line.lstrip('# \t')
+            delimiter = max(CSV_DELIMITERS, key=cells_line.count)
+            cells = cells_line.split(delimiter)
+            if len(cells) >= 2 and any(self._is_known_field(cell) for cell in cells):
+                return number, delimiter
+        return None
+
+    def _is_known_field(self, cell: str) -> bool:
+        name = self.field(cell.strip(' \t\r"'))
+        return name in FIELD_TYPES or name in GENERIC_FIELDS or name in SKIPPED_FIELDS
+
+    def add_value(self, text: str, start: int, end: int, spans: List[list], next_start: List[int],
+                  ioc_type: Optional[IOCType] = None):
+        """Add the span of the indicator text[start:end], of ioc_type if
+        given; a value that isn't one indicator is scanned as text"""
+        match = None
+        if ioc_type is not None:
+            match = self._typed_values[ioc_type].fullmatch(text, start, end)
+        if match is None:
+            match = self._value.fullmatch(text, start, end)
+            if match is None:
+                self.add_text(text, start, end, spans, next_start)
+                return
+            ioc_type = None
+        index = self._group_indexes[match.lastgroup]
+        spans[index].append((start, end))
+        if ioc_type is None and index in self._domain_indexes and self._filename.fullmatch(text, start, end):
+            spans[self._filename_index].append((start, end))
+
+    def add_text(self, text: str, start: int, stop: int, spans: List[list], next_start: List[int],
+                 bounded: bool = True):
+        """Scan text[start:stop] as free text and add its spans. Unless
+        bounded, matches starting before stop may run on past it, as with
+        a line or string cut by a window boundary."""
+        if start >= stop:
+            return
+        if bounded and stop - start <= CACHED_TEXT_SIZE and (start == 0 or not _is_word(text[start - 1])):
+            # Scanned on its own, a field starting after a delimiter gives the
+            # same matches wherever it is; earlier fields end before it, so
+            # next_start doesn't come into it
+            for index, match_start, match_end in self._text_spans(text[start:stop]):
+                spans[index].append((start + match_start, start + match_end))
+            return
+        end = stop if bounded else len(text)
+        if not self.extractor._may_match(text, start, end):
+            return
+        found = self.extractor._scan(text, start, stop, next_start, end if bounded else None)
+        for pattern_spans, pattern_found in zip(spans, found):
+            pattern_spans.extend(pattern_found)
+
+    def _scan_field(self, value: str) -> tuple:
+        """(pattern index, start, end) of the matches in a field's text"""
+        if not self.extractor._may_match(value):
+            return ()
+        return tuple((index, start, end) for index, pattern_spans in enumerate(self.extractor._scan(value))
+                     for start, end in pattern_spans)
+
+
+class FeedScanner(ABC):
+    """Scans one feed document for IOCExtractor.extract_iocs and iter_iocs.
+
+    scan() returns the per-pattern spans of the records in text[start:stop],
+    like IOCExtractor._scan; window_stop() picks where a streamed window
+    ends so that records aren't split. Scanners keep state between the
+    windows of a document, such as a CSV header or the current JSON key.
+    """
+
+    def __init__(self, parser: FeedParser):
+        self.parser = parser
+
+    @abstractmethod
+    def scan(self, text: str, start: int, stop: int, next_start: List[int]) -> List[list]:
+        """Per-pattern spans of the records in text[start:stop]"""
+
+    def window_stop(self, text: str, start: int, stop: int) -> int:
+        """After the last complete line before stop"""
+        newline = text.rfind('\n', start, stop)
+        return newline + 1 if newline >= start else stop
+
+
+class LineScanner(FeedScanner):
+    """A FeedScanner for line-based formats.
+
+    Only a line longer than a window is split; its pieces are scanned as
+    free text.
+    """
+
+    def __init__(self, parser: FeedParser):
+        super().__init__(parser)
+        self._in_line = False
+
+    def scan(self, text: str, start: int, stop: int, next_start: List[int]) -> List[list]:
+        spans = [[] for _ in self.parser.extractor._pattern_types]
+        if self._in_line:
+            # The rest of a split line
+            newline = text.find('\n', start, stop)
+            line_end = newline + 1 if newline >= 0 else stop
+            self.parser.add_text(text, start, line_end, spans, next_start, bounded=newline >= 0)
+            start = line_end
+            self._in_line = newline < 0
+        if start < stop and stop < len(text) and text[stop - 1] != '\n':
+            line_start = max(start, text.rfind('\n', start, stop) + 1)
+            if line_start > start:
+                self._scan_lines(text, start, line_start, spans, next_start)
+            self.parser.add_text(text, line_start, stop, spans, next_start, bounded=False)
+            self._in_line = True
+        elif start < stop:
+            self._scan_lines(text, start, stop, spans, next_start)
+        return spans
+
+    @abstractmethod
+    def _scan_lines(self, text: str, start: int, stop: int, spans: List[list], next_start: List[int]):
+        """Add the spans of the whole lines in text[start:stop] to spans"""
+
+
+class ListScanner(LineScanner):
+    """Plain lists: lines holding one indicator are taken whole, every
+    other line (comments, hosts file entries, ...) is scanned as text"""
+
+    def _scan_lines(self, text: str, start: int, stop: int, spans: List[list], next_start: List[int]):
+        parser = self.parser
+        group_indexes = parser._group_indexes
+        domain_indexes = parser._domain_indexes
+        position = start
+        for match in parser._line.finditer(text, start, stop):
+            if match.start() > position:
+                parser.add_text(text, position, match.start(), spans, next_start)
+            group = match.lastgroup
+            index = group_indexes[group]
+            value_span = match.span(group)
+            spans[index].append(value_span)
+            if index in domain_indexes and parser._filename.fullmatch(text, *value_span):
+                spans[parser._filename_index].append(value_span)
+            position = match.end()
+        if position < stop:
+            parser.add_text(text, position, stop, spans, next_start)
+
+
+class CsvScanner(LineScanner):
+    """CSV: cells are taken as values of the field named by their column's
+    header, if there is one, and bookkeeping columns skipped. Quoted cells
+    may not span lines."""
+
+    def __init__(self, parser: FeedParser):
+        super().__init__(parser)
+        self._columns = None
+        self._cell = None
+
+    def _start(self, text: str, start: int, stop: int) -> Tuple[int, int]:
+        """Find the header and delimiter in the first lines; returns where
+        the header and the rows start"""
+        lines = text[start:min(stop, start + SNIFF_SIZE)].split('\n')
+        header = self.parser._csv_header(lines)
+        if header is None:
+            number = 0
+            delimiter = max(CSV_DELIMITERS, key=lines[0].count)
+            self._columns = []
+        else:
+            number, delimiter = header
+            self._columns = [self._column(cell) for cell in lines[number].lstrip('# \t').split(delimiter)]
+        d = re.escape(delimiter)
+        space = '[ ]*' if delimiter == '\t' else '[ \t]*'
+        self._cell = re.compile(rf'{space}(?:"((?:[^"]|"")*)"|([^{d}"\r\n]*?)){space}(?:{d}|\r?\n|\r?\Z)')
+        header_start = start + sum(len(line) + 1 for line in lines[:number])
+        if header is None:
+            return header_start, header_start
+        return header_start, min(stop, header_start + len(lines[number]) + 1)
+
+    def _column(self, cell: str):
+        """The IOCType of a column, None for any or False if skipped"""
+        name = self.parser.field(cell.strip(' \t\r\n"'))
+        if name in SKIPPED_FIELDS:
+            return False
+        return FIELD_TYPES.get(name)
+
+    def _scan_lines(self, text: str, start: int, stop: int, spans: List[list], next_start: List[int]):
+        parser = self.parser
+        if self._columns is None:
+            header_start, rows_start = self._start(text, start, stop)
+            # Comments before the header
+            parser.add_text(text, start, header_start, spans, next_start)
+            start = rows_start
+        columns = self._columns
+        cell = self._cell
+        position = start
+        while position < stop:
+            line_end = text.find('\n', position, stop)
+            line_end = stop if line_end < 0 else line_end + 1
+            if text.startswith('#', position):
+                parser.add_text(text, position, line_end, spans, next_start)
+                position = line_end
+                continue
+            column = 0
+            while position < line_end:
+                match = cell.match(text, position, line_end)
+                if match is None or match.end() == position:
+                    # Malformed quoting: scan the rest of the line
+                    parser.add_text(text, position, line_end, spans, next_start)
+                    break
+                ioc_type = columns[column] if column < len(columns) else None
+                group = 1 if match.start(1) >= 0 else 2
+                value_start, value_end = match.span(group)
+                if ioc_type is not False and value_start < value_end:
+                    if group == 1 and text.find('""', value_start, value_end) >= 0:
+                        parser.add_text(text, value_start, value_end, spans, next_start)
+                    else:
+                        parser.add_value(text, value_start, value_end, spans, next_start, ioc_type)
+                position = match.end()
+                column += 1
+            position = line_end
+
+
+class JsonScanner(FeedScanner):
+    """JSON documents and NDJSON, STIX 2.1 bundles included.
+
+    Strings are read with one regular expression instead of a parser: a
+    string followed by ':' is a key, and applies to the strings after it up
+    to the next key. STIX patterns are read comparison by comparison.
+    Numbers, and strings with escapes, which don't appear verbatim in the
+    feed, are never taken as indicators; the latter are scanned as text.
+    So is a string longer than a streamed window, in pieces.
+    """
+
+    def __init__(self, parser: FeedParser):
+        super().__init__(parser)
+        self._field = None
+        self._in_string = False
+        self._window = None
+
+    def window_stop(self, text: str, start: int, stop: int) -> int:
+        """After the last whole string before stop, or at stop if a string
+        fills the window"""
+        position = start
+        if self._in_string:
+            rest = JSON_STRING_REST.match(text, start, stop)
+            if rest is None:
+                return self._cut(text, start, stop)
+            position = rest.end()
+        tokens = list(JSON_TOKEN.finditer(text, position, stop))
+        if len(tokens) > 1 and tokens[-1].group(2) is None:
+            # A key may still be waiting for its ':'
+            tokens.pop()
+        if tokens:
+            window_stop = tokens[-1].end()
+        elif position > start:
+            window_stop = position
+        else:
+            window_stop = self._cut(text, start, stop)
+        self._window = (start, window_stop, tokens)
+        return window_stop
+
+    def _cut(self, text: str, start: int, stop: int) -> int:
+        """stop, moved before any backslashes so an escape isn't split"""
+        while stop > start + 1 and text[stop - 1] == '\\':
+            stop -= 1
+        return stop
+
+    def scan(self, text: str, start: int, stop: int, next_start: List[int]) -> List[list]:
+        parser = self.parser
+        spans = [[] for _ in parser.extractor._pattern_types]
+        position = start
+        if self._in_string:
+            rest = JSON_STRING_REST.match(text, start, stop)
+            if rest is None:
+                parser.add_text(text, start, stop, spans, next_start, bounded=False)
+                return spans
+            parser.add_text(text, start, rest.end() - 1, spans, next_start)
+            position = rest.end()
+            self._in_string = False
+
+        if self._window is not None and self._window[:2] == (start, stop):
+            tokens = self._window[2]
+        else:
+            tokens = JSON_TOKEN.finditer(text, position, stop)
+        self._window = None
+        for token in tokens:
+            value_start, value_end = token.span(1)
+            if token.group(2) is not None:
+                self._field = parser.field(token.group(1))
+            else:
+                self._add_string(text, value_start, value_end, spans, next_start)
+            position = token.end()
+
+        # A string running on into the next window
+        quote = text.find('"', position, stop)
+        if quote >= 0:
+            parser.add_text(text, quote + 1, stop, spans, next_start, bounded=False)
+            self._in_string = True
+        return spans
+
+    def _add_string(self, text: str, start: int, end: int, spans: List[list], next_start: List[int]):
+        field = self._field
+        parser = self.parser
+        if start == end or field in SKIPPED_FIELDS or (field and field.endswith(('ref', 'refs'))):
+            return
+        if text.find('\\', start, end) >= 0:
+            parser.add_text(text, start, end, spans, next_start)
+        elif field == STIX_PATTERN:
+            self._add_pattern(text, start, end, spans, next_start)
+        else:
+            parser.add_value(text, start, end, spans, next_start, FIELD_TYPES.get(field))
+
+    def _add_pattern(self, text: str, start: int, end: int, spans: List[list], next_start: List[int]):
+        """Values of the comparisons of a STIX pattern; the rest of the
+        pattern is scanned as text"""
+        parser = self.parser
+        position = start
+        for comparison in STIX_COMPARISON.finditer(text, start, end):
+            object_type = comparison.group(1).lower()
+            path = comparison.group(2).lower()
+            if object_type == 'file':
+                ioc_type = (IOCType.HASH if path.startswith('hashes') else
+                            IOCType.FILENAME if path == 'name' else None)
+            else:
+                ioc_type = STIX_OBJECT_TYPES.get(object_type) if path == 'value' else None
+            if ioc_type is None:
+                continue
+            parser.add_text(text, position, comparison.start(), spans, next_start)
+            value_start, value_end = comparison.span(3)
+            if value_start < value_end:
+                parser.add_value(text, value_start, value_end, spans, next_start, ioc_type)
+            position = comparison.end()
+        parser.add_text(text, position, end, spans, next_start)
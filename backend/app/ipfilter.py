@@ -0,0 +1,106 @@
+import ipaddress
+import logging
+import os
+import socket
+from bisect import bisect_right
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# (version, integer value) of a parsed address
+Address = Tuple[int, int]
+Network = Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+PRIVATE_NETWORKS = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '127.0.0.0/8')
+
+def parse_ip(value: str) -> Optional[Address]:
+    """(version, integer) for an IP address string, or None if it isn't one.
+
+    Dotted quads are converted by inet_pton, which takes them by the same
+    rules as ipaddress (ASCII digits, at most 255, no leading zeros);
+    anything else goes through ipaddress.ip_address.
+    """
+    if value.count('.') == 3:
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+        except (OSError, ValueError):
+            pass
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return address.version, int(address)
+
+class IPRangeSet:
+    """A set of IPv4 and IPv6 networks, held as merged integer intervals.
+
+    Membership is a binary search over the interval starts for the
+    address's version, O(log n) whatever the number of networks, and an
+    address parsed once with parse_ip can be checked against several sets.
+    Raises ValueError for networks that can't be parsed; host bits are
+    ignored ('10.1.2.3/8' is 10.0.0.0/8).
+    """
+
+    def __init__(self, networks: Iterable[Network] = ()):
+        intervals = {4: [], 6: []}
+        for network in networks:
+            if isinstance(network, str):
+                network = ipaddress.ip_network(network.strip(), strict=False)
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._starts = {}
+        self._ends = {}
+        for version, ranges in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(ranges):
+                # Merge overlapping and adjacent networks
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[version] = starts
+            self._ends[version] = ends
+
+    def contains(self, address: Address) -> bool:
+        """Whether a parse_ip result falls in one of the networks"""
+        version, number = address
+        index = bisect_right(self._starts[version], number) - 1
+        return index >= 0 and number <= self._ends[version][index]
+
+    def __contains__(self, value: str) -> bool:
+        address = parse_ip(value)
+        return address is not None and self.contains(address)
+
+    def __len__(self) -> int:
+        """Number of disjoint address ranges"""
+        return len(self._starts[4]) + len(self._starts[6])
+
+def read_networks(path: str) -> Iterator[str]:
+    """Networks from a file, one per line: plain CIDR lists, '#' comments,
+    or ';' annotated lists such as Spamhaus DROP (network ; SBL id)"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.split('#', 1)[0].split(';', 1)[0].strip()
+            if line:
+                yield line.split()[0]
+
+def load_networks(paths: Sequence[str]) -> IPRangeSet:
+    """An IPRangeSet of the networks in the files; bad lines are skipped"""
+    networks = []
+    for path in paths:
+        for line in read_networks(path):
+            try:
+                networks.append(ipaddress.ip_network(line, strict=False))
+            except ValueError:
+                logger.warning('Ignoring invalid network %r in %s', line, path)
+    ranges = IPRangeSet(networks)
+    logger.info('Loaded %d excluded networks from %s', len(networks), ', '.join(paths))
+    return ranges
+
+def excluded_networks_from_environment() -> Optional[IPRangeSet]:
+    """Networks to exclude from results, from the files in EXCLUDED_NETWORK_FILES"""
+    paths = [path for path in os.environ.get('EXCLUDED_NETWORK_FILES', '').split(os.pathsep) if path]
+    if not paths:
+        return None
+    return load_networks(paths)
@@ -0,0 +1,317 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import or_, select, update
+
+logger = logging.getLogger(__name__)
+
+# Session statuses of queued and running jobs; the rest are final
+ACTIVE_STATUSES = ('pending', 'running')
+
+class JobQueue:
+    """Run scrapes queued in the scrape_jobs table on a pool of worker threads.
+
+    The scrape endpoints only insert a pending ScrapeSession and its job row
+    and return. Any process running workers (run.py in-process, or worker.py)
+    claims jobs with one UPDATE of the rows picked by a
+    SELECT ... FOR UPDATE SKIP LOCKED subquery, so on PostgreSQL concurrent
+    workers never wait on each other's rows; SQLite has no row locks but
+    runs the statement as one serialized write. The job row is deleted in
+    the transaction that stores the session's result. A job whose worker
+    died is claimed again once its lock is older than JOB_LEASE seconds, up
+    to JOB_MAX_ATTEMPTS times.
+
+    Jobs queued together by enqueue_batch are claimed up to JOB_BATCH_SIZE
+    at a time, fetched concurrently by an AsyncWebScraper with at most
+    JOB_BATCH_PER_HOST connections per host, and stored in one transaction
+    per group of results that arrive together.
+
+    Enqueueing wakes this process's workers at once; jobs queued by other
+    processes are picked up within JOB_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.scraper = None
+        self.async_scraper = None
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Semaphore(0)
+        self._stopping = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS_ENABLED', True)
+        app.config.setdefault('JOB_WORKERS', 4)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_LEASE', 600)
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 3)
+        app.config.setdefault('JOB_BATCH_SIZE', 50)
+        app.config.setdefault('JOB_BATCH_PER_HOST', 4)
+        app.config.setdefault('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ioc-scraper-profiles'))
+        app.extensions['job_queue'] = self
+        self.app = app
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    # Enqueueing, from request handlers
+
+    def enqueue(self, url: Optional[str] = None, source=None, **options):
+        """Queue a scrape of url, or of a configured source, and commit;
+        returns its pending ScrapeSession.
+
+        options are passed to services.run_scrape when the job runs:
+        include_private_ips, exclude_networks (a list of CIDR strings) and
+        context_size. With profile, an app.profiling profiler, the scrape
+        is profiled and the report saved in PROFILE_DIR.
+        """
+        return self.enqueue_batch([(url, source)], batch=False, **options)[0]
+
+    def enqueue_batch(self, targets: Sequence[tuple], batch: bool = True, **options) -> List:
+        """Queue scrapes of (url, source) targets, one of the two set, in one
+        transaction; returns their pending ScrapeSessions in order.
+
+        The sessions and jobs share a new batch_id unless batch is False.
+        options are as for enqueue and apply to every target.
+        """
+        from app import db
+        from app.models import ScrapeJob, ScrapeSession
+
+        batch_id = uuid.uuid4().hex if batch else None
+        sessions = [
+            ScrapeSession(source_url_id=source.id if source is not None else None,
+                          url=source.url if source is not None else url, batch_id=batch_id, status='pending')
+            for url, source in targets
+        ]
+        db.session.add_all(sessions)
+        db.session.flush()
+        db.session.add_all([
+            ScrapeJob(scrape_session_id=session.id, url=url, batch_id=batch_id, options=options)
+            for session, (url, _) in zip(sessions, targets)
+        ])
+        db.session.commit()
+        for _ in range(min(len(sessions), self.app.config['JOB_WORKERS'])):
+            self._wakeup.release()
+        return sessions
+
+    # Workers
+
+    def start(self):
+        """Start the worker threads"""
+        if self.running:
+            return
+        from app.async_scraper import AsyncWebScraper
+        from app.extraction_pool import extraction_pool_from_environment
+        from app.scrapers import WebScraper, shared_extractor
+
+        config = self.app.config
+        self.workers = config['JOB_WORKERS']
+        self.poll_interval = config['JOB_POLL_INTERVAL']
+        self.lease = config['JOB_LEASE']
+        self.max_attempts = config['JOB_MAX_ATTEMPTS']
+        self.batch_size = config['JOB_BATCH_SIZE']
+        self.scraper = WebScraper(pool=extraction_pool_from_environment(), extractor=shared_extractor())
+        self.async_scraper = AsyncWebScraper(
+            self.scraper, concurrency=self.batch_size, per_host=config['JOB_BATCH_PER_HOST'], pool=self.scraper.pool
+        )
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f'scrape-job-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info('Job queue started with %d workers', self.workers)
+
+    def stop(self):
+        """Stop the workers after the jobs they are running"""
+        self._stopping = True
+        for _ in self._threads:
+            self._wakeup.release()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run_forever(self):
+        """Start the workers and block, for use as a standalone service"""
+        self.start()
+        try:
+            while self.running:
+                self._threads[0].join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    # Internals
+
+    def _work(self):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+        while not self._stopping:
+            job_ids = []
+            try:
+                with self.app.app_context():
+                    job_ids = self._claim(worker)
+                    if len(job_ids) > 1:
+                        self._run_batch(job_ids)
+                    elif job_ids:
+                        self._run(job_ids[0])
+            except Exception:
+                logger.exception('Scrape jobs %s failed', job_ids)
+            if not job_ids:
+                self._wakeup.acquire(timeout=self.poll_interval)
+
+    def _claim(self, worker: str) -> List[int]:
+        """Lock the oldest claimable job for this worker, and more jobs of
+        its batch if it has one; returns their ids"""
+        from app import db
+        from app.models import ScrapeJob
+
+        now = datetime.utcnow()
+        claimable = or_(ScrapeJob.locked_at.is_(None), ScrapeJob.locked_at < now - timedelta(seconds=self.lease))
+
+        def claim(limit, *conditions):
+            rows = select(ScrapeJob.id).where(claimable, *conditions).order_by(ScrapeJob.id).limit(limit)
+            return db.session.execute(
+                update(ScrapeJob)
+                .where(ScrapeJob.id.in_(rows.with_for_update(skip_locked=True).scalar_subquery()), claimable)
+                .values(locked_by=worker, locked_at=now, attempts=ScrapeJob.attempts + 1)
+                .returning(ScrapeJob.id, ScrapeJob.batch_id)
+            ).all()
+
+        claimed = claim(1)
+        if claimed and claimed[0].batch_id is not None and self.batch_size > 1:
+            claimed += claim(self.batch_size - 1, ScrapeJob.batch_id == claimed[0].batch_id)
+        db.session.commit()
+        return sorted(row.id for row in claimed)
+
+    def _start(self, job_ids: List[int]) -> List[tuple]:
+        """Mark the claimed jobs' sessions running and commit; returns
+        (job, session) of those still to run"""
+        from app import db, services
+        from app.models import ScrapeJob, ScrapeSession
+
+        jobs = ScrapeJob.query.filter(ScrapeJob.id.in_(job_ids)).order_by(ScrapeJob.id).all()
+        sessions = {session.id: session for session in ScrapeSession.query.filter(
+            ScrapeSession.id.in_([job.scrape_session_id for job in jobs]))}
+        runnable = []
+        running_at = datetime.utcnow()
+        for job in jobs:
+            session = sessions.get(job.scrape_session_id)
+            if session is None or session.status not in ACTIVE_STATUSES:
+                # Deleted with its source, or finished by a worker that died before deleting the job
+                db.session.delete(job)
+            elif session.source_url is not None and session.source_url.deleted_at is not None:
+                # Left for app.retention to purge with its source
+                services.record_scrape_result(session, {'success': False, 'error': 'Source deleted'})
+                db.session.delete(job)
+            elif job.attempts > self.max_attempts:
+                services.record_scrape_result(session, {
+                    'success': False, 'error': f'Scrape abandoned after {job.attempts - 1} interrupted attempts'
+                })
+                db.session.delete(job)
+            else:
+                session.status = 'running'
+                session.running_at = running_at
+                runnable.append((job, session))
+        db.session.commit()
+        return runnable
+
+    def _finished(self, sessions: List):
+        from app import metrics, scheduler, stats
+
+        if any(session.iocs_found for session in sessions):
+            stats.invalidate_ioc_stats()
+        for session in sessions:
+            metrics.observe_scrape(session)
+            if session.source_url is not None:
+                scheduler.source_changed(session.source_url)
+
+    def _run(self, job_id: int):
+        from app import db, metrics, profiling, services
+        from app.ipfilter import IPRangeSet
+        from app.models import ScrapeJob
+
+        for job, session in self._start([job_id]):
+            source = session.source_url
+            options: Dict = dict(job.options or {})
+            networks = options.pop('exclude_networks', None)
+            profiler = options.pop('profile', None)
+            profile = None
+            if profiler:
+                try:
+                    profile = profiling.Profile(profiler).start()
+                except ValueError:
+                    logger.warning('Profiler %s is not installed here; session %d is not profiled', profiler, session.id)
+            try:
+                services.run_scrape(
+                    self.scraper, session, source.url if source is not None else job.url, source=source,
+                    excluded_networks=IPRangeSet(networks) if networks else None, **options
+                )
+                db.session.delete(job)
+                db.session.commit()
+            except Exception as e:
+                logger.exception('Scrape of session %d failed', session.id)
+                services.fail_session(session, e)
+                ScrapeJob.query.filter(ScrapeJob.id == job_id).delete(synchronize_session=False)
+                db.session.commit()
+                metrics.observe_scrape(session)
+                return
+            finally:
+                if profile is not None:
+                    path = profiling.save_session_profile(self.app.config['PROFILE_DIR'], session.id, profile.report())
+                    logger.info('Profile of session %d saved to %s', session.id, path)
+            self._finished([session])
+
+    def _run_batch(self, job_ids: List[int]):
+        from app import db, services
+        from app.ipfilter import IPRangeSet
+
+        runnable = self._start(job_ids)
+        if not runnable:
+            return
+        started = time.monotonic()
+        # A batch's jobs share their options
+        options: Dict = dict(runnable[0][0].options or {})
+        networks = options.pop('exclude_networks', None)
+        context_size, keep_document = services.scrape_options(options.get('context_size'))
+        targets = []
+        for job, session in runnable:
+            source = session.source_url
+            targets.append((source.url, source.validators()) if source is not None else (job.url, None))
+
+        for group in self.async_scraper.scrape_as_completed(
+                targets, options.get('include_private_ips', False),
+                IPRangeSet(networks) if networks else None, context_size, keep_document):
+            finished = [(runnable[index], result) for index, result in group]
+            try:
+                for (job, session), result in finished:
+                    # A copy, since storing takes the document out of the result
+                    services.store_scrape_result(session, dict(result), session.source_url)
+                    db.session.delete(job)
+                db.session.commit()
+            except Exception:
+                # e.g. a deadlock with another batch; store them one by one
+                logger.exception('Storing %d results of batch %s failed', len(finished), job_ids)
+                db.session.rollback()
+                for (job, session), result in finished:
+                    try:
+                        services.store_scrape_result(session, dict(result), session.source_url)
+                        db.session.delete(job)
+                        db.session.commit()
+                    except Exception as e:
+                        services.fail_session(session, e)
+                        db.session.delete(job)
+                        db.session.commit()
+            self._finished([session for (_, session), _ in finished])
+
+        elapsed = time.monotonic() - started
+        logger.info('Scraped %d URLs of batch %s in %.1fs (%.1f/s)',
+                    len(runnable), runnable[0][1].batch_id, elapsed, len(runnable) / elapsed)
@@ -0,0 +1,165 @@
+"""Prometheus metrics of this process, in the text exposition format.
+
+Histograms of the time each scrape spent per stage and of the bytes it
+fetched, counters of scrapes, matches and rejected matches, and a
+histogram of API request times. They are written out here rather than
+with prometheus_client, as a few counters under a lock is all they need.
+Every process keeps its own: /api/metrics reports the scrapes of the job
+workers and scheduler running in the API's process (run.py), and
+worker.py serves its own with METRICS_PORT set. Prometheus sums them
+across processes.
+"""
+import bisect
+import logging
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from app.scrapers import SCRAPE_STAGES
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Bucket upper bounds: seconds from a millisecond to a minute, and bytes
+# from 1 KiB to 1 GiB by powers of 4
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(11))
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+class Metric(ABC):
+    """A named metric with a value per combination of its label values"""
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            yield from self._samples(key, value)
+
+    @abstractmethod
+    def _samples(self, key: Tuple[str, ...], value) -> Iterator[str]:
+        """Exposition lines of the series of label values key"""
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets of upper bounds buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # A bucket counts the values up to and including its bound
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self, key, value):
+        counts, total = value
+        names = self.labels + ('le',)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f'{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}'
+        labels = _format_labels(self.labels, key)
+        yield f'{self.name}_sum{labels} {_format_value(total)}'
+        yield f'{self.name}_count{labels} {cumulative}'
+
+REGISTRY: List[Metric] = []
+
+scrape_stage_seconds = Histogram(
+    'ioc_scrape_stage_seconds', 'Seconds a scrape spent in a stage.', SECONDS_BUCKETS, ('stage',)
+)
+scrape_bytes = Histogram('ioc_scrape_bytes', 'Response body bytes fetched by a scrape.', BYTES_BUCKETS)
+scrapes = Counter('ioc_scrapes_total', 'Finished scrapes by final status.', ('status',))
+scrape_matches = Counter('ioc_scrape_matches_total', 'Spans the IOC extraction found.')
+scrape_rejected = Counter('ioc_scrape_rejected_total', 'Spans that failed IOC validation.')
+request_seconds = Histogram(
+    'ioc_http_request_seconds', 'Seconds the API took to return a response, before streaming its body.',
+    SECONDS_BUCKETS, ('endpoint', 'method', 'status')
+)
+
+def observe_scrape(session):
+    """Count a finished ScrapeSession"""
+    scrapes.inc(status=session.status)
+    for stage in SCRAPE_STAGES:
+        seconds = getattr(session, f'{stage}_seconds')
+        if seconds is not None:
+            scrape_stage_seconds.observe(seconds, stage=stage)
+    if session.bytes_fetched is not None:
+        scrape_bytes.observe(session.bytes_fetched)
+    if session.matches:
+        scrape_matches.inc(session.matches)
+    if session.rejected:
+        scrape_rejected.inc(session.rejected)
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float):
+    request_seconds.observe(seconds, endpoint=endpoint or 'unknown', method=method, status=status)
+
+def render() -> str:
+    """Every metric in the text exposition format"""
+    return ''.join(f'{line}\n' for metric in REGISTRY for line in metric.render())
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+def serve(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve /metrics on port from a background thread, for processes
+    without the API such as worker.py"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info('Serving metrics on port %d', port)
+    return server
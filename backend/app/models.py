@@ -1,7 +1,12 @@
 from app import db
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Enum as SQLEnum
+from sqlalchemy import DDL, Enum as SQLEnum, event, func, select, text
+from urllib.parse import urlsplit, urlunsplit
+import hashlib
+import ipaddress
+import re
+from typing import Optional
 
 class IOCType(Enum):
     IP_ADDRESS = "ip_address"
@@ -11,21 +16,86 @@ class IOCType(Enum):
     FILENAME = "filename"
     ASN = "asn"
 
+def normalize_ioc_value(ioc_type: IOCType, value: str) -> str:
+    """Canonical spelling of an IOC value, used to recognize repeat sightings"""
+    value = value.strip()
+    try:
+        if ioc_type == IOCType.IP_ADDRESS:
+            return ipaddress.ip_address(value).compressed
+        if ioc_type == IOCType.URL:
+            parts = urlsplit(value)
+            return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, parts.fragment))
+        if ioc_type == IOCType.ASN:
+            return 'AS' + re.search(r'\d+', value).group().lstrip('0')
+    except (ValueError, AttributeError):
+        pass
+    if ioc_type == IOCType.DOMAIN:
+        return value.lower().rstrip('.')
+    if ioc_type in (IOCType.HASH, IOCType.FILENAME):
+        return value.lower()
+    return value
+
+def ioc_value_hash(ioc_type: IOCType, value: str) -> str:
+    """Fixed-size key of the normalized value; long URLs don't fit in a B-tree index"""
+    return hashlib.sha256(normalize_ioc_value(ioc_type, value).encode('utf-8')).hexdigest()
+
+def pg_trgm_available(connection) -> bool:
+    """Whether the server ships the pg_trgm extension (part of PostgreSQL contrib)"""
+    return connection.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first() is not None
+
+def _pg_trgm_ddl_if(ddl, target, bind, **kw) -> bool:
+    # Without a connection (e.g. rendering SQL offline) assume contrib is installed
+    return bind is None or pg_trgm_available(bind)
+
 class SourceURL(db.Model):
     __tablename__ = 'source_urls'
+    __table_args__ = (
+        # Deleted sources wait for app.retention to purge them; their URL can be added again meanwhile
+        db.Index('uq_source_urls_url', 'url', unique=True,
+                 postgresql_where=text('deleted_at IS NULL'), sqlite_where=text('deleted_at IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.Text, nullable=False, unique=True)
+    url = db.Column(db.Text, nullable=False)
     name = db.Column(db.String(255))
     description = db.Column(db.Text)
     active = db.Column(db.Boolean, default=True)
     scrape_interval = db.Column(db.Integer, default=3600)  # seconds
     last_scraped = db.Column(db.DateTime)
+    # Validators from the last successful scrape, used to skip unchanged content
+    etag = db.Column(db.Text)
+    last_modified = db.Column(db.String(64))
+    body_digest = db.Column(db.String(64))  # sha256 of the raw response body
+    content_digest = db.Column(db.String(64))  # sha256 of the analyzed (visible) text
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime)  # set by DELETE /sources/<id>; the row goes once its sessions are purged
     
-    # Relationships
-    scrape_sessions = db.relationship('ScrapeSession', backref='source_url', lazy=True, cascade='all, delete-orphan')
+    # Relationships; sessions are deleted by the database or app.retention, never loaded for it
+    scrape_sessions = db.relationship('ScrapeSession', backref='source_url', lazy=True,
+                                      cascade='all, delete-orphan', passive_deletes=True)
+    
+    @classmethod
+    def existing(cls):
+        """Query of the sources that aren't deleted"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+    
+    def validators(self):
+        """Validators of the last scrape, as accepted by WebScraper.scrape_url"""
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'body_digest': self.body_digest,
+            'content_digest': self.content_digest
+        }
+    
+    def set_validators(self, validators):
+        self.etag = validators.get('etag')
+        self.last_modified = validators.get('last_modified')
+        self.body_digest = validators.get('body_digest')
+        self.content_digest = validators.get('content_digest')
     
     def to_dict(self):
         return {
@@ -36,55 +106,219 @@ class SourceURL(db.Model):
             'active': self.active,
             'scrape_interval': self.scrape_interval,
             'last_scraped': self.last_scraped.isoformat() if self.last_scraped else None,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 class ScrapeSession(db.Model):
     __tablename__ = 'scrape_sessions'
+    __table_args__ = (
+        # Listing newest first; id breaks ties for keyset pagination
+        db.Index('ix_scrape_sessions_started_at', 'started_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    source_url_id = db.Column(db.Integer, db.ForeignKey('source_urls.id'), nullable=True)  # Allow null for ad-hoc scrapes
-    status = db.Column(db.String(50), default='pending')  # pending, running, completed, failed
+    source_url_id = db.Column(db.Integer, db.ForeignKey('source_urls.id', ondelete='CASCADE'), nullable=True)  # Allow null for ad-hoc scrapes
+    url = db.Column(db.Text)  # URL scraped
+    batch_id = db.Column(db.String(32), index=True)  # set for scrapes queued together by /scrape/batch
+    status = db.Column(db.String(50), default='pending')  # pending, running, completed, skipped, failed
+    skip_reason = db.Column(db.String(50))  # not_modified (HTTP 304) or unchanged (same content digest)
+    # When the session was created or queued; never changed, as /sessions pages on it
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    running_at = db.Column(db.DateTime)  # when a worker started the scrape
     completed_at = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
     iocs_found = db.Column(db.Integer, default=0)
+    truncated = db.Column(db.Boolean, nullable=False, default=False)  # extraction ran out of EXTRACTION_CPU_BUDGET
+    # Seconds spent in each stage (app.scrapers.ScrapeTimings), null until the scrape has a response
+    fetch_seconds = db.Column(db.Float)
+    parse_seconds = db.Column(db.Float)
+    extract_seconds = db.Column(db.Float)
+    validate_seconds = db.Column(db.Float)
+    persist_seconds = db.Column(db.Float)
+    bytes_fetched = db.Column(db.BigInteger)  # response body bytes
+    matches = db.Column(db.Integer)  # spans the extraction found
+    rejected = db.Column(db.Integer)  # spans that failed validation
     
-    # Relationships
-    iocs = db.relationship('IOC', backref='scrape_session', lazy=True, cascade='all, delete-orphan')
+    # Relationships; the database deletes sightings and unlinks IOCs with the session
+    sightings = db.relationship('IOCSighting', backref='scrape_session', lazy=True, cascade='all, delete-orphan',
+                                passive_deletes=True)
+    iocs = db.relationship('IOC', backref='scrape_session', lazy=True, passive_deletes=True)  # IOCs last seen in this session
+    document = db.relationship('ScrapeDocument', uselist=False, lazy=True, cascade='all, delete-orphan')
+    
+    @classmethod
+    def latest_completed(cls, source_url_id: Optional[int] = None):
+        """Select of the id of each source's newest completed session, or of
+        one source's. Its IOCs are what the source still publishes while its
+        scrapes are skipped as unchanged."""
+        newest_first = (cls.started_at.desc(), cls.id.desc())
+        if source_url_id is not None:
+            return select(cls.id).where(cls.status == 'completed', cls.source_url_id == source_url_id).order_by(
+                *newest_first).limit(1)
+        ranked = select(
+            cls.id, func.row_number().over(partition_by=cls.source_url_id, order_by=newest_first).label('rank')
+        ).where(cls.status == 'completed', cls.source_url_id.isnot(None)).subquery()
+        return select(ranked.c.id).where(ranked.c.rank == 1)
     
     def to_dict(self):
         return {
             'id': self.id,
             'source_url_id': self.source_url_id,
+            'url': self.url,
+            'batch_id': self.batch_id,
             'status': self.status,
             'started_at': self.started_at.isoformat(),
+            'running_at': self.running_at.isoformat() if self.running_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'error_message': self.error_message,
-            'iocs_found': self.iocs_found
+            'skip_reason': self.skip_reason,
+            'iocs_found': self.iocs_found,
+            'truncated': self.truncated,
+            'timings': {
+                'fetch': self.fetch_seconds,
+                'parse': self.parse_seconds,
+                'extract': self.extract_seconds,
+                'validate': self.validate_seconds,
+                'persist': self.persist_seconds
+            },
+            'bytes_fetched': self.bytes_fetched,
+            'matches': self.matches,
+            'rejected': self.rejected
         }
 
+class ScrapeDocument(db.Model):
+    """The text a session analyzed, kept when contexts are stored as offsets into it"""
+    __tablename__ = 'scrape_documents'
+    
+    scrape_session_id = db.Column(db.Integer, db.ForeignKey('scrape_sessions.id', ondelete='CASCADE'), primary_key=True)
+    content = db.Column(db.Text, nullable=False)
+
+class ScrapeJob(db.Model):
+    """A queued scrape of a pending session; the row is deleted when the session finishes (see app.jobs)"""
+    __tablename__ = 'scrape_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scrape_session_id = db.Column(db.Integer, db.ForeignKey('scrape_sessions.id', ondelete='CASCADE'),
+                                  nullable=False, unique=True)
+    url = db.Column(db.Text)  # ad-hoc scrapes; source scrapes use the source's URL when they run
+    batch_id = db.Column(db.String(32), index=True)  # jobs of a batch are claimed and fetched together
+    options = db.Column(db.JSON, nullable=False, default=dict)  # include_private_ips, exclude_networks, context_size
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(255))  # worker running the job
+    locked_at = db.Column(db.DateTime)  # claimed; claimable again once older than JOB_LEASE
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Uncompressed out-of-line storage lets PostgreSQL substr() read just the
+# chunks holding a context instead of decompressing the whole document
+event.listen(ScrapeDocument.__table__, 'after_create', DDL(
+    'ALTER TABLE scrape_documents ALTER COLUMN content SET STORAGE EXTERNAL'
+).execute_if(dialect='postgresql'))
+
+def _document_context(session_id, offset, length):
+    """The context slice of a session's document, cut by the database"""
+    return db.column_property(
+        select(func.substr(ScrapeDocument.content, offset + 1, length))
+        .where(ScrapeDocument.scrape_session_id == session_id)
+        .correlate_except(ScrapeDocument)
+        .scalar_subquery(),
+        deferred=True
+    )
+
 class IOC(db.Model):
+    """A unique indicator, keyed on its type and normalized value"""
     __tablename__ = 'iocs'
+    __table_args__ = (
+        db.UniqueConstraint('ioc_type', 'value_hash', name='uq_iocs_type_value_hash'),
+        # Listing newest first, with and without a type filter; id breaks
+        # ties (a session's IOCs share first_seen) for keyset pagination
+        db.Index('ix_iocs_first_seen', 'first_seen', 'id'),
+        db.Index('ix_iocs_type_first_seen', 'ioc_type', 'first_seen', 'id'),
+        # Substring search on PostgreSQL; SQLite uses the iocs_fts table (see app.search)
+        db.Index('ix_iocs_value_trgm', 'value', postgresql_using='gin',
+                 postgresql_ops={'value': 'gin_trgm_ops'}).ddl_if(dialect='postgresql', callable_=_pg_trgm_ddl_if),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    scrape_session_id = db.Column(db.Integer, db.ForeignKey('scrape_sessions.id'), nullable=False)
+    # Session that last saw it; unset when that session is deleted
+    scrape_session_id = db.Column(db.Integer, db.ForeignKey('scrape_sessions.id', ondelete='SET NULL'),
+                                  nullable=True, index=True)
     ioc_type = db.Column(SQLEnum(IOCType), nullable=False)
-    value = db.Column(db.Text, nullable=False)
-    context = db.Column(db.Text)  # surrounding text where IOC was found
-    confidence = db.Column(db.Float, default=1.0)  # confidence score 0-1
+    value = db.Column(db.Text, nullable=False)  # as first seen
+    value_hash = db.Column(db.String(64), nullable=False)  # see ioc_value_hash
+    context = db.Column(db.Text)  # surrounding text where IOC was last found
+    # Or, with IOC_CONTEXT_STORAGE=document, where it is in that session's document
+    context_offset = db.Column(db.Integer)
+    context_length = db.Column(db.Integer)
+    document_context = _document_context(scrape_session_id, context_offset, context_length)
+    confidence = db.Column(db.Float, default=1.0)  # highest confidence score 0-1 across sightings
+    sighting_count = db.Column(db.Integer, default=1)
     first_seen = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Relationships
+    sightings = db.relationship('IOCSighting', backref='ioc', lazy=True, cascade='all, delete-orphan',
+                                passive_deletes=True)
+    
     def to_dict(self):
         return {
             'id': self.id,
             'scrape_session_id': self.scrape_session_id,
             'ioc_type': self.ioc_type.value,
             'value': self.value,
-            'context': self.context,
+            'context': self.context if self.context_offset is None else self.document_context,
             'confidence': self.confidence,
+            'sighting_count': self.sighting_count,
             'first_seen': self.first_seen.isoformat(),
             'last_seen': self.last_seen.isoformat()
-        } 
\ No newline at end of file
+        }
+
+class IOCSighting(db.Model):
+    """One IOC found by one scrape session.
+
+    On PostgreSQL the migrations partition the table by month of seen_at,
+    with (id, seen_at) as its primary key, so app.retention can drop old
+    months whole; see app.retention for the partitions.
+    """
+    __tablename__ = 'ioc_sightings'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ioc_id = db.Column(db.Integer, db.ForeignKey('iocs.id', ondelete='CASCADE'), nullable=False, index=True)
+    scrape_session_id = db.Column(db.Integer, db.ForeignKey('scrape_sessions.id', ondelete='CASCADE'),
+                                  nullable=False, index=True)
+    context = db.Column(db.Text)  # surrounding text where IOC was found
+    context_offset = db.Column(db.Integer)  # or where it is in the session's document
+    context_length = db.Column(db.Integer)
+    document_context = _document_context(scrape_session_id, context_offset, context_length)
+    confidence = db.Column(db.Float, default=1.0)  # confidence score 0-1
+    seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # the partition key on PostgreSQL
+    
+    def to_dict(self, document: Optional[str] = None):
+        """IOC fields with this sighting's context and confidence.
+        
+        document, the session's document text if already loaded, saves
+        cutting the context out of it in the database.
+        """
+        if self.context_offset is None:
+            context = self.context
+        elif document is not None:
+            context = document[self.context_offset:self.context_offset + self.context_length]
+        else:
+            context = self.document_context
+        return {
+            'id': self.ioc.id,
+            'scrape_session_id': self.scrape_session_id,
+            'ioc_type': self.ioc.ioc_type.value,
+            'value': self.ioc.value,
+            'context': context,
+            'confidence': self.confidence,
+            'sighting_count': self.ioc.sighting_count,
+            'first_seen': self.ioc.first_seen.isoformat(),
+            'last_seen': self.ioc.last_seen.isoformat()
+        }
+
+# db.create_all() counterpart of the pg_trgm step in the migrations
+event.listen(db.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+    dialect='postgresql', callable_=_pg_trgm_ddl_if
+))
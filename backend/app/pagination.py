@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import desc, func, select, text, tuple_
+from app import db
+
+COUNT_MODES = ('exact', 'approximate')
+
+def encode_cursor(sort_value: datetime, id: int) -> str:
+    """Opaque cursor for the row after which the next page starts"""
+    payload = json.dumps([sort_value.isoformat(), id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(sort_value), int(id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_page(query, sort_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """One page of query, newest first, starting after cursor.
+
+    Rows are ordered by (sort_column, id_column) descending and the cursor
+    holds the last row's pair, so each page is an index range scan that
+    costs the same however deep it is. Returns the rows and the cursor of
+    the next page, or None on the last page.
+    """
+    if cursor:
+        sort_value, id = decode_cursor(cursor)
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(sort_value, id))
+
+    # One extra row tells whether there is a next page without counting
+    rows = query.order_by(desc(sort_column), desc(id_column)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+def count_rows(query, mode: str, filtered: bool) -> int:
+    """Row count of query; 'approximate' reads pg_class.reltuples on PostgreSQL.
+
+    The estimate is free compared to COUNT(*) but only as fresh as the last
+    ANALYZE, and only describes the whole table, so filtered queries and
+    other databases are always counted exactly.
+    """
+    if mode == 'approximate' and not filtered and db.session.get_bind().dialect.name == 'postgresql':
+        table = query.column_descriptions[0]['entity'].__tablename__
+        estimate = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'), {'table': table}
+        ).scalar()
+        # reltuples is -1 (or 0 on older servers) until the table is analyzed
+        if estimate is not None and estimate > 0:
+            return estimate
+
+    return db.session.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
@@ -0,0 +1,162 @@
+import csv
+import io
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import IOC, IOCSighting, ScrapeSession, ioc_value_hash
+
+# Rows per INSERT/COPY round trip; large enough to amortize the round trip,
+# small enough to keep the parameter buffers modest
+BATCH_SIZE = 5000
+# Databases with INSERT ... ON CONFLICT DO UPDATE ... RETURNING, and the
+# function picking the higher of two confidences on each
+UPSERT_DIALECTS = {'postgresql': (postgresql.insert, func.greatest), 'sqlite': (sqlite.insert, func.max)}
+
+def check_dialect(dialect: str) -> None:
+    """Refuse to start on a database IOCs can't be upserted on"""
+    if dialect not in UPSERT_DIALECTS:
+        raise ValueError(f"IOC upserts need one of: {', '.join(UPSERT_DIALECTS)}; DATABASE_URL is {dialect}")
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _supports_copy() -> bool:
+    bind = db.session.get_bind()
+    return bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2'
+
+def _copy_sightings(rows: List[tuple], batch_size: int) -> None:
+    """Stream sighting rows into the ioc_sightings table with PostgreSQL COPY"""
+    columns = ('ioc_id', 'scrape_session_id', 'context', 'context_offset', 'context_length', 'confidence', 'seen_at')
+    sql = f"COPY {IOCSighting.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    # Use the session's connection so the rows commit with the session
+    connection = db.session.connection().connection
+    with connection.cursor() as cursor:
+        for batch in _batches(rows, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([
+                    row['ioc_id'],
+                    row['scrape_session_id'],
+                    row['context'],
+                    row['context_offset'],
+                    row['context_length'],
+                    row['confidence'],
+                    row['seen_at'].isoformat()
+                ])
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+
+def _upsert_statement():
+    """INSERT ... ON CONFLICT (ioc_type, value_hash) DO UPDATE, returning the stored rows"""
+    insert_into, highest = UPSERT_DIALECTS[db.session.get_bind().dialect.name]
+    statement = insert_into(IOC)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=['ioc_type', 'value_hash'],
+        set_={
+            'scrape_session_id': excluded.scrape_session_id,
+            'context': excluded.context,
+            'context_offset': excluded.context_offset,
+            'context_length': excluded.context_length,
+            'confidence': highest(IOC.confidence, excluded.confidence),
+            'sighting_count': IOC.sighting_count + 1,
+            'last_seen': excluded.last_seen
+        }
+    ).returning(IOC.id, IOC.ioc_type, IOC.value_hash, IOC.sighting_count, IOC.first_seen)
+
+def _context_columns(ioc: Dict, document_contexts: bool) -> Dict:
+    """context, or context_offset and context_length into the session's document"""
+    if document_contexts and ioc['context'] is not None:
+        return {'context': None, 'context_offset': ioc['context_offset'], 'context_length': len(ioc['context'])}
+    return {'context': ioc['context'], 'context_offset': None, 'context_length': None}
+
+def save_iocs(session_id: int, iocs: List[Dict], seen_at: datetime, batch_size: int = BATCH_SIZE,
+              use_copy: Optional[bool] = None, document_contexts: bool = False) -> List[Dict]:
+    """Record a session's IOCs in the deduplicated store, without committing.
+
+    Each distinct indicator is upserted on (ioc_type, value_hash): new ones
+    are inserted, known ones get last_seen, context and sighting_count
+    updated. One sighting per indicator links it to the session; sightings
+    use COPY on PostgreSQL with psycopg2 and batched executemany INSERTs
+    elsewhere (use_copy overrides the choice). With document_contexts,
+    contexts are stored as their offset and length in the session's
+    ScrapeDocument, which the caller saves, instead of as text. Returns API
+    dicts for the stored IOCs without reading them back.
+    """
+    # Spellings that normalize to the same indicator are one sighting
+    unique = {}
+    for ioc in iocs:
+        unique.setdefault((ioc['type'], ioc_value_hash(ioc['type'], ioc['value'])), ioc)
+
+    if not unique:
+        return []
+    contexts = {key: _context_columns(ioc, document_contexts) for key, ioc in unique.items()}
+
+    # Upsert in key order so concurrent sessions lock rows in the same order;
+    # executemany with RETURNING is sent as multi-row statements per batch
+    keys = sorted(unique, key=lambda key: (key[0].value, key[1]))
+    statement = _upsert_statement()
+    connection = db.session.connection()
+    stored = {}
+    for batch in _batches(keys, batch_size):
+        rows = [{
+            'scrape_session_id': session_id,
+            'ioc_type': ioc_type,
+            'value': unique[ioc_type, value_hash]['value'],
+            'value_hash': value_hash,
+            **contexts[ioc_type, value_hash],
+            'confidence': unique[ioc_type, value_hash]['confidence'],
+            'sighting_count': 1,
+            'first_seen': seen_at,
+            'last_seen': seen_at
+        } for ioc_type, value_hash in batch]
+        for row in connection.execute(statement, rows):
+            stored[row.ioc_type, row.value_hash] = row
+
+    sightings = [{
+        'ioc_id': stored[key].id,
+        'scrape_session_id': session_id,
+        **contexts[key],
+        'confidence': unique[key]['confidence'],
+        'seen_at': seen_at
+    } for key in unique]
+
+    if use_copy is None:
+        use_copy = _supports_copy()
+
+    if use_copy:
+        _copy_sightings(sightings, batch_size)
+    else:
+        for batch in _batches(sightings, batch_size):
+            db.session.execute(insert(IOCSighting), batch)
+
+    last_seen = seen_at.isoformat()
+    return [{
+        'id': stored[key].id,
+        'scrape_session_id': session_id,
+        'ioc_type': key[0].value,
+        'value': unique[key]['value'],
+        'context': unique[key]['context'],
+        'confidence': unique[key]['confidence'],
+        'sighting_count': stored[key].sighting_count,
+        'first_seen': stored[key].first_seen.isoformat(),
+        'last_seen': last_seen
+    } for key in unique]
+
+def refresh_unchanged_iocs(source_url_id: int, seen_at: datetime) -> int:
+    """Set last_seen of the IOCs found by the source's newest completed
+    session, without committing, after a scrape found its content
+    unchanged; returns how many were updated. The source still publishes
+    them, so IOC_RETENTION_DAYS must not expire them."""
+    found = select(IOCSighting.ioc_id).where(
+        IOCSighting.scrape_session_id == ScrapeSession.latest_completed(source_url_id).scalar_subquery()
+    )
+    return db.session.execute(
+        update(IOC).where(IOC.id.in_(found), IOC.last_seen < seen_at).values(last_seen=seen_at)
+        .execution_options(synchronize_session=False)
+    ).rowcount
@@ -0,0 +1,64 @@
+"""Profiles of single API requests and scrapes, when PROFILING_ENABLED.
+
+cProfile ships with Python and records every call; pyinstrument, a
+sampling profiler whose call trees are easier to read, is offered when
+it is installed. A profile covers the thread it was started in: work in
+ExtractionPool worker processes or a batch's event loop is not in it.
+"""
+import cProfile
+import io
+import os
+import pstats
+from typing import Tuple
+
+PROFILERS = ('cprofile', 'pyinstrument')
+# Functions listed in a cProfile report, by cumulative time
+REPORT_LIMIT = 60
+
+def available_profilers() -> Tuple[str, ...]:
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return ('cprofile',)
+    return PROFILERS
+
+class Profile:
+    """A profile of the calling thread from start() until report()"""
+
+    def __init__(self, profiler: str = 'cprofile'):
+        if profiler not in available_profilers():
+            raise ValueError(f"profile must be one of: {', '.join(available_profilers())}")
+        self.profiler = profiler
+        if profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+            self._profile = Profiler()
+        else:
+            self._profile = cProfile.Profile()
+
+    def start(self) -> 'Profile':
+        if self.profiler == 'pyinstrument':
+            self._profile.start()
+        else:
+            self._profile.enable()
+        return self
+
+    def report(self) -> str:
+        """Stop profiling and return the report as text"""
+        if self.profiler == 'pyinstrument':
+            self._profile.stop()
+            return self._profile.output_text(unicode=True, show_all=False)
+        self._profile.disable()
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats('cumulative').print_stats(REPORT_LIMIT)
+        return stream.getvalue()
+
+def session_profile_path(directory: str, session_id: int) -> str:
+    return os.path.join(directory, f'session-{session_id}.txt')
+
+def save_session_profile(directory: str, session_id: int, report: str) -> str:
+    """Write a scrape's profile report where session_profile_path finds it"""
+    os.makedirs(directory, exist_ok=True)
+    path = session_profile_path(directory, session_id)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    return path
@@ -0,0 +1,329 @@
+import logging
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import column, delete, func, select, table, text, update
+
+logger = logging.getLogger(__name__)
+
+# Months of ioc_sightings partitions kept ready ahead of the current one
+PARTITIONS_AHEAD = 2
+PARTITION_NAME = re.compile(r'ioc_sightings_y(\d{4})m(\d{2})')
+# pg_try_advisory_lock key of the retention pass, so one process runs it at a time
+ADVISORY_LOCK = 0x10C5C4A9
+
+def _month(value) -> date:
+    return date(value.year, value.month, 1)
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f'ioc_sightings_y{month.year:04d}m{month.month:02d}'
+
+def sightings_partitioned(connection) -> bool:
+    """Whether ioc_sightings is partitioned by month, as the PostgreSQL migrations make it"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'ioc_sightings'::regclass)"
+    )).scalar()
+
+def sighting_partitions(connection) -> Dict[date, str]:
+    """Monthly partitions of ioc_sightings by first day of their month"""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'ioc_sightings'::regclass"
+    )).scalars()
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.fullmatch(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+def create_sighting_partitions(connection, first: date, last: date) -> List[str]:
+    """Create the missing monthly partitions of ioc_sightings from first's
+    month to last's; returns their names"""
+    existing = sighting_partitions(connection)
+    created = []
+    month = _month(first)
+    while month <= last:
+        upper = _next_month(month)
+        if month not in existing:
+            stray = connection.execute(text(
+                'SELECT EXISTS (SELECT 1 FROM ioc_sightings_default WHERE seen_at >= :lower AND seen_at < :upper)'
+            ), {'lower': month, 'upper': upper}).scalar()
+            if stray:
+                # PostgreSQL refuses a partition for rows already in the default one
+                logger.warning('ioc_sightings_default holds sightings of %s; not partitioning that month',
+                               month.strftime('%Y-%m'))
+            else:
+                connection.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF ioc_sightings '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                logger.info('Created sighting partition %s', partition_name(month))
+                created.append(partition_name(month))
+        month = upper
+    return created
+
+def delete_sessions(session_ids: Sequence[int]) -> None:
+    """Delete scrape sessions and everything that refers to them, with one
+    set-based statement per table, in the current transaction.
+
+    The foreign keys cascade on PostgreSQL too, but SQLite doesn't enforce
+    them, and deleting the referring rows first costs the same.
+    """
+    from app import db
+    from app.models import IOC, IOCSighting, ScrapeDocument, ScrapeJob, ScrapeSession
+
+    db.session.execute(delete(IOCSighting).where(IOCSighting.scrape_session_id.in_(session_ids)))
+    db.session.execute(
+        update(IOC).where(IOC.scrape_session_id.in_(session_ids))
+        .values(scrape_session_id=None, context_offset=None, context_length=None)
+    )
+    db.session.execute(delete(ScrapeDocument).where(ScrapeDocument.scrape_session_id.in_(session_ids)))
+    db.session.execute(delete(ScrapeJob).where(ScrapeJob.scrape_session_id.in_(session_ids)))
+    db.session.execute(delete(ScrapeSession).where(ScrapeSession.id.in_(session_ids)))
+
+def delete_iocs(ioc_ids: Sequence[int]) -> None:
+    """Delete IOCs and their sightings in the current transaction"""
+    from app import db
+    from app.models import IOC, IOCSighting
+
+    db.session.execute(delete(IOCSighting).where(IOCSighting.ioc_id.in_(ioc_ids)))
+    db.session.execute(delete(IOC).where(IOC.id.in_(ioc_ids)))
+
+class RetentionService:
+    """Purge deleted sources and enforce the retention policies.
+
+    DELETE /sources/<id> only sets the source's deleted_at; every
+    RETENTION_INTERVAL seconds, or when woken by a deletion, a pass deletes
+    the finished sessions of deleted sources, then the sources themselves.
+    It also deletes finished sessions started more than
+    SESSION_RETENTION_DAYS ago, all but the SESSION_RETENTION_PER_SOURCE
+    newest finished sessions of each source, and IOCs not seen for
+    IOC_RETENTION_DAYS (0 keeps them all). The newest completed session of
+    each source is kept by both session policies: while the source's
+    content is unchanged its skipped scrapes refresh the last_seen of that
+    session's IOCs (see persistence.refresh_unchanged_iocs).
+
+    Rows go in batches of RETENTION_BATCH_SIZE ids, one transaction per
+    batch, so no request waits on a long lock and nothing is loaded into
+    the ORM. On PostgreSQL ioc_sightings is partitioned by month: a pass
+    creates the next PARTITIONS_AHEAD months' partitions and drops those
+    wholly older than the session retention before deleting row by row.
+    A PostgreSQL advisory lock keeps concurrent passes of several
+    processes from deleting the same rows.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RETENTION_ENABLED', True)
+        app.config.setdefault('RETENTION_INTERVAL', 3600)
+        app.config.setdefault('RETENTION_BATCH_SIZE', 1000)
+        app.config.setdefault('SESSION_RETENTION_DAYS', 0)
+        app.config.setdefault('SESSION_RETENTION_PER_SOURCE', 0)
+        app.config.setdefault('IOC_RETENTION_DAYS', 0)
+        app.extensions['retention'] = self
+        self.app = app
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Run a pass now and then every RETENTION_INTERVAL seconds in a background thread"""
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+        logger.info('Retention started, every %ss', self.app.config['RETENTION_INTERVAL'])
+
+    def stop(self):
+        """Stop after the batch being deleted"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_forever(self):
+        """Start the passes and block, for use as a standalone service"""
+        self.start()
+        try:
+            while self.running:
+                self._thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def wake(self):
+        """Run a pass soon, e.g. after a source was deleted"""
+        if self.running:
+            self._wakeup.set()
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """One pass; returns the numbers of sources, sessions, sighting
+        partitions and IOCs deleted. Call within an app context."""
+        from app import db, stats
+
+        now = now or datetime.utcnow()
+        config = self.app.config
+        counts = {'sources': 0, 'sessions': 0, 'partitions': 0, 'iocs': 0}
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock:
+            if lock.dialect.name == 'postgresql' and not lock.execute(
+                    text('SELECT pg_try_advisory_lock(:key)'), {'key': ADVISORY_LOCK}).scalar():
+                logger.debug('Retention pass already running elsewhere')
+                return counts
+            try:
+                if sightings_partitioned(lock):
+                    self._create_partitions(lock, now)
+                counts['sessions'] += self._purge_deleted_sources(counts)
+                if config['SESSION_RETENTION_DAYS'] > 0:
+                    cutoff = now - timedelta(days=config['SESSION_RETENTION_DAYS'])
+                    if sightings_partitioned(lock):
+                        counts['partitions'] += self._drop_partitions(lock, cutoff)
+                    counts['sessions'] += self._expire_sessions(cutoff)
+                if config['SESSION_RETENTION_PER_SOURCE'] > 0:
+                    counts['sessions'] += self._trim_sessions(config['SESSION_RETENTION_PER_SOURCE'])
+                if config['IOC_RETENTION_DAYS'] > 0:
+                    counts['iocs'] += self._expire_iocs(now - timedelta(days=config['IOC_RETENTION_DAYS']))
+            finally:
+                if lock.dialect.name == 'postgresql':
+                    lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK})
+        if any(counts.values()):
+            stats.invalidate_ioc_stats()
+            logger.info('Retention deleted %(sources)d sources, %(sessions)d sessions, '
+                        '%(partitions)d sighting partitions and %(iocs)d IOCs', counts)
+        return counts
+
+    # Internals
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                logger.exception('Retention pass failed')
+            self._wakeup.wait(self.app.config['RETENTION_INTERVAL'])
+            self._wakeup.clear()
+
+    def _finished_sessions(self):
+        from app.jobs import ACTIVE_STATUSES
+        from app.models import ScrapeSession
+
+        return ScrapeSession.status.notin_(ACTIVE_STATUSES)
+
+    def _expirable_sessions(self):
+        """Finished sessions other than each source's newest completed one"""
+        from app.models import ScrapeSession
+
+        return self._finished_sessions() & ScrapeSession.id.notin_(ScrapeSession.latest_completed())
+
+    def _delete_in_batches(self, column, condition, delete_batch) -> int:
+        """Delete the rows matching condition in batches of ids, in id order,
+        committing each; returns how many went"""
+        from app import db
+
+        batch_size = self.app.config['RETENTION_BATCH_SIZE']
+        deleted = 0
+        last_id = 0
+        while not self._stopping:
+            ids: List[int] = db.session.execute(
+                select(column).where(condition, column > last_id).order_by(column).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            delete_batch(ids)
+            db.session.commit()
+            deleted += len(ids)
+            last_id = ids[-1]
+        return deleted
+
+    def _purge_deleted_sources(self, counts: Dict[str, int]) -> int:
+        """Delete the finished sessions of deleted sources, then the sources
+        left without sessions; running ones are purged by a later pass"""
+        from app import db
+        from app.models import ScrapeSession, SourceURL
+
+        deleted_sources = select(SourceURL.id).where(SourceURL.deleted_at.isnot(None))
+        sessions = self._delete_in_batches(
+            ScrapeSession.id,
+            (ScrapeSession.source_url_id.in_(deleted_sources)) & self._finished_sessions(),
+            delete_sessions,
+        )
+        result = db.session.execute(delete(SourceURL).where(
+            SourceURL.deleted_at.isnot(None),
+            ~select(ScrapeSession.id).where(ScrapeSession.source_url_id == SourceURL.id).exists(),
+        ))
+        db.session.commit()
+        counts['sources'] += result.rowcount
+        return sessions
+
+    def _expire_sessions(self, cutoff: datetime) -> int:
+        from app.models import ScrapeSession
+
+        return self._delete_in_batches(
+            ScrapeSession.id, (ScrapeSession.started_at < cutoff) & self._expirable_sessions(), delete_sessions
+        )
+
+    def _trim_sessions(self, keep: int) -> int:
+        from app.models import ScrapeSession
+
+        ranked = select(
+            ScrapeSession.id,
+            func.row_number().over(
+                partition_by=ScrapeSession.source_url_id,
+                order_by=(ScrapeSession.started_at.desc(), ScrapeSession.id.desc()),
+            ).label('rank'),
+        ).where(ScrapeSession.source_url_id.isnot(None), self._finished_sessions()).subquery()
+        return self._delete_in_batches(
+            ScrapeSession.id,
+            ScrapeSession.id.in_(select(ranked.c.id).where(ranked.c.rank > keep)) & self._expirable_sessions(),
+            delete_sessions,
+        )
+
+    def _expire_iocs(self, cutoff: datetime) -> int:
+        from app.models import IOC
+
+        return self._delete_in_batches(IOC.id, IOC.last_seen < cutoff, delete_iocs)
+
+    def _create_partitions(self, connection, now: datetime) -> None:
+        """This month's partition of ioc_sightings and the next
+        PARTITIONS_AHEAD months', so new sightings never land in the
+        default partition"""
+        last = _month(now)
+        for _ in range(PARTITIONS_AHEAD):
+            last = _next_month(last)
+        create_sighting_partitions(connection, _month(now), last)
+
+    def _drop_partitions(self, connection, cutoff: datetime) -> int:
+        """Drop the partitions of ioc_sightings whose whole month is before
+        cutoff, except those holding sightings of a source's newest
+        completed session"""
+        from app.models import ScrapeSession
+
+        dropped = 0
+        for month, name in sorted(sighting_partitions(connection).items()):
+            if datetime.combine(_next_month(month), datetime.min.time()) > cutoff:
+                break
+            partition = table(name, column('scrape_session_id'))
+            if connection.execute(select(partition.c.scrape_session_id).where(
+                    partition.c.scrape_session_id.in_(ScrapeSession.latest_completed())).limit(1)).first():
+                continue
+            connection.execute(text(f'DROP TABLE {name}'))
+            logger.info('Dropped sighting partition %s', name)
+            dropped += 1
+        return dropped
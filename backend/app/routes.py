@@ -1,23 +1,90 @@
-from flask import Blueprint, request, jsonify
-from app import db
-from app.models import SourceURL, ScrapeSession, IOC, IOCType
-from app.scrapers import WebScraper
-from datetime import datetime
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context, url_for
+from app import db, export, job_queue, metrics, pagination, profiling, retention, scheduler, search as ioc_search, stats
+from app.jobs import ACTIVE_STATUSES
+from app.models import SourceURL, ScrapeSession, IOC, IOCSighting, IOCType
+from app.ipfilter import IPRangeSet
+from app.scrapers import MAX_CONTEXT_SIZE
+from datetime import datetime, timezone
 from sqlalchemy import desc
+from sqlalchemy.orm import joinedload, undefer
+import json
+import os
+import time
 
 api = Blueprint('api', __name__)
-scraper = WebScraper()
+
+# Seconds between status checks of a streamed session, and between
+# keep-alive comments while its status doesn't change
+SESSION_EVENTS_INTERVAL = 0.5
+SESSION_EVENTS_KEEPALIVE = 15
+
+# URLs and sources in one /scrape/batch request
+MAX_BATCH_SIZE = 1000
+
+def _cursor_page(query, key, sort_column, id_column, per_page, filtered):
+    """Keyset-paginated response for the list endpoints"""
+    count = request.args.get('count')
+    if count and count not in pagination.COUNT_MODES:
+        return jsonify({'error': f"count must be one of: {', '.join(pagination.COUNT_MODES)}"}), 400
+    if per_page < 1:
+        return jsonify({'error': 'per_page must be positive'}), 400
+    
+    try:
+        items, next_cursor = pagination.keyset_page(query, sort_column, id_column, request.args['cursor'], per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response_data = {
+        key: [item.to_dict() for item in items],
+        'next_cursor': next_cursor,
+        'per_page': per_page
+    }
+    if count:
+        response_data['total'] = pagination.count_rows(query, count, filtered)
+    
+    return jsonify(response_data)
+
+@api.before_request
+def _start_request():
+    """Time every request, and profile it if asked to with ?profile=cprofile
+    or ?profile=pyinstrument and PROFILING_ENABLED"""
+    g.request_started = time.perf_counter()
+    profiler = request.args.get('profile')
+    if profiler:
+        if not current_app.config['PROFILING_ENABLED']:
+            return jsonify({'error': 'Profiling is disabled; set PROFILING_ENABLED=true'}), 403
+        try:
+            g.profile = profiling.Profile(profiler).start()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+@api.after_request
+def _finish_request(response):
+    """Record the request's time; a profiled request returns the profile
+    report instead of its response. Streamed bodies are written after
+    this, so their time is in neither."""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response = Response(profile.report(), mimetype='text/plain')
+    metrics.observe_request(request.endpoint, request.method, response.status_code,
+                            time.perf_counter() - g.request_started)
+    return response
 
 @api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'})
 
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Scrape stage timings and request times of this process for Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # Source URL endpoints
 @api.route('/sources', methods=['GET'])
 def get_sources():
     """Get all source URLs"""
-    sources = SourceURL.query.all()
+    sources = SourceURL.existing().all()
     return jsonify([source.to_dict() for source in sources])
 
 @api.route('/sources', methods=['POST'])
@@ -29,7 +96,7 @@ def create_source():
         return jsonify({'error': 'URL is required'}), 400
     
     # Check if URL already exists
-    existing = SourceURL.query.filter_by(url=data['url']).first()
+    existing = SourceURL.existing().filter_by(url=data['url']).first()
     if existing:
         return jsonify({'error': 'URL already exists'}), 409
     
@@ -43,13 +110,14 @@ def create_source():
     
     db.session.add(source)
     db.session.commit()
+    scheduler.source_changed(source)
     
     return jsonify(source.to_dict()), 201
 
 @api.route('/sources/<int:source_id>', methods=['PUT'])
 def update_source(source_id):
     """Update a source URL"""
-    source = SourceURL.query.get_or_404(source_id)
+    source = SourceURL.existing().filter_by(id=source_id).first_or_404()
     data = request.get_json()
     
     if data.get('url'):
@@ -65,145 +133,227 @@ def update_source(source_id):
     
     source.updated_at = datetime.utcnow()
     db.session.commit()
+    scheduler.source_changed(source)
     
     return jsonify(source.to_dict())
 
 @api.route('/sources/<int:source_id>', methods=['DELETE'])
 def delete_source(source_id):
-    """Delete a source URL"""
-    source = SourceURL.query.get_or_404(source_id)
-    db.session.delete(source)
+    """Delete a source URL.
+
+    Only marks it deleted: its sessions, sightings and documents are
+    deleted in batches by app.retention, which removes the source last.
+    """
+    source = SourceURL.existing().filter_by(id=source_id).first_or_404()
+    source.deleted_at = source.updated_at = datetime.utcnow()
+    source.active = False
     db.session.commit()
+    scheduler.source_removed(source_id)
+    retention.wake()
     
     return '', 204
 
 # Scraping endpoints
+def _queued(session):
+    """202 response for a queued scrape, pointing at its session"""
+    response = jsonify(session.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_session', session_id=session.id)
+    return response
+
+def _scrape_options(data):
+    """(options for JobQueue.enqueue, None) from a scrape request, or (None, error response)"""
+    # Optional CIDR list of IP addresses to leave out of the results
+    excluded_networks = None
+    if data.get('exclude_networks'):
+        if not isinstance(data['exclude_networks'], list):
+            return None, (jsonify({'error': 'exclude_networks must be a list of networks'}), 400)
+        excluded_networks = [str(network) for network in data['exclude_networks']]
+        try:
+            IPRangeSet(excluded_networks)
+        except ValueError as e:
+            return None, (jsonify({'error': f'Invalid network in exclude_networks: {e}'}), 400)
+    
+    # Characters of context kept around each IOC; 0 keeps none
+    context_size = data.get('context_size')
+    if context_size is not None and (
+            not isinstance(context_size, int) or isinstance(context_size, bool)
+            or not 0 <= context_size <= MAX_CONTEXT_SIZE):
+        return None, (jsonify({'error': f'context_size must be an integer from 0 to {MAX_CONTEXT_SIZE}'}), 400)
+    
+    options = {
+        'include_private_ips': data.get('include_private_ips', False),
+        'exclude_networks': excluded_networks,
+        'context_size': context_size
+    }
+    # Profile the scrape in its worker, see get_session_profile
+    if data.get('profile'):
+        if not current_app.config['PROFILING_ENABLED']:
+            return None, (jsonify({'error': 'Profiling is disabled; set PROFILING_ENABLED=true'}), 403)
+        if data['profile'] not in profiling.available_profilers():
+            return None, (jsonify({
+                'error': f"profile must be one of: {', '.join(profiling.available_profilers())}"
+            }), 400)
+        options['profile'] = data['profile']
+    return options, None
+
 @api.route('/scrape/adhoc', methods=['POST'])
 def adhoc_scrape():
-    """Perform an ad-hoc scrape of a URL"""
+    """Queue an ad-hoc scrape of a URL.
+
+    Returns the pending session at once; poll /sessions/<id> or stream
+    /sessions/<id>/events until it finishes, then read its IOCs from
+    /sessions/<id>/iocs. With profile set to a profiler and
+    PROFILING_ENABLED, the scrape is profiled; see get_session_profile.
+    """
     data = request.get_json()
     
     if not data or not data.get('url'):
         return jsonify({'error': 'URL is required'}), 400
     
-    url = data['url']
-    include_private_ips = data.get('include_private_ips', False)
+    options, error = _scrape_options(data)
+    if error:
+        return error
+    
+    return _queued(job_queue.enqueue(data['url'], **options))
+
+@api.route('/scrape/batch', methods=['POST'])
+def batch_scrape():
+    """Queue scrapes of many URLs and sources in one call.
+
+    Takes urls and source_ids, and the adhoc_scrape options for all of
+    them. A worker fetches a batch's URLs concurrently, a few per host,
+    and stores the results in bulk. Returns the batch id and its pending
+    sessions, URLs first, in request order; with stream true, streams the
+    results as get_batch does instead.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'urls or source_ids is required'}), 400
+    
+    urls = data.get('urls') or []
+    source_ids = data.get('source_ids') or []
+    if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+        return jsonify({'error': 'urls must be a list of URLs'}), 400
+    if not isinstance(source_ids, list) or not all(
+            isinstance(source_id, int) and not isinstance(source_id, bool) for source_id in source_ids):
+        return jsonify({'error': 'source_ids must be a list of source ids'}), 400
+    if not urls and not source_ids:
+        return jsonify({'error': 'urls or source_ids is required'}), 400
+    if len(urls) + len(source_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'A batch holds at most {MAX_BATCH_SIZE} URLs and sources'}), 400
+    
+    options, error = _scrape_options(data)
+    if error:
+        return error
+    if 'profile' in options:
+        return jsonify({'error': 'profile is only supported for single scrapes'}), 400
     
-    # Create a temporary scrape session (allow null source_url_id for ad-hoc)
-    session = ScrapeSession(
-        status='running'
+    sources = {source.id: source for source in SourceURL.existing().filter(SourceURL.id.in_(source_ids))}
+    missing = sorted(set(source_ids) - sources.keys())
+    if missing:
+        return jsonify({'error': 'Unknown source ids', 'source_ids': missing}), 404
+    
+    sessions = job_queue.enqueue_batch(
+        [(url, None) for url in urls] + [(None, sources[source_id]) for source_id in source_ids], **options
     )
-    db.session.add(session)
-    db.session.commit()
+    batch_id = sessions[0].batch_id
+    if data.get('stream'):
+        return _batch_stream(batch_id)
     
-    try:
-        # Perform the scrape
-        result = scraper.scrape_url(url, include_private_ips)
-        
-        if result['success']:
-            # Save IOCs to database
-            iocs_saved = 0
-            for ioc_data in result['iocs']:
-                ioc = IOC(
-                    scrape_session_id=session.id,
-                    ioc_type=ioc_data['type'],
-                    value=ioc_data['value'],
-                    context=ioc_data['context'],
-                    confidence=ioc_data['confidence']
-                )
-                db.session.add(ioc)
-                iocs_saved += 1
-            
-            session.status = 'completed'
-            session.iocs_found = iocs_saved
-            session.completed_at = datetime.utcnow()
-            
-        else:
-            session.status = 'failed'
-            session.error_message = result['error']
-            session.completed_at = datetime.utcnow()
-        
-        db.session.commit()
-        
-        # Return session data with IOCs
-        response_data = session.to_dict()
-        if result['success']:
-            response_data['iocs'] = [ioc.to_dict() for ioc in session.iocs]
-        
-        return jsonify(response_data)
-        
-    except Exception as e:
-        session.status = 'failed'
-        session.error_message = str(e)
-        session.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({'error': str(e)}), 500
+    response = jsonify({'batch_id': batch_id, 'sessions': [session.to_dict() for session in sessions]})
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_batch', batch_id=batch_id)
+    return response
 
-@api.route('/scrape/source/<int:source_id>', methods=['POST'])
-def scrape_source(source_id):
-    """Scrape a specific source URL"""
-    source = SourceURL.query.get_or_404(source_id)
+def _batch_summary(sessions):
+    """Progress and throughput of a batch's sessions"""
+    finished = [session for session in sessions if session.status not in ACTIVE_STATUSES]
+    summary = {status: sum(session.status == status for session in sessions)
+               for status in (*ACTIVE_STATUSES, 'completed', 'skipped', 'failed')}
+    summary['total'] = len(sessions)
+    summary['iocs_found'] = sum(session.iocs_found or 0 for session in finished)
     
-    # Create scrape session
-    session = ScrapeSession(
-        source_url_id=source.id,
-        status='running'
-    )
-    db.session.add(session)
-    db.session.commit()
+    # From the first scrape starting to run to the last one finishing, or now
+    running_at = [session.running_at for session in sessions if session.running_at is not None]
+    if running_at:
+        end = max(session.completed_at for session in finished) if len(finished) == len(sessions) \
+            else datetime.utcnow()
+        seconds = max((end - min(running_at)).total_seconds(), 0.001)
+        summary['seconds'] = round(seconds, 3)
+        summary['urls_per_second'] = round(len(finished) / seconds, 2)
+    return summary
+
+def _batch_stream(batch_id):
+    """NDJSON stream of a batch: a session line per finished scrape, a
+    progress line while nothing finishes, and a summary line at the end"""
+    def lines():
+        sent = set()
+        last_sent = time.monotonic()
+        while True:
+            sessions = ScrapeSession.query.filter_by(batch_id=batch_id).order_by(ScrapeSession.id).all()
+            finished = [session.to_dict() for session in sessions
+                        if session.status not in ACTIVE_STATUSES and session.id not in sent]
+            summary = _batch_summary(sessions)
+            # End the transaction so the next check sees workers' commits
+            db.session.rollback()
+            for session in finished:
+                yield json.dumps({'session': session}) + '\n'
+                sent.add(session['id'])
+            if summary['total'] == len(sent):
+                yield json.dumps({'batch_id': batch_id, 'summary': summary}) + '\n'
+                return
+            if finished:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SESSION_EVENTS_KEEPALIVE:
+                yield json.dumps({'batch_id': batch_id, 'progress': summary}) + '\n'
+                last_sent = time.monotonic()
+            time.sleep(SESSION_EVENTS_INTERVAL)
     
-    try:
-        # Perform the scrape
-        result = scraper.scrape_url(source.url)
-        
-        if result['success']:
-            # Save IOCs to database
-            iocs_saved = 0
-            for ioc_data in result['iocs']:
-                ioc = IOC(
-                    scrape_session_id=session.id,
-                    ioc_type=ioc_data['type'],
-                    value=ioc_data['value'],
-                    context=ioc_data['context'],
-                    confidence=ioc_data['confidence']
-                )
-                db.session.add(ioc)
-                iocs_saved += 1
-            
-            session.status = 'completed'
-            session.iocs_found = iocs_saved
-            session.completed_at = datetime.utcnow()
-            source.last_scraped = datetime.utcnow()
-            
-        else:
-            session.status = 'failed'
-            session.error_message = result['error']
-            session.completed_at = datetime.utcnow()
-        
-        db.session.commit()
-        
-        return jsonify(session.to_dict())
-        
-    except Exception as e:
-        session.status = 'failed'
-        session.error_message = str(e)
-        session.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({'error': str(e)}), 500
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/scrape/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Get a batch's summary and sessions; with stream=true, stream them as
+    NDJSON until every scrape has finished"""
+    sessions = ScrapeSession.query.filter_by(batch_id=batch_id).order_by(ScrapeSession.id).all()
+    if not sessions:
+        return jsonify({'error': 'Batch not found'}), 404
+    if request.args.get('stream', 'false').lower() == 'true':
+        db.session.rollback()
+        return _batch_stream(batch_id)
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'summary': _batch_summary(sessions),
+        'sessions': [session.to_dict() for session in sessions]
+    })
+
+@api.route('/scrape/source/<int:source_id>', methods=['POST'])
+def scrape_source(source_id):
+    """Queue a scrape of a specific source URL; see adhoc_scrape"""
+    source = SourceURL.existing().filter_by(id=source_id).first_or_404()
+    return _queued(job_queue.enqueue(source=source))
 
 # IOC endpoints
 @api.route('/iocs', methods=['GET'])
 def get_iocs():
-    """Get IOCs with optional filtering"""
+    """Get IOCs with optional filtering.
+
+    Pass cursor (empty for the first page) to walk the list by keyset
+    instead of page number; responses then carry next_cursor, and a total
+    only when count=exact or count=approximate is given.
+    """
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
     ioc_type = request.args.get('type')
     search = request.args.get('search')
     
-    query = IOC.query
+    # Contexts stored as document offsets are cut out in the same query
+    query = IOC.query.options(undefer(IOC.document_context))
     
+    ioc_type_enum = None
     if ioc_type:
         try:
             ioc_type_enum = IOCType(ioc_type)
@@ -212,9 +362,12 @@ def get_iocs():
             return jsonify({'error': 'Invalid IOC type'}), 400
     
     if search:
-        query = query.filter(IOC.value.ilike(f'%{search}%'))
+        query = ioc_search.filter_by_value(query, search, ioc_type_enum)
+    
+    if 'cursor' in request.args:
+        return _cursor_page(query, 'iocs', IOC.first_seen, IOC.id, per_page, filtered=bool(ioc_type or search))
     
-    query = query.order_by(desc(IOC.first_seen))
+    query = query.order_by(desc(IOC.first_seen), desc(IOC.id))
     
     paginated = query.paginate(
         page=page, per_page=per_page, error_out=False
@@ -228,34 +381,70 @@ def get_iocs():
         'per_page': per_page
     })
 
-@api.route('/iocs/stats', methods=['GET'])
-def get_ioc_stats():
-    """Get IOC statistics"""
-    stats = {}
+@api.route('/iocs/export', methods=['GET'])
+def export_iocs():
+    """Stream every matching IOC as NDJSON, CSV or a STIX 2.1 bundle.
+
+    Filters: type, since (ISO 8601; IOCs last seen since then),
+    min_confidence (0-1) and session_id; context=true adds contexts.
+    Rows are read through a server-side cursor and written as they
+    arrive, so memory use doesn't grow with the size of the export.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in export.EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(export.EXPORT_FORMATS)}"}), 400
+    
+    ioc_type = None
+    if request.args.get('type'):
+        try:
+            ioc_type = IOCType(request.args['type'])
+        except ValueError:
+            return jsonify({'error': 'Invalid IOC type'}), 400
     
-    # Count by type
-    for ioc_type in IOCType:
-        count = IOC.query.filter(IOC.ioc_type == ioc_type).count()
-        stats[ioc_type.value] = count
+    since = None
+    if request.args.get('since'):
+        try:
+            since = datetime.fromisoformat(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 date or time'}), 400
+        # Stored times are naive UTC
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
     
-    # Total count
-    stats['total'] = IOC.query.count()
+    min_confidence = request.args.get('min_confidence', type=float)
+    if 'min_confidence' in request.args and (min_confidence is None or not 0 <= min_confidence <= 1):
+        return jsonify({'error': 'min_confidence must be a number from 0 to 1'}), 400
     
-    # Recent activity (last 24 hours)
-    from datetime import timedelta
-    recent_cutoff = datetime.utcnow() - timedelta(hours=24)
-    stats['recent'] = IOC.query.filter(IOC.first_seen >= recent_cutoff).count()
+    session_id = request.args.get('session_id', type=int)
+    if 'session_id' in request.args and session_id is None:
+        return jsonify({'error': 'session_id must be an integer'}), 400
     
-    return jsonify(stats)
+    include_context = request.args.get('context', 'false').lower() == 'true'
+    statement = export.export_query(ioc_type, since, min_confidence, session_id, include_context)
+    mimetype, extension = export.EXPORT_FORMATS[export_format]
+    return Response(
+        stream_with_context(export.export_iocs(export_format, statement, include_context)),
+        content_type=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=iocs.{extension}', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/iocs/stats', methods=['GET'])
+def get_ioc_stats():
+    """Get IOC statistics"""
+    return jsonify(stats.ioc_stats())
 
 # Session endpoints
 @api.route('/sessions', methods=['GET'])
 def get_sessions():
-    """Get scrape sessions"""
+    """Get scrape sessions; supports the same cursor mode as /iocs"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    query = ScrapeSession.query.order_by(desc(ScrapeSession.started_at))
+    if 'cursor' in request.args:
+        return _cursor_page(ScrapeSession.query, 'sessions', ScrapeSession.started_at, ScrapeSession.id,
+                            per_page, filtered=False)
+    
+    query = ScrapeSession.query.order_by(desc(ScrapeSession.started_at), desc(ScrapeSession.id))
     
     paginated = query.paginate(
         page=page, per_page=per_page, error_out=False
@@ -269,13 +458,62 @@ def get_sessions():
         'per_page': per_page
     })
 
+@api.route('/sessions/<int:session_id>', methods=['GET'])
+def get_session(session_id):
+    """Get a scrape session, e.g. to poll a queued scrape"""
+    return jsonify(ScrapeSession.query.get_or_404(session_id).to_dict())
+
+@api.route('/sessions/<int:session_id>/profile', methods=['GET'])
+def get_session_profile(session_id):
+    """The profile report of a scrape queued with profile set, once it has
+    finished, if the worker that ran it shares PROFILE_DIR with the API"""
+    ScrapeSession.query.get_or_404(session_id)
+    path = profiling.session_profile_path(current_app.config['PROFILE_DIR'], session_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'No profile of this session'}), 404
+    with open(path, encoding='utf-8') as f:
+        return Response(f.read(), mimetype='text/plain')
+
+@api.route('/sessions/<int:session_id>/events', methods=['GET'])
+def stream_session(session_id):
+    """Stream a session as server-sent events, one per status change, until it finishes"""
+    ScrapeSession.query.get_or_404(session_id)
+    
+    def events():
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            session = db.session.get(ScrapeSession, session_id)
+            if session is None:
+                return
+            data = session.to_dict()
+            # End the transaction so the next check sees workers' commits
+            db.session.rollback()
+            if data != last:
+                yield f'event: session\ndata: {json.dumps(data)}\n\n'
+                last = data
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SESSION_EVENTS_KEEPALIVE:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            if data['status'] not in ACTIVE_STATUSES:
+                return
+            time.sleep(SESSION_EVENTS_INTERVAL)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @api.route('/sessions/<int:session_id>/iocs', methods=['GET'])
 def get_session_iocs(session_id):
     """Get IOCs for a specific session"""
     session = ScrapeSession.query.get_or_404(session_id)
-    iocs = IOC.query.filter_by(scrape_session_id=session_id).all()
+    sightings = IOCSighting.query.filter_by(scrape_session_id=session_id).options(
+        joinedload(IOCSighting.ioc)
+    ).all()
+    
+    document = session.document.content if session.document is not None else None
     
     return jsonify({
         'session': session.to_dict(),
-        'iocs': [ioc.to_dict() for ioc in iocs]
+        'iocs': [sighting.to_dict(document) for sighting in sightings]
     }) 
\ No newline at end of file
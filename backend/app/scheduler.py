@@ -0,0 +1,229 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    """Convert a naive UTC datetime from the database to a POSIX timestamp"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+class SourceScheduler:
+    """Scrape active sources every SourceURL.scrape_interval seconds.
+
+    Next-due times live in a min-heap keyed by timestamp, so each tick only
+    looks at the head of the heap. Sources are loaded once at start-up;
+    afterwards only rows whose updated_at moved are re-read, and changes made
+    through the /sources endpoints in this process are applied immediately.
+    Stale heap entries are skipped lazily using a per-source version number.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.scraper = None
+        self._heap = []
+        self._versions: Dict[int, int] = {}
+        self._running = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stopping = False
+        self._last_sync = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SCHEDULER_ENABLED', False)
+        app.config.setdefault('SCHEDULER_WORKERS', 4)
+        app.config.setdefault('SCHEDULER_JITTER', 0.1)
+        app.config.setdefault('SCHEDULER_SYNC_INTERVAL', 30)
+        app.extensions['scheduler'] = self
+        self.app = app
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Load active sources and start dispatching in a background thread"""
+        if self.running:
+            return
+        from app.extraction_pool import extraction_pool_from_environment
+        from app.scrapers import WebScraper, shared_extractor
+
+        config = self.app.config
+        self.workers = config['SCHEDULER_WORKERS']
+        self.jitter = config['SCHEDULER_JITTER']
+        self.sync_interval = config['SCHEDULER_SYNC_INTERVAL']
+        self.scraper = WebScraper(pool=extraction_pool_from_environment(), extractor=shared_extractor())
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scrape')
+        self._stopping = False
+
+        # A restart reloads every source, so entries from before a stop are dropped
+        with self._condition:
+            self._heap = []
+            self._versions = {}
+        self._load()
+        self._thread = threading.Thread(target=self._run, name='source-scheduler', daemon=True)
+        self._thread.start()
+        logger.info('Scheduler started with %d sources', len(self._versions))
+
+    def stop(self, wait: bool = True):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def run_forever(self):
+        """Start the scheduler and block, for use as a standalone service"""
+        self.start()
+        try:
+            while self.running:
+                self._thread.join(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    # Source change notifications
+
+    def source_changed(self, source):
+        """Recompute the due time of a created or updated source"""
+        if not self.running:
+            return
+        if source.active:
+            self._schedule(source.id, self._due_time(source.scrape_interval, source.last_scraped))
+        else:
+            self.source_removed(source.id)
+
+    def source_removed(self, source_id: int):
+        """Forget a deleted or deactivated source"""
+        if not self.running:
+            return
+        with self._condition:
+            # Bumping the version invalidates any heap entry for the source
+            self._versions.pop(source_id, None)
+
+    # Internals
+
+    def _due_time(self, interval: int, last_scraped: Optional[datetime]) -> float:
+        interval = max(1, interval or 3600)
+        spread = random.uniform(0, interval * self.jitter)
+        last = _timestamp(last_scraped)
+        if last is None:
+            # Never scraped: spread first runs out instead of firing all at once
+            return time.time() + spread
+        return last + interval + spread
+
+    def _schedule(self, source_id: int, due: float):
+        with self._condition:
+            version = self._versions.get(source_id, 0) + 1
+            self._versions[source_id] = version
+            heapq.heappush(self._heap, (due, source_id, version))
+            if len(self._heap) > 2 * len(self._versions) + 64:
+                # Drop superseded entries so frequent updates don't grow the heap
+                self._heap = [entry for entry in self._heap if self._versions.get(entry[1]) == entry[2]]
+                heapq.heapify(self._heap)
+            self._condition.notify_all()
+
+    def _load(self):
+        from app.models import SourceURL
+
+        with self.app.app_context():
+            self._last_sync = datetime.utcnow()
+            rows = SourceURL.query.with_entities(
+                SourceURL.id, SourceURL.scrape_interval, SourceURL.last_scraped
+            ).filter(SourceURL.active.is_(True)).all()
+        for source_id, interval, last_scraped in rows:
+            self._schedule(source_id, self._due_time(interval, last_scraped))
+
+    def _sync(self):
+        """Pick up sources changed by other processes since the last sync"""
+        from app.models import SourceURL
+
+        with self.app.app_context():
+            since = self._last_sync
+            self._last_sync = datetime.utcnow()
+            rows = SourceURL.query.with_entities(
+                SourceURL.id, SourceURL.active, SourceURL.scrape_interval, SourceURL.last_scraped
+            ).filter(SourceURL.updated_at >= since).all()
+        for source_id, active, interval, last_scraped in rows:
+            if source_id in self._running:
+                continue
+            if active:
+                self._schedule(source_id, self._due_time(interval, last_scraped))
+            else:
+                with self._condition:
+                    self._versions.pop(source_id, None)
+
+    def _run(self):
+        next_sync = time.monotonic() + self.sync_interval
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                now = time.time()
+                due = []
+                # Don't take more work than there are free workers
+                while self._heap and self._heap[0][0] <= now and len(self._running) + len(due) < self.workers:
+                    _, source_id, version = heapq.heappop(self._heap)
+                    if self._versions.get(source_id) == version and source_id not in self._running:
+                        due.append(source_id)
+                for source_id in due:
+                    self._running.add(source_id)
+
+                if not due:
+                    if self._heap and len(self._running) < self.workers:
+                        timeout = self._heap[0][0] - now
+                    else:
+                        timeout = self.sync_interval
+                    timeout = min(timeout, max(0, next_sync - time.monotonic()))
+                    self._condition.wait(timeout)
+
+            for source_id in due:
+                self._executor.submit(self._scrape, source_id)
+
+            if time.monotonic() >= next_sync:
+                try:
+                    self._sync()
+                except Exception:
+                    logger.exception('Scheduler sync failed')
+                next_sync = time.monotonic() + self.sync_interval
+
+    def _scrape(self, source_id: int):
+        from app import db, services
+        from app.models import SourceURL
+
+        # If the database is unavailable, try again at the next sync
+        due = time.time() + self.sync_interval
+        try:
+            with self.app.app_context():
+                source = db.session.get(SourceURL, source_id)
+                if source is None or not source.active:
+                    due = None
+                    return
+                try:
+                    services.scrape_source(self.scraper, source)
+                except Exception:
+                    logger.exception('Scheduled scrape of source %d failed', source_id)
+                due = self._due_time(source.scrape_interval, datetime.utcnow())
+        except Exception:
+            logger.exception('Scheduled scrape of source %d failed', source_id)
+        finally:
+            with self._condition:
+                self._running.discard(source_id)
+                if due is None:
+                    self._versions.pop(source_id, None)
+                self._condition.notify_all()
+            if due is not None:
+                self._schedule(source_id, due)
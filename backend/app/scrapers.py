@@ -1,27 +1,179 @@
+import os
 import re
+import time
+import codecs
+import functools
+import contextlib
+import hashlib
+import itertools
 import requests
-import ipaddress
 from urllib.parse import urlparse
-from typing import List, Dict, Set
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from bs4 import BeautifulSoup, Comment
+from app.allowlist import DomainAllowlist, allowlists_from_environment
+from app.feeds import FeedParser, peek
+from app.ipfilter import PRIVATE_NETWORKS, Address, IPRangeSet, excluded_networks_from_environment, parse_ip
 from app.models import IOCType
+from app.visible_text import visible_text
+
+# Patterns made of a run of these characters followed by a '.'-anchored tail
+# (e.g. filenames) can match at most once per run, so they are matched from
+# the tail instead of being retried at every word boundary inside the run.
+RUN_PREFIX = r'\b[\w\-. ]+'
+RUN_CHARS = re.compile(r'[\w\-. ]*')
+WORD_CHAR = re.compile(r'\w')
+
+# Context words that raise confidence, 0.05 each up to 0.3
+THREAT_KEYWORDS = (
+    'malware', 'threat', 'malicious', 'suspicious', 'infected', 'virus',
+    'trojan', 'backdoor', 'c2', 'command', 'control', 'botnet', 'phishing',
+    'attack', 'exploit', 'vulnerability', 'breach', 'compromise', 'incident',
+    'indicator', 'ioc', 'artifact', 'campaign', 'apt', 'actor'
+)
+SUSPICIOUS_EXTENSIONS = ('.exe', '.scr', '.bat', '.cmd', '.pif', '.com', '.dll')
+SUSPICIOUS_URL_PATTERNS = ('bit.ly', 'tinyurl', 'shortened', 'redirect')
+# Common CDN host prefixes and generic filenames, never reported
+CDN_PREFIXES = (
+    'static.', 'assets.', 'cdn.', 'img.', 'images.', 'media.',
+    'css.', 'js.', 'fonts.', 'api.', 'www.gstatic.com'
+)
+GENERIC_FILENAMES = frozenset((
+    'index.html', 'index.htm', 'main.js', 'app.js', 'jquery.js',
+    'bootstrap.css', 'style.css', 'main.css', 'app.css',
+    'favicon.ico', 'robots.txt', 'sitemap.xml', 'manifest.json'
+))
+HEX_VALUE = re.compile(r'[a-fA-F0-9]+')
+# The host of a URL shaped like the URL patterns' matches, as urlparse finds it
+URL_HOST = re.compile(r'(?:https?|ftp)://([-\w.]+)(?::[0-9]+)?(?=[/?#]|\Z)', re.IGNORECASE)
+DIGITS = re.compile(r'\d+')
+CONTEXT_SIZE = 100
+MAX_CONTEXT_SIZE = 4096
+# Non-HTML bodies up to this many bytes are read whole, so an unchanged one
+# is recognized by its digest before extraction; larger ones are streamed
+BUFFERED_BODY_SIZE = 4 * 1024 * 1024
+# Longest DNS name; longer domain matches (dotted runs) are no hosts, and
+# the allowlists would otherwise hash every one of their parent domains
+MAX_HOST_LENGTH = 253
+
+# Up to 63 characters, not ending in '-'. A label only ends at the '.'
+# after it, so the run is taken whole (possessive) rather than shortened
+# a character at a time looking for one
+DOMAIN_LABEL = r'[a-zA-Z0-9][a-zA-Z0-9\-]{0,62}+(?<!-)'
+DOMAIN_PATTERN = rf'\b(?:{DOMAIN_LABEL}\.)+[a-zA-Z]{{2,}}+\b'
+HTTP_URL_PATTERN = r'https?://(?:[-\w.])+(?::[0-9]+)?(?:/[^?\s]*)?(?:\?[^#\s]*)?(?:#[^\s]*)?'
+FTP_URL_PATTERN = r'ftp://(?:[-\w.])+(?::[0-9]+)?(?:/[^\s]*)?'
+# Patterns scanned in a finditer pass of their own rather than in the
+# single-pass scanner, which tries every pattern at every position: a URL
+# would be matched again from each scheme inside a long URL (minified
+# scripts), and a domain from each label of a dotted chain with no TLD
+# after it (1.1.1.1...), quadratic in the length of the URL or chain. The
+# value is an alternative tried where the pattern fails, consuming without
+# reporting a stretch where no match can start: the labels after a failed
+# domain start end in the same chain, so they would fail too.
+OWN_PASS_PATTERNS = {
+    DOMAIN_PATTERN: rf'\b(?:{DOMAIN_LABEL}\.)++',
+    HTTP_URL_PATTERN: None,
+    FTP_URL_PATTERN: None
+}
+
+# Matches checked between budget checks, see ExtractionBudget
+BUDGET_CHECK_INTERVAL = 64
+
+class ExtractionBudget:
+    """CPU seconds one document's IOC extraction may take.
+
+    Measured with time.thread_time from start(), in the thread doing the
+    extraction. The scan checks the budget between matches and streamed
+    windows, and once it is spent stops; the IOCs of the matches found so
+    far are still returned, and exhausted tells the caller the result is
+    truncated.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadline = None
+        self.exhausted = False
+
+    def start(self) -> 'ExtractionBudget':
+        if self.deadline is None:
+            self.deadline = time.thread_time() + self.seconds
+        return self
+
+    def spent(self) -> bool:
+        if not self.exhausted and time.thread_time() >= self.start().deadline:
+            self.exhausted = True
+        return self.exhausted
+
+# Stages of a scrape in the order they run, as timed by ScrapeTimings;
+# persist is timed by services.record_scrape_result
+SCRAPE_STAGES = ('fetch', 'parse', 'extract', 'validate', 'persist')
+
+class ScrapeTimings:
+    """Wall-clock seconds a scrape spent in each stage, the bytes it
+    fetched and what its extraction matched.
+
+    fetch is the request and reading (and decoding) the body, parse finding
+    the text to analyze (the visible text of HTML), extract the pattern scan
+    or the parse of a structured feed, and validate the validation,
+    deduplication and scoring of the matches. A streamed body is fetched
+    and extracted window by window, and the time is split between the
+    stages as it goes. matches counts the spans found and rejected those
+    that failed validation; spans repeating an IOC already found are
+    matches, but aren't validated again. Stages run in worker processes
+    are timed there, and a text split across workers reports the sum of
+    their times.
+    """
 
-class IOCExtractor:
     def __init__(self):
+        self.seconds = dict.fromkeys(SCRAPE_STAGES, 0.0)
+        self.bytes_fetched = 0
+        self.matches = 0
+        self.rejected = 0
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+
+    def merge(self, report: Dict) -> 'ScrapeTimings':
+        """Add the counts of another ScrapeTimings' to_dict, e.g. from a
+        result built in a worker process"""
+        for stage, seconds in report.get('timings', {}).items():
+            self.seconds[stage] += seconds
+        self.bytes_fetched += report.get('bytes_fetched', 0)
+        self.matches += report.get('matches', 0)
+        self.rejected += report.get('rejected', 0)
+        return self
+
+    def to_dict(self) -> Dict:
+        """The keys a scrape result reports the timings under"""
+        return {
+            'timings': {stage: seconds for stage, seconds in self.seconds.items() if seconds},
+            'bytes_fetched': self.bytes_fetched,
+            'matches': self.matches,
+            'rejected': self.rejected
+        }
+
+class IOCExtractor:
+    def __init__(self, allowlists: Optional[List[DomainAllowlist]] = None,
+                 excluded_networks: Optional[IPRangeSet] = None):
         # Regex patterns for different IOC types
         self.patterns = {
             IOCType.IP_ADDRESS: [
                 r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',  # IPv4
                 r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b',  # IPv6 full
-                r'\b(?:[0-9a-fA-F]{1,4}:){1,7}:(?:[0-9a-fA-F]{1,4}){0,7}\b'  # IPv6 compressed
-            ],
-            IOCType.DOMAIN: [
-                r'\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}\b'
-            ],
-            IOCType.URL: [
-                r'https?://(?:[-\w.])+(?::[0-9]+)?(?:/[^?\s]*)?(?:\?[^#\s]*)?(?:#[^\s]*)?',
-                r'ftp://(?:[-\w.])+(?::[0-9]+)?(?:/[^\s]*)?'
+                # IPv6 compressed; the tail, once (?:[0-9a-fA-F]{1,4}){0,7}, matches
+                # the same without trying every split of a hex run
+                r'\b(?:[0-9a-fA-F]{1,4}:){1,7}:[0-9a-fA-F]{0,28}\b'
             ],
+            IOCType.DOMAIN: [DOMAIN_PATTERN],
+            IOCType.URL: [HTTP_URL_PATTERN, FTP_URL_PATTERN],
             IOCType.HASH: [
                 r'\b[a-fA-F0-9]{32}\b',  # MD5
                 r'\b[a-fA-F0-9]{40}\b',  # SHA1
@@ -33,12 +185,13 @@ class IOCExtractor:
             ],
             IOCType.ASN: [
                 r'\bAS\d{1,10}\b',
-                r'\b(?:ASN|asn)\s*:?\s*\d{1,10}\b'
+                # Possessive: whitespace isn't split between the two runs in every way
+                r'\b(?:ASN|asn)\s*+:?\s*+\d{1,10}\b'
             ]
         }
         
         # Common false positive domains to filter out
-        self.domain_whitelist = {
+        self.domain_whitelist = DomainAllowlist({
             # Generic/Example domains
             'example.com', 'localhost', 'example.org', 'example.net', 'test.com',
             
@@ -64,117 +217,467 @@ class IOCExtractor:
             
             # Common file extensions that aren't threats when from legitimate sites
             'w3.org', 'mozilla.org', 'ietf.org', 'rfc-editor.org'
-        }
+        })
+        
+        # Additional allowlists, e.g. top-1M lists loaded from ALLOWLIST_FILES
+        if allowlists is None:
+            allowlists = allowlists_from_environment()
+        self.allowlists = [self.domain_whitelist] + list(allowlists)
         
         # Private IP ranges to potentially filter
-        self.private_ip_ranges = [
-            ipaddress.ip_network('10.0.0.0/8'),
-            ipaddress.ip_network('172.16.0.0/12'),
-            ipaddress.ip_network('192.168.0.0/16'),
-            ipaddress.ip_network('127.0.0.0/8')
-        ]
-
-    def extract_iocs(self, text: str, include_private_ips: bool = False) -> List[Dict]:
-        """Extract all IOCs from text"""
-        iocs = []
+        self.private_networks = IPRangeSet(PRIVATE_NETWORKS)
         
+        # Networks never reported, e.g. bogon or customer lists from EXCLUDED_NETWORK_FILES
+        if excluded_networks is None:
+            excluded_networks = excluded_networks_from_environment()
+        self.excluded_networks = excluded_networks
+        
+        self._compile_patterns()
+
+    def _compile_patterns(self):
+        """Precompile all patterns into a single-pass scanner, and the
+        OWN_PASS_PATTERNS into passes of their own"""
+        # Flatten patterns in declaration order so results keep the same ordering
+        self._pattern_types = []
+        self._compiled = []
+        self._run_patterns = set()
+        self._own_passes = []
+        scanned = []
+        branches = []
         for ioc_type, patterns in self.patterns.items():
             for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    value = match.group().strip()
-                    context = self._get_context(text, match.start(), match.end())
-                    
-                    # Validation and filtering
-                    if self._validate_ioc(ioc_type, value, include_private_ips):
-                        iocs.append({
-                            'type': ioc_type,
-                            'value': value,
-                            'context': context,
-                            'confidence': self._calculate_confidence(ioc_type, value, context)
-                        })
-        
-        # Remove duplicates while preserving order
+                index = len(self._pattern_types)
+                self._pattern_types.append(ioc_type)
+                if pattern in OWN_PASS_PATTERNS:
+                    skip = OWN_PASS_PATTERNS[pattern]
+                    self._own_passes.append((index, re.compile(
+                        f'(?P<match>{pattern})|{skip}' if skip else f'(?P<match>{pattern})', re.IGNORECASE
+                    )))
+                elif pattern.startswith(RUN_PREFIX + r'\.'):
+                    # Scan for the tail only, the run is recovered afterwards
+                    pattern = pattern[len(RUN_PREFIX):]
+                    self._run_patterns.add(index)
+                if pattern not in OWN_PASS_PATTERNS:
+                    branches.append(f'(?=(?P<p{index}>{pattern}))')
+                    scanned.append(index)
+                self._compiled.append(re.compile(pattern, re.IGNORECASE))
+        # Pattern index of each of the scanner's groups, one per branch, and
+        # the scanner's patterns from each pattern index on
+        self._group_patterns = [None] + scanned
+        self._scanned_from = [[index for index in scanned if index >= first]
+                              for first in range(len(self._pattern_types))]
+        
+        # The remaining patterns start at a word boundary or a '.' tail; the
+        # guard rejects all other positions before trying any branch
+        self._scanner = re.compile(
+            r'(?=\b\w|\.)(?:' + '|'.join(branches) + ')',
+            re.IGNORECASE
+        )
+    
+    def _may_match(self, text: str, start: int = 0, end: Optional[int] = None) -> bool:
+        """Whether any pattern may match in text[start:end]; False means
+        _scan would find nothing there"""
+        if end is None:
+            end = len(text)
+        return self._scanner.search(text, start, end) is not None or any(
+            own_pass.search(text, start, end) is not None for _, own_pass in self._own_passes
+        )
+
+    def _scan(self, text: str, start: int = 0, stop: Optional[int] = None,
+              next_start: Optional[List[int]] = None, end: Optional[int] = None,
+              budget: Optional[ExtractionBudget] = None) -> List[List[tuple]]:
+        """Scan text once and return (start, end) spans for every pattern.
+        
+        Spans are identical to running re.finditer separately for each pattern:
+        a pattern cannot match again before the end of its previous match.
+        Only matches starting in [start, stop) are reported; next_start carries
+        the per-pattern resume offsets between calls on consecutive windows.
+        With end, text[start:end] is scanned as a text of its own, e.g. one
+        field of a structured feed: neither matches nor filename runs reach
+        outside it. Once budget is spent the scan stops early.
+        """
+        pattern_count = len(self._pattern_types)
+        spans = [[] for _ in range(pattern_count)]
+        if next_start is None:
+            next_start = [0] * pattern_count
+        if stop is None:
+            stop = len(text)
+        lower = 0 if end is None else start
+        scan_end = len(text) if end is None else end
+        compiled = self._compiled
+        run_patterns = self._run_patterns
+        group_patterns = self._group_patterns
+        scanned_from = self._scanned_from
+        reached = scan_end
+        
+        for count, match in enumerate(self._scanner.finditer(text, start, scan_end)):
+            position = match.start()
+            if position >= stop:
+                break
+            if budget is not None and count % BUDGET_CHECK_INTERVAL == 0 and budget.spent():
+                reached = position
+                break
+            # Only the first matching branch is captured; patterns after it
+            # may match at the same position and are checked individually
+            group = match.lastindex
+            first = group_patterns[group]
+            for index in scanned_from[first]:
+                if index in run_patterns:
+                    if index == first:
+                        spans[index].append(match.span(group))
+                    continue
+                if position < next_start[index]:
+                    continue
+                if index == first:
+                    end = match.end(group)
+                else:
+                    candidate = compiled[index].match(text, position, scan_end)
+                    if candidate is None:
+                        continue
+                    end = candidate.end()
+                spans[index].append((position, end))
+                next_start[index] = end
+        
+        for index in run_patterns:
+            spans[index] = self._resolve_runs(text, spans[index], lower, scan_end)
+        
+        # Out of budget, the own passes only search as far as the scan got
+        # (a single search for a pattern that doesn't occur reads the whole
+        # text), taking matches cut at that point whole
+        for index, own_pass in self._own_passes:
+            pattern_spans = spans[index]
+            for count, match in enumerate(own_pass.finditer(text, max(start, next_start[index]), reached)):
+                if match.start() >= stop:
+                    break
+                if budget is not None and count % BUDGET_CHECK_INTERVAL == 0 and budget.spent():
+                    break
+                if match.lastgroup != 'match':
+                    continue
+                if match.end() == reached < scan_end:
+                    match = compiled[index].match(text, match.start(), scan_end)
+                    if match is None:
+                        break
+                pattern_spans.append(match.span())
+                next_start[index] = match.end()
+        
+        return spans
+
+    def _resolve_runs(self, text: str, tails: List[tuple], lower: int = 0,
+                      end: Optional[int] = None) -> List[tuple]:
+        """Turn tail matches of a run pattern into full matches.
+        
+        The greedy run backtracks to the last tail inside the run and the
+        match starts at the run's first word character, so each run yields
+        at most one match. Runs are cut at lower and end.
+        """
+        if end is None:
+            end = len(text)
+        runs = []
+        run_end = -1
+        for tail_start, tail_end in tails:
+            if tail_start < run_end:
+                # A later tail in the same run replaces the previous one
+                runs[-1][1:] = [tail_start, tail_end]
+                continue
+            
+            run_start = self._run_start(text, tail_start, lower)
+            run_end = RUN_CHARS.match(text, tail_start, end).end()
+            runs.append([WORD_CHAR.search(text, run_start).start(), tail_start, tail_end])
+        
+        # The run needs at least one character before its last tail
+        return [(start, tail_end) for start, tail_start, tail_end in runs if start < tail_start]
+
+    def _run_start(self, text: str, position: int, lower: int = 0) -> int:
+        """Walk back from position to the start of its run, not past lower"""
+        while position > lower and (text[position - 1].isalnum() or text[position - 1] in '_-. '):
+            position -= 1
+        return position
+
+    def extract_iocs(self, text: str, include_private_ips: bool = False,
+                     excluded_networks: Optional[IPRangeSet] = None,
+                     context_size: int = CONTEXT_SIZE, scanner=None,
+                     budget: Optional[ExtractionBudget] = None,
+                     timings: Optional[ScrapeTimings] = None) -> List[Dict]:
+        """Extract all IOCs from text.
+        
+        IP addresses in excluded_networks are dropped, on top of the
+        extractor's own excluded networks and, unless include_private_ips,
+        the private ranges. Each IOC's context is the text up to
+        context_size characters around it, starting at 'context_offset' in
+        text; context_size=0 leaves both out. scanner replaces the regex
+        scan of the whole text, e.g. with a FeedScanner for structured feeds.
+        With a budget, the scan stops once it is spent and the IOCs found
+        until then are returned, with budget.exhausted set; a scanner's
+        scan runs to the end before the budget is checked. The extract and
+        validate stages and the matches are added to timings.
+        """
+        timings = timings or ScrapeTimings()
+        if budget is not None:
+            budget.start()
+        next_start = [0] * len(self._pattern_types)
+        with timings.stage('extract'):
+            if scanner is not None:
+                spans = scanner.scan(text, 0, len(text), next_start)
+            else:
+                spans = self._scan(text, 0, len(text), next_start, budget=budget)
+        with timings.stage('validate'):
+            return list(self._build_iocs(
+                text, spans, include_private_ips, excluded_networks, set(), context_size, timings=timings
+            ))
+
+    def iter_iocs(self, stream: Iterable[str], include_private_ips: bool = False,
+                  window_size: int = 256 * 1024, overlap: int = 4096,
+                  excluded_networks: Optional[IPRangeSet] = None,
+                  context_size: int = CONTEXT_SIZE, scanner=None,
+                  budget: Optional[ExtractionBudget] = None,
+                  timings: Optional[ScrapeTimings] = None) -> Iterator[Dict]:
+        """Extract IOCs from a stream of text chunks, yielding them as found.
+        
+        The stream is processed in windows of about window_size characters.
+        Each window keeps overlap characters of lookahead so matches and their
+        context that cross a chunk boundary are complete, and context_size
+        characters of lookbehind for the preceding context. Duplicates are
+        dropped on the fly, so memory is bounded by the window size plus the
+        set of unique IOCs. Matches longer than the overlap may be truncated.
+        Context offsets count from the start of the stream. scanner is as
+        for extract_iocs; it also picks where each window ends. A budget
+        is checked as for extract_iocs and before each window; once spent,
+        the rest of the stream is left unread. timings is as for
+        extract_iocs; reading the stream is timed by whoever produces it.
+        """
+        timings = timings or ScrapeTimings()
+        scan = scanner.scan if scanner is not None else functools.partial(self._scan, budget=budget)
+        window_stop = scanner.window_stop if scanner is not None else self._window_stop
+        overlap = max(overlap, context_size, CONTEXT_SIZE)
+        lookbehind = max(context_size, CONTEXT_SIZE)
+        buffer = ''
+        base = 0  # stream offset of buffer[0]
+        scan_from = 0
+        next_start = [0] * len(self._pattern_types)
         seen = set()
-        unique_iocs = []
-        for ioc in iocs:
-            key = (ioc['type'], ioc['value'])
-            if key not in seen:
-                seen.add(key)
-                unique_iocs.append(ioc)
+        chunks = iter(stream)
+        finished = False
         
-        return unique_iocs
+        while not finished:
+            if budget is not None and budget.start().spent():
+                return
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) - scan_from >= window_size + overlap:
+                    break
+            else:
+                finished = True
+            
+            if finished:
+                stop = len(buffer)
+            else:
+                stop = window_stop(buffer, scan_from, len(buffer) - overlap)
+            
+            with timings.stage('extract'):
+                spans = scan(buffer, scan_from, stop, next_start)
+            with timings.stage('validate'):
+                iocs = list(self._build_iocs(
+                    buffer, spans, include_private_ips, excluded_networks, seen, context_size, base, timings
+                ))
+            yield from iocs
+            
+            # Slide the window, keeping lookbehind for context and word boundaries
+            shift = max(0, stop - lookbehind - 1)
+            buffer = buffer[shift:]
+            base += shift
+            scan_from = stop - shift
+            next_start = [position - shift for position in next_start]
+
+    def _window_stop(self, text: str, start: int, stop: int) -> int:
+        """Where a streamed window scanned from start ends instead of stop:
+        not inside a filename run, but at its start"""
+        if RUN_CHARS.match(text, stop - 1).end() > stop:
+            run_start = self._run_start(text, stop, start)
+            if run_start > start:
+                return run_start
+        return stop
+
+    def _build_iocs(self, text: str, spans: List[List[tuple]], include_private_ips: bool,
+                    excluded_networks: Optional[IPRangeSet], seen: Set[tuple],
+                    context_size: int = CONTEXT_SIZE, base: int = 0,
+                    timings: Optional[ScrapeTimings] = None) -> Iterator[Dict]:
+        """Validate, deduplicate and score scanned spans, in pattern order.
+        
+        Keys of the IOCs yielded are added to seen, and IOCs already in it
+        are skipped. Context is only cut for the IOCs that are yielded;
+        base is added to its offset. The spans and those failing validation
+        are counted in timings.
+        """
+        for _, _, ioc in self._build_indexed_iocs(
+                text, spans, include_private_ips, excluded_networks, seen, context_size, base, timings):
+            yield ioc
+
+    def _build_indexed_iocs(self, text: str, spans: List[List[tuple]], include_private_ips: bool,
+                            excluded_networks: Optional[IPRangeSet], seen: Set[tuple],
+                            context_size: int = CONTEXT_SIZE, base: int = 0,
+                            timings: Optional[ScrapeTimings] = None) -> Iterator[tuple]:
+        """_build_iocs, yielding (pattern index, start + base, ioc) so results
+        of separately scanned parts of a text can be merged in order"""
+        candidates = []
+        matches = rejected = 0
+        for index, (ioc_type, pattern_spans) in enumerate(zip(self._pattern_types, spans)):
+            matches += len(pattern_spans)
+            is_ip = ioc_type == IOCType.IP_ADDRESS
+            # Keyed on the type's value: hashing an Enum member runs Python code
+            type_key = ioc_type.value
+            for start, end in pattern_spans:
+                value = text[start:end].strip()
+                key = (type_key, value)
+                if key in seen:
+                    continue
+                # IPs are parsed once for both validation and scoring
+                address = parse_ip(value) if is_ip else None
+                
+                # Validation and filtering
+                if self._validate_ioc(ioc_type, value, include_private_ips, excluded_networks, address):
+                    seen.add(key)
+                    candidates.append((index, ioc_type, value, start, end, address))
+                else:
+                    rejected += 1
+        if timings is not None:
+            timings.matches += matches
+            timings.rejected += rejected
+        
+        if not candidates:
+            return
+        # Scoring always looks CONTEXT_SIZE around the IOC, whatever context is kept
+        threat_scores = self._threat_scores(text, [(start, end) for _, _, _, start, end, _ in candidates])
+        for (index, ioc_type, value, start, end, address), threat_score in zip(candidates, threat_scores):
+            context = offset = None
+            if context_size > 0:
+                offset, length = self._context_span(text, start, end, context_size)
+                context = text[offset:offset + length]
+                offset += base
+            yield index, start + base, {
+                'type': ioc_type,
+                'value': value,
+                'context': context,
+                'context_offset': offset,
+                'confidence': self._calculate_confidence(ioc_type, value, context, address, threat_score)
+            }
+
+    def _threat_scores(self, text: str, spans: List[tuple]) -> List[int]:
+        """Number of distinct threat keywords in the context of each span.
+        
+        The part of the text holding the contexts is lowercased once and
+        searched once for each keyword; contexts are then only searched for
+        the keywords it contains, often none or a handful of the 25.
+        """
+        if not spans:
+            return []
+        # Only as far as the spans reach, e.g. the start of a truncated scan
+        low = max(0, min(start for start, _ in spans) - CONTEXT_SIZE)
+        high = min(len(text), max(end for _, end in spans) + CONTEXT_SIZE)
+        lower = text[low:high].lower()
+        if len(lower) != high - low:
+            # Some characters lowercase to several ('İ'), so offsets into the
+            # lowered text are off; score each context on its own
+            return [self._threat_score(self._get_context(text, start, end).lower()) for start, end in spans]
+        
+        keywords = [keyword for keyword in THREAT_KEYWORDS if keyword in lower]
+        if not keywords:
+            return [0] * len(spans)
+        
+        scores = []
+        for start, end in spans:
+            # Keywords hold no whitespace, so the unstripped window scores the same
+            context_lower = lower[max(low, start - CONTEXT_SIZE) - low:min(high, end + CONTEXT_SIZE) - low]
+            scores.append(sum(map(context_lower.__contains__, keywords)))
+        return scores
+
+    def _threat_score(self, context_lower: str) -> int:
+        """Number of distinct threat keywords in a lowercased context"""
+        return sum(1 for keyword in THREAT_KEYWORDS if keyword in context_lower)
 
-    def _get_context(self, text: str, start: int, end: int, context_size: int = 100) -> str:
+    def _get_context(self, text: str, start: int, end: int, context_size: int = CONTEXT_SIZE) -> str:
         """Get surrounding context for an IOC"""
         context_start = max(0, start - context_size)
         context_end = min(len(text), end + context_size)
         return text[context_start:context_end].strip()
 
-    def _validate_ioc(self, ioc_type: IOCType, value: str, include_private_ips: bool) -> bool:
-        """Validate and filter IOCs"""
+    def _context_span(self, text: str, start: int, end: int, context_size: int = CONTEXT_SIZE) -> tuple:
+        """(offset, length) in text of the context _get_context returns"""
+        context_start = max(0, start - context_size)
+        window = text[context_start:min(len(text), end + context_size)]
+        stripped = window.lstrip()
+        return context_start + len(window) - len(stripped), len(stripped.rstrip())
+
+    def _is_allowlisted(self, host: str) -> bool:
+        """Whether a lowercased host or one of its parent domains is allowlisted"""
+        for allowlist in self.allowlists:
+            if host in allowlist:
+                return True
+        return False
+
+    def _validate_ioc(self, ioc_type: IOCType, value: str, include_private_ips: bool,
+                      excluded_networks: Optional[IPRangeSet] = None, address: Optional[Address] = None) -> bool:
+        """Validate and filter IOCs; address is value already run through parse_ip"""
         try:
             if ioc_type == IOCType.IP_ADDRESS:
-                ip = ipaddress.ip_address(value)
+                if address is None:
+                    address = parse_ip(value)
+                    if address is None:
+                        return False
                 # Filter out private IPs if not requested
-                if not include_private_ips:
-                    for private_range in self.private_ip_ranges:
-                        if ip in private_range:
-                            return False
+                if not include_private_ips and self.private_networks.contains(address):
+                    return False
+                for networks in (self.excluded_networks, excluded_networks):
+                    if networks is not None and networks.contains(address):
+                        return False
                 return True
                 
             elif ioc_type == IOCType.DOMAIN:
+                if len(value) > MAX_HOST_LENGTH:
+                    return False
                 value_lower = value.lower()
                 
-                # Check against whitelist (exact match and subdomain match)
-                if value_lower in self.domain_whitelist:
+                # Check against allowlists (exact match and subdomain match)
+                if self._is_allowlisted(value_lower):
                     return False
                 
-                # Check if it's a subdomain of whitelisted domains
-                for whitelisted in self.domain_whitelist:
-                    if value_lower.endswith('.' + whitelisted):
-                        return False
-                
                 # Must have at least one dot and valid TLD
                 if '.' not in value or len(value.split('.')[-1]) < 2:
                     return False
                 
                 # Filter out common CDN patterns
-                cdn_patterns = [
-                    'static.', 'assets.', 'cdn.', 'img.', 'images.', 'media.',
-                    'css.', 'js.', 'fonts.', 'api.', 'www.gstatic.com'
-                ]
-                if any(value_lower.startswith(pattern) for pattern in cdn_patterns):
+                if value_lower.startswith(CDN_PREFIXES):
                     return False
                 
                 return True
                 
             elif ioc_type == IOCType.URL:
-                parsed = urlparse(value)
-                if not (parsed.scheme and parsed.netloc):
-                    return False
-                
-                # Apply domain filtering to URL hosts
-                host = parsed.netloc.lower()
-                
-                # Remove port if present
-                if ':' in host:
-                    host = host.split(':')[0]
+                simple = URL_HOST.match(value)
+                if simple is not None:
+                    host = simple.group(1).lower()
+                else:
+                    parsed = urlparse(value)
+                    if not (parsed.scheme and parsed.netloc):
+                        return False
+                    
+                    # Apply domain filtering to URL hosts
+                    host = parsed.netloc.lower()
+                    
+                    # Remove port if present
+                    if ':' in host:
+                        host = host.split(':')[0]
                 
-                # Check against domain whitelist for URLs too
-                if host in self.domain_whitelist:
+                if len(host) > MAX_HOST_LENGTH:
                     return False
                 
-                # Check if it's a subdomain of whitelisted domains
-                for whitelisted in self.domain_whitelist:
-                    if host.endswith('.' + whitelisted):
-                        return False
+                # Check against allowlists for URLs too
+                if self._is_allowlisted(host):
+                    return False
                 
                 return True
                 
             elif ioc_type == IOCType.HASH:
                 # Must be hex and correct length
-                return bool(re.match(r'^[a-fA-F0-9]+$', value))
+                return HEX_VALUE.fullmatch(value) is not None
                 
             elif ioc_type == IOCType.FILENAME:
                 # Basic filename validation
@@ -182,20 +685,14 @@ class IOCExtractor:
                     return False
                 
                 # Filter out very common/generic filenames
-                generic_files = {
-                    'index.html', 'index.htm', 'main.js', 'app.js', 'jquery.js',
-                    'bootstrap.css', 'style.css', 'main.css', 'app.css',
-                    'favicon.ico', 'robots.txt', 'sitemap.xml', 'manifest.json'
-                }
-                
-                if value.lower() in generic_files:
+                if value.lower() in GENERIC_FILENAMES:
                     return False
                 
                 return True
                 
             elif ioc_type == IOCType.ASN:
                 # Extract number from ASN
-                asn_match = re.search(r'\d+', value)
+                asn_match = DIGITS.search(value)
                 if asn_match:
                     asn_num = int(asn_match.group())
                     return 1 <= asn_num <= 4294967295  # Valid ASN range
@@ -206,20 +703,18 @@ class IOCExtractor:
         
         return True
 
-    def _calculate_confidence(self, ioc_type: IOCType, value: str, context: str) -> float:
-        """Calculate confidence score for IOC"""
+    def _calculate_confidence(self, ioc_type: IOCType, value: str, context: str,
+                              address: Optional[Address] = None, threat_score: Optional[int] = None) -> float:
+        """Calculate confidence score for IOC.
+        
+        threat_score, if given, is the keyword count from _threat_scores and
+        saves searching the context again.
+        """
         confidence = 0.6  # Higher base confidence since we're analyzing visible content only
         
         # Increase confidence based on context keywords
-        threat_keywords = [
-            'malware', 'threat', 'malicious', 'suspicious', 'infected', 'virus',
-            'trojan', 'backdoor', 'c2', 'command', 'control', 'botnet', 'phishing',
-            'attack', 'exploit', 'vulnerability', 'breach', 'compromise', 'incident',
-            'indicator', 'ioc', 'artifact', 'campaign', 'apt', 'actor'
-        ]
-        
-        context_lower = context.lower()
-        threat_score = sum(1 for keyword in threat_keywords if keyword in context_lower)
+        if threat_score is None:
+            threat_score = self._threat_score(context.lower())
         confidence += min(0.3, threat_score * 0.05)  # Up to 0.3 bonus for threat context
         
         # Type-specific confidence adjustments
@@ -229,28 +724,53 @@ class IOCExtractor:
             elif len(value) == 32:  # MD5
                 confidence += 0.1
         elif ioc_type == IOCType.FILENAME:
-            suspicious_extensions = ['.exe', '.scr', '.bat', '.cmd', '.pif', '.com', '.dll']
-            if any(value.lower().endswith(ext) for ext in suspicious_extensions):
+            if value.lower().endswith(SUSPICIOUS_EXTENSIONS):
                 confidence += 0.2
         elif ioc_type == IOCType.IP_ADDRESS:
             # Non-RFC1918 IPs in visible content are more suspicious
-            try:
-                ip = ipaddress.ip_address(value)
-                if not any(ip in network for network in self.private_ip_ranges):
-                    confidence += 0.1
-            except:
-                pass
+            if address is None:
+                address = parse_ip(value)
+            if address is not None and not self.private_networks.contains(address):
+                confidence += 0.1
         elif ioc_type == IOCType.URL:
             # URLs with suspicious patterns
-            suspicious_url_patterns = ['bit.ly', 'tinyurl', 'shortened', 'redirect']
-            if any(pattern in value.lower() for pattern in suspicious_url_patterns):
+            value_lower = value.lower()
+            if any(pattern in value_lower for pattern in SUSPICIOUS_URL_PATTERNS):
                 confidence += 0.1
         
         return min(1.0, confidence)
 
+# The extractor shared by the long-running scrapers of this process, see shared_extractor
+_shared_extractor: Optional[IOCExtractor] = None
+
+def shared_extractor() -> IOCExtractor:
+    """A process-wide IOCExtractor, built on first use.
+
+    Serving processes build it before forking workers (see wsgi.py), so
+    the compiled patterns and loaded allowlists are shared copy-on-write
+    instead of built again by every worker.
+    """
+    global _shared_extractor
+    if _shared_extractor is None:
+        _shared_extractor = IOCExtractor()
+    return _shared_extractor
+
 class WebScraper:
-    def __init__(self):
-        self.extractor = IOCExtractor()
+    def __init__(self, pool=None, text_engine: Optional[str] = None, structured_feeds: Optional[bool] = None,
+                 cpu_budget: Optional[float] = None, extractor: Optional[IOCExtractor] = None):
+        self.extractor = extractor or IOCExtractor()
+        # 'lxml' finds visible text in a plain lxml tree, 'bs4' with BeautifulSoup
+        self.text_engine = text_engine or os.environ.get('VISIBLE_TEXT_ENGINE', 'lxml')
+        # JSON, CSV and plain-list feeds are parsed instead of scanned as text
+        if structured_feeds is None:
+            structured_feeds = os.environ.get('STRUCTURED_FEEDS', '1') != '0'
+        self.feeds = FeedParser(self.extractor) if structured_feeds else None
+        # CPU seconds a document's extraction may take before the result is truncated; 0 for no limit
+        if cpu_budget is None:
+            cpu_budget = float(os.environ.get('EXTRACTION_CPU_BUDGET', 0) or 0)
+        self.cpu_budget = cpu_budget
+        # Optional ExtractionPool that parses and extracts fetched HTML in worker processes
+        self.pool = pool
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -258,6 +778,18 @@ class WebScraper:
 
     def extract_visible_text(self, html_content: str) -> str:
         """Extract only user-visible text from HTML content"""
+        if self.text_engine == 'lxml':
+            try:
+                text = visible_text(html_content)
+                if text is not None:
+                    return text
+            except Exception:
+                # BeautifulSoup tries harder with markup lxml rejects
+                pass
+        return self.soup_visible_text(html_content)
+
+    def soup_visible_text(self, html_content: str) -> str:
+        """Visible text from a BeautifulSoup tree; the reference for app.visible_text"""
         try:
             soup = BeautifulSoup(html_content, 'lxml')
             
@@ -305,39 +837,312 @@ class WebScraper:
             print(f"HTML parsing failed: {e}. Using raw content.")
             return html_content
 
-    def scrape_url(self, url: str, include_private_ips: bool = False) -> Dict:
-        """Scrape a URL and extract IOCs from visible content only"""
-        try:
-            response = self.session.get(url, timeout=30)
+    def feed_format(self, text: str, content_type: str) -> Optional[str]:
+        """The structured feed format of a non-HTML body from its first
+        characters, or None to scan it as text"""
+        if self.feeds is None or 'html' in content_type:
+            return None
+        return self.feeds.detect(text, content_type)
+
+    def feed_extractor(self, feed_format: Optional[str]) -> Optional[Callable[..., List[Dict]]]:
+        """extract_iocs for process_text parsing a feed_format feed, or None
+        for the text scan"""
+        if feed_format is None:
+            return None
+        return lambda text, *args, **kwargs: self.extractor.extract_iocs(
+            text, *args, scanner=self.feeds.scanner(feed_format), **kwargs
+        )
+
+    def extraction_budget(self) -> Optional[ExtractionBudget]:
+        """A budget of cpu_budget seconds for one document, or None"""
+        return ExtractionBudget(self.cpu_budget) if self.cpu_budget > 0 else None
+
+    def analyzed_text(self, raw_content: str, content_type: str) -> Tuple[str, str]:
+        """The text to extract IOCs from and the content type label for a body"""
+        if 'html' in content_type:
+            # Extract only visible text from HTML
+            return self.extract_visible_text(raw_content), 'html_visible'
+        # For non-HTML content (plain text, JSON, XML, etc.), use as-is
+        return raw_content, 'raw'
+
+    def process_content(self, raw_content: str, content_type: str, include_private_ips: bool = False,
+                        content_digest: Optional[str] = None,
+                        excluded_networks: Optional[IPRangeSet] = None,
+                        context_size: int = CONTEXT_SIZE, keep_document: bool = False) -> Dict:
+        """Extract IOCs from a fetched body, using only visible text for HTML.
+        
+        JSON, CSV and plain-list feeds are parsed by self.feeds. If
+        content_digest matches the digest of the text to analyze, extraction
+        is skipped and the result is marked as unchanged. With keep_document
+        the analyzed text, which IOC context offsets point into, is returned
+        as 'document'. The time of each stage is reported as
+        ScrapeTimings.to_dict's.
+        """
+        timings = ScrapeTimings()
+        with timings.stage('parse'):
+            content_to_analyze, content_type_used = self.analyzed_text(raw_content, content_type)
+            feed_format = self.feed_format(raw_content, content_type)
+        return self.process_text(
+            content_to_analyze, content_type_used, len(raw_content), include_private_ips, content_digest,
+            excluded_networks, context_size, keep_document, self.feed_extractor(feed_format), timings
+        )
+
+    def process_text(self, content_to_analyze: str, content_type_used: str, content_length: int,
+                     include_private_ips: bool = False, content_digest: Optional[str] = None,
+                     excluded_networks: Optional[IPRangeSet] = None, context_size: int = CONTEXT_SIZE,
+                     keep_document: bool = False,
+                     extract_iocs: Optional[Callable[..., List[Dict]]] = None,
+                     timings: Optional[ScrapeTimings] = None) -> Dict:
+        """process_content for text already returned by analyzed_text.
+        
+        extract_iocs replaces self.extractor.extract_iocs, e.g. with
+        ExtractionPool.extract_iocs to spread a huge text over processes.
+        If extraction runs out of cpu_budget, the IOCs found until then are
+        returned with 'truncated' set. timings holds the stages timed so
+        far, such as the parse that produced the text.
+        """
+        timings = timings or ScrapeTimings()
+        result = {
+            'success': True,
+            'iocs': [],
+            'content_length': content_length,
+            'visible_content_length': len(content_to_analyze),
+            'content_type': content_type_used,
+            'content_digest': hashlib.sha256(content_to_analyze.encode('utf-8', 'replace')).hexdigest()
+        }
+        
+        if content_digest and result['content_digest'] == content_digest:
+            result['skipped'] = 'unchanged'
+        else:
+            # Extract IOCs from the processed content
+            extract_iocs = extract_iocs or self.extractor.extract_iocs
+            budget = self.extraction_budget()
+            result['iocs'] = extract_iocs(
+                content_to_analyze, include_private_ips, excluded_networks, context_size, budget=budget,
+                timings=timings
+            )
+            if budget is not None and budget.exhausted:
+                result['truncated'] = True
+            if keep_document:
+                result['document'] = content_to_analyze
+        
+        result.update(timings.to_dict())
+        return result
+
+    def iter_response_text(self, response: requests.Response, chunk_size: int = 64 * 1024,
+                           digest=None, timings: Optional[ScrapeTimings] = None,
+                           chunks: Optional[Iterator[bytes]] = None) -> Iterator[str]:
+        """Decode a streamed response body chunk by chunk.
+        
+        If digest is given (a hashlib object) it is updated with the raw bytes.
+        Reading and decoding them is timed as the fetch stage of timings.
+        chunks, the raw chunks when some were already read, replaces reading
+        the response.
+        """
+        timings = timings or ScrapeTimings()
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        if chunks is None:
+            chunks = response.iter_content(chunk_size=chunk_size)
+        while True:
+            with timings.stage('fetch'):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    text = decoder.decode(b'', final=True)
+                else:
+                    timings.bytes_fetched += len(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    text = decoder.decode(chunk)
+            if text:
+                yield text
+            if chunk is None:
+                return
+
+    def iter_iocs(self, url: str, include_private_ips: bool = False,
+                  excluded_networks: Optional[IPRangeSet] = None,
+                  context_size: int = CONTEXT_SIZE) -> Iterator[Dict]:
+        """Stream a URL and yield IOCs as they are found.
+        
+        Non-HTML bodies are never held in memory as a whole. HTML still has to
+        be parsed in one piece to find the visible text.
+        """
+        with self.session.get(url, timeout=30, stream=True) as response:
             response.raise_for_status()
-            
-            # Get raw HTML content
-            raw_content = response.text
-            
-            # Determine content type
             content_type = response.headers.get('content-type', '').lower()
             
+            scanner = None
             if 'html' in content_type:
-                # Extract only visible text from HTML
-                visible_content = self.extract_visible_text(raw_content)
-                content_to_analyze = visible_content
-                content_type_used = 'html_visible'
+                chunks = [self.extract_visible_text(response.text)]
             else:
-                # For non-HTML content (plain text, JSON, XML, etc.), use as-is
-                content_to_analyze = raw_content
-                content_type_used = 'raw'
-            
-            # Extract IOCs from the processed content
-            iocs = self.extractor.extract_iocs(content_to_analyze, include_private_ips)
+                head, chunks = peek(self.iter_response_text(response))
+                feed_format = self.feed_format(head, content_type)
+                if feed_format is not None:
+                    scanner = self.feeds.scanner(feed_format)
             
-            return {
-                'success': True,
-                'iocs': iocs,
-                'content_length': len(raw_content),
-                'visible_content_length': len(content_to_analyze),
-                'content_type': content_type_used,
-                'status_code': response.status_code
-            }
+            yield from self.extractor.iter_iocs(
+                chunks, include_private_ips, excluded_networks=excluded_networks, context_size=context_size,
+                scanner=scanner
+            )
+
+    def scrape_url(self, url: str, include_private_ips: bool = False, validators: Optional[Dict] = None,
+                   excluded_networks: Optional[IPRangeSet] = None, context_size: int = CONTEXT_SIZE,
+                   keep_document: bool = False) -> Dict:
+        """Scrape a URL and extract IOCs from visible content only.
+        
+        validators holds the etag, last_modified, body_digest and content_digest
+        returned by a previous scrape. They are sent as a conditional request and
+        compared with the new content; unchanged content is reported with a
+        'skipped' reason instead of being parsed and extracted again. The
+        validators for the next scrape are returned under 'validators'.
+        context_size and keep_document are as for process_content; keeping
+        the document of a streamed body means holding all of it in memory.
+        Results of a response, even an unchanged one, report the time of
+        each stage as ScrapeTimings.to_dict's.
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        timings = ScrapeTimings()
+        try:
+            started = time.perf_counter()
+            with self.session.get(url, timeout=30, stream=True, headers=headers) as response:
+                timings.add('fetch', time.perf_counter() - started)
+                response.raise_for_status()
+                
+                new_validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'body_digest': validators.get('body_digest'),
+                    'content_digest': validators.get('content_digest')
+                }
+                
+                if response.status_code == 304:
+                    # Not modified: keep the previous validators unless the server sent new ones
+                    return {
+                        'success': True,
+                        'skipped': 'not_modified',
+                        'iocs': [],
+                        'validators': {key: value or validators.get(key) for key, value in new_validators.items()},
+                        'status_code': response.status_code,
+                        **timings.to_dict()
+                    }
+                
+                # Determine content type
+                content_type = response.headers.get('content-type', '').lower()
+                
+                if 'html' in content_type:
+                    with timings.stage('fetch'):
+                        raw_content = response.content
+                    timings.bytes_fetched = len(raw_content)
+                    # Identical bytes need neither parsing nor extraction
+                    new_validators['body_digest'] = hashlib.sha256(raw_content).hexdigest()
+                    if new_validators['body_digest'] == validators.get('body_digest'):
+                        result = {
+                            'success': True,
+                            'skipped': 'unchanged',
+                            'iocs': [],
+                            'content_length': len(raw_content),
+                            'content_type': 'html_visible'
+                        }
+                    elif self.pool is not None:
+                        # Decode, parse and extract in a worker process
+                        result = self.pool.process(
+                            raw_content, content_type, response.encoding or response.apparent_encoding,
+                            include_private_ips, validators.get('content_digest'), excluded_networks,
+                            context_size, keep_document
+                        )
+                    else:
+                        # Get raw HTML content
+                        with timings.stage('fetch'):
+                            text = response.text
+                        result = self.process_content(
+                            text, content_type, include_private_ips, validators.get('content_digest'),
+                            excluded_networks, context_size, keep_document
+                        )
+                    result.update(timings.merge(result).to_dict())
+                    if 'content_digest' in result:
+                        new_validators['content_digest'] = result.pop('content_digest')
+                else:
+                    # For non-HTML content (plain text, JSON, XML, etc.), read up
+                    # to BUFFERED_BODY_SIZE bytes; a body that fits and is
+                    # identical needs no extraction
+                    raw_chunks = response.iter_content(chunk_size=64 * 1024)
+                    buffered = []
+                    size = 0
+                    with timings.stage('fetch'):
+                        for chunk in raw_chunks:
+                            buffered.append(chunk)
+                            size += len(chunk)
+                            if size > BUFFERED_BODY_SIZE:
+                                break
+                        else:
+                            new_validators['body_digest'] = hashlib.sha256(b''.join(buffered)).hexdigest()
+                    if size <= BUFFERED_BODY_SIZE and new_validators['body_digest'] == validators.get('body_digest'):
+                        timings.bytes_fetched = size
+                        return {
+                            'success': True,
+                            'skipped': 'unchanged',
+                            'iocs': [],
+                            'content_length': size,
+                            'content_type': 'raw',
+                            'validators': new_validators,
+                            'status_code': response.status_code,
+                            **timings.to_dict()
+                        }
+                    
+                    # Otherwise stream the body through the extractor without
+                    # buffering the rest of it; structured feeds are parsed
+                    # rather than scanned
+                    raw_chunks = itertools.chain(buffered, raw_chunks)
+                    digest = hashlib.sha256()
+                    lengths = []
+                    document = [] if keep_document else None
+                    
+                    def chunks():
+                        for chunk in self.iter_response_text(response, digest=digest, timings=timings,
+                                                             chunks=raw_chunks):
+                            lengths.append(len(chunk))
+                            if document is not None:
+                                document.append(chunk)
+                            yield chunk
+                    
+                    head, body = peek(chunks())
+                    feed_format = self.feed_format(head, content_type)
+                    budget = self.extraction_budget()
+                    iocs = list(self.extractor.iter_iocs(
+                        body, include_private_ips, excluded_networks=excluded_networks, context_size=context_size,
+                        scanner=self.feeds.scanner(feed_format) if feed_format is not None else None, budget=budget,
+                        timings=timings
+                    ))
+                    result = {
+                        'success': True,
+                        'iocs': iocs,
+                        'content_length': sum(lengths),
+                        'visible_content_length': sum(lengths),
+                        'content_type': 'raw',
+                        **timings.to_dict()
+                    }
+                    
+                    # A streamed body is only known at its end, so an unchanged
+                    # large feed still costs the extraction but not the database writes
+                    new_validators['body_digest'] = new_validators['content_digest'] = digest.hexdigest()
+                    if budget is not None and budget.exhausted:
+                        # The rest of the body was left unread, so there is no digest of it
+                        result['truncated'] = True
+                        new_validators['body_digest'] = new_validators['content_digest'] = None
+                    elif new_validators['body_digest'] == validators.get('body_digest'):
+                        result['skipped'] = 'unchanged'
+                        result['iocs'] = []
+                    if document is not None and 'skipped' not in result:
+                        result['document'] = ''.join(document)
+                
+                result['validators'] = new_validators
+                result['status_code'] = response.status_code
+                return result
             
         except requests.RequestException as e:
             return {
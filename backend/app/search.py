@@ -0,0 +1,106 @@
+import ipaddress
+import re
+from typing import Optional, Tuple
+from sqlalchemy import and_, event, inspect, or_, select, text
+from app import db
+from app.models import IOC, IOCType, ioc_value_hash
+
+HASH_VALUE = re.compile(r'[a-fA-F0-9]{32}|[a-fA-F0-9]{40}|[a-fA-F0-9]{64}|[a-fA-F0-9]{128}')
+ASN_VALUE = re.compile(r'AS\d+', re.IGNORECASE)
+
+# Trigram indexes can't serve searches shorter than one trigram
+MIN_TRIGRAM_LENGTH = 3
+
+# SQLite: an external-content FTS5 table with the trigram tokenizer, kept in
+# sync with iocs by triggers. Upserts never change value, so the update
+# trigger only fires on explicit edits.
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS iocs_fts USING fts5("
+    "value, content='iocs', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS iocs_fts_insert AFTER INSERT ON iocs BEGIN "
+    "INSERT INTO iocs_fts (rowid, value) VALUES (new.id, new.value); END",
+    "CREATE TRIGGER IF NOT EXISTS iocs_fts_delete AFTER DELETE ON iocs BEGIN "
+    "INSERT INTO iocs_fts (iocs_fts, rowid, value) VALUES ('delete', old.id, old.value); END",
+    "CREATE TRIGGER IF NOT EXISTS iocs_fts_update AFTER UPDATE OF value ON iocs BEGIN "
+    "INSERT INTO iocs_fts (iocs_fts, rowid, value) VALUES ('delete', old.id, old.value); "
+    "INSERT INTO iocs_fts (rowid, value) VALUES (new.id, new.value); END",
+)
+SQLITE_FTS_DROP = (
+    'DROP TRIGGER IF EXISTS iocs_fts_update',
+    'DROP TRIGGER IF EXISTS iocs_fts_delete',
+    'DROP TRIGGER IF EXISTS iocs_fts_insert',
+    'DROP TABLE IF EXISTS iocs_fts',
+)
+
+def create_sqlite_fts(connection) -> None:
+    """Create the FTS5 index for iocs and fill it from existing rows"""
+    for statement in SQLITE_FTS_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO iocs_fts (iocs_fts) VALUES ('rebuild')"))
+
+def drop_sqlite_fts(connection) -> None:
+    for statement in SQLITE_FTS_DROP:
+        connection.execute(text(statement))
+
+# Keep db.create_all() in step with the migrations
+@event.listens_for(IOC.__table__, 'after_create')
+def _create_fts_after_create(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_sqlite_fts(connection)
+
+def exact_match(search: str) -> Optional[Tuple[IOCType, str]]:
+    """Type and value of a search that is a complete IP address, hash or ASN"""
+    search = search.strip()
+    if HASH_VALUE.fullmatch(search):
+        return IOCType.HASH, search
+    if ASN_VALUE.fullmatch(search):
+        return IOCType.ASN, search
+    try:
+        ipaddress.ip_address(search)
+    except ValueError:
+        return None
+    return IOCType.IP_ADDRESS, search
+
+# Whether each database has iocs_fts, looked up once per engine
+_fts_tables = {}
+
+def _has_fts(connection) -> bool:
+    key = str(connection.engine.url)
+    if key not in _fts_tables:
+        _fts_tables[key] = inspect(connection).has_table('iocs_fts')
+    return _fts_tables[key]
+
+def _escape_like(search: str) -> str:
+    return search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _contains(search: str):
+    """Criterion for values containing search, case-insensitively"""
+    connection = db.session.connection()
+    if (connection.dialect.name == 'sqlite' and len(search) >= MIN_TRIGRAM_LENGTH
+            and _has_fts(connection)):
+        # A quoted FTS5 string is a phrase: consecutive trigrams, i.e. a substring
+        phrase = '"' + search.replace('"', '""') + '"'
+        matches = select(text('rowid')).select_from(text('iocs_fts')).where(
+            text('iocs_fts MATCH :phrase').bindparams(phrase=phrase)
+        )
+        return IOC.id.in_(matches)
+
+    return IOC.value.ilike(f'%{_escape_like(search)}%', escape='\\')
+
+def filter_by_value(query, search: str, ioc_type: Optional[IOCType] = None):
+    """Restrict an IOC query to values containing search, case-insensitively.
+
+    Substring searches use the pg_trgm GIN index on PostgreSQL and the
+    iocs_fts trigram table on SQLite; other databases, and searches too
+    short for trigrams, fall back to ILIKE. A complete IP address, hash or
+    ASN also matches its other spellings (e.g. a compressed IPv6 address)
+    through the unique (ioc_type, value_hash) index, unless ioc_type, the
+    query's type filter, is another type.
+    """
+    condition = _contains(search)
+    exact = exact_match(search)
+    if exact is not None and ioc_type in (None, exact[0]):
+        exact_type, value = exact
+        condition = or_(condition, and_(IOC.ioc_type == exact_type,
+                                        IOC.value_hash == ioc_value_hash(exact_type, value)))
+    return query.filter(condition)
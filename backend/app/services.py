@@ -0,0 +1,131 @@
+from flask import current_app
+from app import db, metrics, persistence, stats
+from app.models import SourceURL, ScrapeDocument, ScrapeSession
+from app.ipfilter import IPRangeSet
+from app.scrapers import SCRAPE_STAGES, WebScraper
+from datetime import datetime
+from typing import Dict, Optional
+import time
+
+def record_timings(session: ScrapeSession, result: Dict) -> None:
+    """Copy a result's stage timings and counts to its session"""
+    timings = result.get('timings', {})
+    for stage in SCRAPE_STAGES:
+        setattr(session, f'{stage}_seconds', timings.get(stage))
+    session.bytes_fetched = result.get('bytes_fetched')
+    session.matches = result.get('matches')
+    session.rejected = result.get('rejected')
+
+def record_scrape_result(session: ScrapeSession, result: Dict) -> None:
+    """Store the outcome of a scrape on its session, without committing.
+
+    Writing the IOCs is timed as the persist stage and added to the
+    result's timings; the commit that follows is not in it.
+    """
+    if result['success'] and result.get('skipped'):
+        # Content unchanged since the last scrape: nothing new to store
+        session.status = 'skipped'
+        session.skip_reason = result['skipped']
+        session.iocs_found = 0
+        session.completed_at = datetime.utcnow()
+        if session.source_url_id is not None:
+            persistence.refresh_unchanged_iocs(session.source_url_id, session.completed_at)
+
+    elif result['success']:
+        # Save IOCs to the deduplicated store in bulk, with their contexts as
+        # offsets into the analyzed text if the scrape kept it
+        session.completed_at = datetime.utcnow()
+        document = result.pop('document', None)
+        if document is not None:
+            session.document = ScrapeDocument(content=document)
+        started = time.perf_counter()
+        result['saved_iocs'] = persistence.save_iocs(
+            session.id, result['iocs'], session.completed_at, document_contexts=document is not None
+        )
+        result.setdefault('timings', {})['persist'] = time.perf_counter() - started
+        session.iocs_found = len(result['saved_iocs'])
+        # Extraction ran out of its CPU budget; the IOCs found until then are stored
+        session.truncated = result.get('truncated', False)
+        session.status = 'completed'
+
+    else:
+        session.status = 'failed'
+        session.error_message = result['error']
+        session.completed_at = datetime.utcnow()
+    record_timings(session, result)
+
+def fail_session(session: ScrapeSession, error: Exception) -> None:
+    """Mark a session as failed after an unexpected error and commit"""
+    db.session.rollback()
+    session.status = 'failed'
+    session.error_message = str(error)
+    session.completed_at = datetime.utcnow()
+    db.session.commit()
+
+def scrape_options(context_size: Optional[int] = None) -> tuple:
+    """(context_size, keep_document) for a scrape.
+
+    context_size defaults to IOC_CONTEXT_SIZE; IOC_CONTEXT_STORAGE=document
+    keeps the analyzed text with the session and stores contexts as offsets
+    into it.
+    """
+    if context_size is None:
+        context_size = current_app.config['IOC_CONTEXT_SIZE']
+    return context_size, context_size > 0 and current_app.config['IOC_CONTEXT_STORAGE'] == 'document'
+
+def store_scrape_result(session: ScrapeSession, result: Dict, source: Optional[SourceURL] = None) -> None:
+    """record_scrape_result, plus the source's validators for its next scrape"""
+    record_scrape_result(session, result)
+    if source is not None and result['success']:
+        source.last_scraped = datetime.utcnow()
+        source.set_validators(result['validators'])
+
+def run_scrape(scraper: WebScraper, session: ScrapeSession, url: str, include_private_ips: bool = False,
+               source: Optional[SourceURL] = None, excluded_networks: Optional[IPRangeSet] = None,
+               context_size: Optional[int] = None) -> Dict:
+    """Scrape a URL into an existing session and store the outcome, without
+    committing; returns the scrape result. See scrape_options for
+    context_size.
+    """
+    context_size, keep_document = scrape_options(context_size)
+
+    # Perform the scrape, conditional on the source's last content
+    validators = source.validators() if source is not None else None
+    result = scraper.scrape_url(
+        url, include_private_ips, validators, excluded_networks, context_size, keep_document
+    )
+    store_scrape_result(session, result, source)
+    return result
+
+def scrape_url(scraper: WebScraper, url: str, include_private_ips: bool = False,
+               source: Optional[SourceURL] = None, excluded_networks: Optional[IPRangeSet] = None,
+               context_size: Optional[int] = None) -> tuple:
+    """Scrape a URL inside a new session; returns (session, result)"""
+    # Create scrape session (source_url_id stays null for ad-hoc scrapes)
+    session = ScrapeSession(
+        source_url_id=source.id if source else None,
+        url=url,
+        status='running',
+        running_at=datetime.utcnow()
+    )
+    db.session.add(session)
+    db.session.commit()
+
+    try:
+        result = run_scrape(scraper, session, url, include_private_ips, source, excluded_networks, context_size)
+        db.session.commit()
+        if session.iocs_found:
+            stats.invalidate_ioc_stats()
+
+    except Exception as e:
+        fail_session(session, e)
+        metrics.observe_scrape(session)
+        raise
+
+    metrics.observe_scrape(session)
+
+    return session, result
+
+def scrape_source(scraper: WebScraper, source: SourceURL) -> tuple:
+    """Scrape a configured source; returns (session, result)"""
+    return scrape_url(scraper, source.url, source=source)
@@ -0,0 +1,71 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import IOC, IOCType
+
+def compute_ioc_stats(now: Optional[datetime] = None) -> Dict[str, int]:
+    """IOC counts per type, in total and first seen in the last 24 hours.
+
+    Per-type counts come from one GROUP BY over the (ioc_type, first_seen,
+    id) index; the 24-hour count is a range scan of ix_iocs_first_seen,
+    which is cheaper than folding it into the GROUP BY pass.
+    """
+    recent_cutoff = (now or datetime.utcnow()) - timedelta(hours=24)
+    counts = db.session.query(IOC.ioc_type, func.count()).group_by(IOC.ioc_type).all()
+
+    stats = {ioc_type.value: 0 for ioc_type in IOCType}
+    for ioc_type, count in counts:
+        stats[ioc_type.value] = count
+    stats['total'] = sum(count for _, count in counts)
+    stats['recent'] = db.session.query(func.count()).filter(IOC.first_seen >= recent_cutoff).scalar()
+    return stats
+
+class StatsCache:
+    """A value recomputed at most once per ttl seconds, or after invalidate().
+
+    Concurrent callers that find it stale wait for a single recomputation
+    instead of each running the query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0.0
+        self._generation = 0
+
+    def get(self, compute: Callable[[], Dict], ttl: float) -> Dict:
+        if self._value is not None and time.monotonic() < self._expires:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() >= self._expires:
+                generation = self._generation
+                self._value = compute()
+                # Invalidated while computing: the result may predate the change
+                if generation == self._generation:
+                    self._expires = time.monotonic() + ttl
+            return self._value
+
+    def invalidate(self):
+        self._generation += 1
+        self._expires = 0.0
+
+ioc_stats_cache = StatsCache()
+
+def ioc_stats() -> Dict[str, int]:
+    """Cached compute_ioc_stats; IOC_STATS_TTL=0 disables the cache.
+
+    Scrapes committed in this process invalidate it (see services); scrapes
+    by other processes, such as the scheduler service, show up after at
+    most IOC_STATS_TTL seconds.
+    """
+    ttl = current_app.config['IOC_STATS_TTL']
+    if ttl <= 0:
+        return compute_ioc_stats()
+    return ioc_stats_cache.get(compute_ioc_stats, ttl)
+
+def invalidate_ioc_stats():
+    ioc_stats_cache.invalidate()
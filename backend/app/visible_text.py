@@ -0,0 +1,101 @@
+from typing import Optional
+
+from lxml import etree
+
+# Elements whose text isn't visible: WebScraper's BeautifulSoup path
+# decomposes script, style, noscript and the head elements, and its
+# get_text leaves out the strings of template, rt and rp
+HIDDEN_TAGS = ('script', 'style', 'noscript', 'head', 'meta', 'link', 'title', 'template', 'rt', 'rp')
+HIDDEN_STYLES = ('display:none', 'display: none', 'visibility:hidden', 'visibility: hidden')
+HIDDEN_CLASSES = frozenset(('hidden', 'sr-only', 'visually-hidden'))
+
+# One query for everything except classes, which are whitespace-separated
+# tokens and are checked in Python the way BeautifulSoup splits them
+_HIDDEN = etree.XPath(
+    ' | '.join(f'//{tag}' for tag in HIDDEN_TAGS)
+    + ' | //*[' + ' or '.join(f"contains(@style, '{style}')" for style in HIDDEN_STYLES)
+    + " or @aria-hidden='true' or @hidden]"
+)
+_CLASSED = etree.XPath('//*[@class]')
+
+class _LeadingText:
+    """Parser target noting whether any text comes before the first element"""
+
+    def __init__(self):
+        self.started = False
+        self.found = False
+
+    def start(self, tag, attrib):
+        self.started = True
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        if not self.started and data.strip():
+            self.found = True
+
+    def close(self):
+        return self.found
+
+def _has_leading_text(html_content: str, chunk_size: int = 64 * 1024) -> bool:
+    """Whether the parser reports text before the first element, as with
+    a stray '<' at the start of a document. A tree has nowhere to keep it;
+    BeautifulSoup keeps it at the top level.
+
+    The document is fed in chunks until the first element shows up. (An
+    exception raised by the target to stop early can leave libxml2
+    looping on some malformed tags.)
+    """
+    target = _LeadingText()
+    parser = etree.HTMLParser(target=target)
+    for start in range(0, len(html_content), chunk_size):
+        parser.feed(html_content[start:start + chunk_size])
+        if target.started:
+            return target.found
+    return parser.close()
+
+def _clear_root(root):
+    """Empty a hidden html root but keep the html elements lxml nests in it
+    for text after </html>, which BeautifulSoup keeps at the top level"""
+    root.text = None
+    for child in list(root):
+        if child.tag != 'html':
+            root.remove(child)
+
+def visible_text(html_content: str) -> Optional[str]:
+    """User-visible text of an HTML document, without a BeautifulSoup tree.
+
+    Gives the same text as WebScraper.extract_visible_text with
+    BeautifulSoup: lxml parses the document with the same parser, the
+    hidden elements are found with one XPath query plus a pass over
+    elements with a class, and emptied in place, keeping their tail text.
+    Every text node is then its own run of words, as with get_text(' ').
+    Returns None for documents with text before their first element, which
+    only BeautifulSoup's tree holds. Raises lxml.etree.XMLSyntaxError for
+    documents lxml can't parse.
+    """
+    # BeautifulSoup drops a leading byte order mark before parsing
+    if html_content.startswith('\ufeff'):
+        html_content = html_content[1:]
+    parser = etree.HTMLParser()
+    parser.feed(html_content)
+    root = parser.close()
+    if root is None or _has_leading_text(html_content):
+        return None if html_content.strip() else ''
+
+    hidden = _HIDDEN(root)
+    hidden.extend(element for element in _CLASSED(root)
+                  if not HIDDEN_CLASSES.isdisjoint(element.get('class').split()))
+    for element in hidden:
+        if element is root:
+            _clear_root(root)
+        else:
+            element.clear(keep_tail=True)
+
+    # Text after </html> can end up in a second top-level element
+    elements = [*reversed(list(root.itersiblings(preceding=True))), root, *root.itersiblings()]
+    # Comments and processing instructions separate text but add none
+    return ' '.join(' '.join(
+        text for element in elements if isinstance(element.tag, str) for text in element.itertext()
+    ).split())
@@ -0,0 +1,4 @@
+"""Benchmarks for the IOC scraper backend.
+
+Run from the backend directory, e.g. ``python -m benchmarks.bench_extract``.
+"""
@@ -0,0 +1,146 @@
+"""Time IOC extraction on adversarial inputs against the original patterns.
+
+Usage: python -m benchmarks.bench_adversarial [--sizes 4000,8000,16000] [--legacy-max 8000] [--repeat 3] [--budget 0.05]
+
+Each case repeats a shape that made one of the original patterns retry
+its match from every position of a run (dotted chains with no TLD for
+domains, minified URLs, ASN followed by whitespace, ...), at each of
+--sizes characters. The extractor's time must grow linearly: doubling
+the input may at most triple it. The original patterns, one finditer
+pass each, are timed alongside up to --legacy-max characters, since they
+grow quadratically. The scan must report exactly the spans of the
+original patterns on every case, on random fuzz strings and on the
+bench_extract corpus. Finally a large adversarial document is extracted
+with a --budget seconds ExtractionBudget, which must stop it early and
+mark it truncated.
+"""
+import argparse
+import random
+import re
+import time
+
+from app.models import IOCType
+from app.scrapers import ExtractionBudget, IOCExtractor
+from benchmarks.bench_extract import _best_of, generate_corpus
+
+# The patterns as they were before they were made linear, for parity and
+# for timing the backtracking
+ORIGINAL_PATTERNS = {
+    IOCType.IP_ADDRESS: [
+        r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
+        r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b',
+        r'\b(?:[0-9a-fA-F]{1,4}:){1,7}:(?:[0-9a-fA-F]{1,4}){0,7}\b'
+    ],
+    IOCType.DOMAIN: [r'\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}\b'],
+    IOCType.URL: [
+        r'https?://(?:[-\w.])+(?::[0-9]+)?(?:/[^?\s]*)?(?:\?[^#\s]*)?(?:#[^\s]*)?',
+        r'ftp://(?:[-\w.])+(?::[0-9]+)?(?:/[^\s]*)?'
+    ],
+    IOCType.HASH: [r'\b[a-fA-F0-9]{32}\b', r'\b[a-fA-F0-9]{40}\b', r'\b[a-fA-F0-9]{64}\b', r'\b[a-fA-F0-9]{128}\b'],
+    IOCType.FILENAME: [
+        r'\b[\w\-. ]+\.(?:exe|dll|bat|cmd|scr|pif|com|jar|zip|rar|7z|tar|gz|doc|docx|xls|xlsx|pdf|js|vbs|ps1|sh)\b'
+    ],
+    IOCType.ASN: [r'\bAS\d{1,10}\b', r'\b(?:ASN|asn)\s*:?\s*\d{1,10}\b']
+}
+
+
+def _repeat(unit, size, tail=''):
+    return unit * max(1, (size - len(tail)) // len(unit)) + tail
+
+
+# name: function of the size in characters
+ADVERSARIAL_INPUTS = {
+    'dotted-digits': lambda size: 'a.' + _repeat('1.', size),
+    'labels-no-tld': lambda size: _repeat('ab.', size, '1'),
+    'ipv4-dots': lambda size: _repeat('1.', size),
+    'hyphen-labels': lambda size: _repeat('a' + '-' * 60 + '.', size, '1'),
+    'long-labels': lambda size: _repeat('a' * 70 + '.', size),
+    'filename-dots': lambda size: _repeat('a.', size),
+    'filename-spaces': lambda size: 'a' + ' ' * size + '.ex',
+    'asn-spaces': lambda size: 'ASN' + ' ' * size + 'x',
+    'url-minified': lambda size: _repeat('http://x.com/' + 'a' * 50 + ';', size),
+    'url-schemes': lambda size: _repeat('http://a', size),
+    'hex-colons': lambda size: _repeat('a:', size),
+    'ipv6-tails': lambda size: _repeat('::' + 'a' * 27 + 'g ', size),
+    'word-dashes': lambda size: _repeat('a-', size),
+    'blank-lines': lambda size: _repeat('\n\n1.2.3.', size),
+}
+
+FUZZ_TOKENS = (
+    'a', 'b', '1', '9', 'f', '.', '.', '-', ':', ' ', '_', 'http://', 'ftp://', 'ASN ', 'AS1', '.com',
+    '.exe', 'x', 'g', '::', '\n', '/', '?', '#', 'cd', 'a' * 62, 'b' * 63, 'c' * 64, '1-' * 31
+)
+
+
+def original_spans(compiled, text):
+    """Spans of each original pattern, one finditer pass each"""
+    return [[match.span() for match in pattern.finditer(text)] for pattern in compiled]
+
+
+def _fuzz_strings(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(1, 40)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='4000,8000,16000',
+                        help='comma separated input sizes in characters, each double the last')
+    parser.add_argument('--legacy-max', type=int, default=8000, help='largest size the original patterns are timed at')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fuzz', type=int, default=20000, help='random strings checked for parity')
+    parser.add_argument('--budget', type=float, default=0.05, help='CPU seconds for the budget check')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    extractor = IOCExtractor()
+    compiled = [re.compile(pattern, re.IGNORECASE) for patterns in ORIGINAL_PATTERNS.values() for pattern in patterns]
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f'{"case":>16} {"size":>8} {"original":>10} {"extract":>10}')
+    worst = (0.0, None)
+    for name, generate in ADVERSARIAL_INPUTS.items():
+        rates = []
+        for size in sizes:
+            text = generate(size)
+            legacy = '-'
+            if size <= args.legacy_max:
+                legacy_time, expected = _best_of(lambda: original_spans(compiled, text), 1)
+                legacy = f'{legacy_time * 1000:.1f}ms'
+                if extractor._scan(text) != expected:
+                    raise SystemExit(f'{name}: spans differ from the original patterns at {size} characters')
+            elapsed, _ = _best_of(lambda: extractor.extract_iocs(text), args.repeat)
+            rates.append((elapsed, elapsed / len(text)))
+            worst = max(worst, (elapsed / len(text), name))
+            print(f'{name:>16} {len(text):>8} {legacy:>10} {elapsed * 1000:>8.1f}ms')
+        # Time per character may grow by half from one size to the next,
+        # i.e. tripled time for a doubled input; shorter times are too noisy
+        (elapsed, rate), (_, previous_rate) = rates[-1], rates[-2]
+        if elapsed > 0.005 and rate > 1.5 * previous_rate:
+            raise SystemExit(f'{name}: extraction grows faster than the input')
+    print(f'worst case: {worst[1]}, {worst[0] * 1e6:.2f}us per character')
+
+    for text in _fuzz_strings(args.fuzz, args.seed):
+        if extractor._scan(text) != original_spans(compiled, text):
+            raise SystemExit(f'Spans differ from the original patterns on {text!r}')
+    corpus = generate_corpus(1024 * 1024, seed=args.seed)
+    if extractor._scan(corpus) != original_spans(compiled, corpus):
+        raise SystemExit('Spans differ from the original patterns on the corpus')
+    print(f'spans equal on {len(ADVERSARIAL_INPUTS)} cases, {args.fuzz} fuzz strings and a 1MB corpus')
+
+    document = ' '.join(generate(sizes[-1]) for generate in ADVERSARIAL_INPUTS.values()) * 64
+    budget = ExtractionBudget(args.budget)
+    started = time.thread_time()
+    iocs = extractor.extract_iocs(document, budget=budget)
+    spent = time.thread_time() - started
+    print(f'budget {args.budget}s on {len(document) / 2 ** 20:.1f}MB: stopped after {spent:.3f}s CPU, '
+          f'{len(iocs)} IOCs, truncated={budget.exhausted}')
+    if not budget.exhausted:
+        raise SystemExit('The document was extracted within the budget; raise its size')
+    if spent > args.budget * 2 + 0.05:
+        raise SystemExit('Extraction ran well past its budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Measure allowlist lookups against a large domain list.
+
+Usage: python -m benchmarks.bench_allowlist [--entries 1000000] [--checks 200000]
+
+Writes a synthetic top-list file of --entries domains in Tranco's
+rank,domain format, loads it as a FileAllowlist and times membership checks
+for a mix of listed domains, their subdomains and unlisted hosts. The old
+loop over every entry with endswith() is timed on a small sample and must
+agree with the suffix lookups on it.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.allowlist import DomainAllowlist, FileAllowlist, registered_domain
+
+WORDS = ['alpha', 'bravo', 'cloud', 'data', 'edge', 'files', 'global', 'host', 'info', 'jet',
+         'kilo', 'link', 'media', 'net', 'online', 'portal', 'quick', 'relay', 'secure', 'tech']
+TLDS = ['com', 'net', 'org', 'io', 'de', 'ru', 'co.uk', 'com.br', 'info', 'xyz']
+
+
+def generate_domains(count, seed=1):
+    rng = random.Random(seed)
+    return [f'{rng.choice(WORDS)}{rng.choice(WORDS)}{i}.{rng.choice(TLDS)}' for i in range(count)]
+
+
+def generate_hosts(domains, count, seed=2):
+    """Listed domains, subdomains of listed domains and unlisted hosts"""
+    rng = random.Random(seed)
+    hosts = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            hosts.append(rng.choice(domains))
+        elif kind == 1:
+            hosts.append(f'{rng.choice(WORDS)}.{rng.choice(WORDS)}.{rng.choice(domains)}')
+        else:
+            hosts.append(f'{rng.choice(WORDS)}-{i}.unlisted-{rng.choice(WORDS)}.{rng.choice(TLDS)}')
+    return hosts
+
+
+def legacy_contains(domains, host):
+    if host in domains:
+        return True
+    for listed in domains:
+        if host.endswith('.' + listed):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--legacy-checks', type=int, default=30)
+    args = parser.parse_args()
+
+    domains = generate_domains(args.entries)
+    hosts = generate_hosts(domains, args.checks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'top-1m.csv')
+        with open(path, 'w') as f:
+            f.writelines(f'{rank},{domain}\n' for rank, domain in enumerate(domains, 1))
+
+        started = time.perf_counter()
+        allowlist = FileAllowlist([path], reload_interval=0)
+        print(f'load {len(allowlist)} entries: {time.perf_counter() - started:.2f}s')
+
+        plain = DomainAllowlist(domains)
+        for name, lookup in (('suffix set', plain), ('suffix set + psl', allowlist)):
+            started = time.perf_counter()
+            hits = sum(host in lookup for host in hosts)
+            elapsed = time.perf_counter() - started
+            print(f'{name:>18}: {len(hosts) / elapsed:10.0f} checks/sec ({hits} listed)')
+
+        sample = hosts[:args.legacy_checks]
+        started = time.perf_counter()
+        expected = [legacy_contains(plain.domains, host) for host in sample]
+        elapsed = time.perf_counter() - started
+        print(f'{"endswith loop":>18}: {len(sample) / elapsed:10.1f} checks/sec (on {len(sample)} hosts)')
+        assert [host in plain for host in sample] == expected, 'suffix lookup disagrees with the endswith loop'
+        assert [host in allowlist for host in sample] == expected, 'file allowlist disagrees with the endswith loop'
+
+        # Entries at a public suffix must not cover every subdomain under it
+        allowlist.add('github.io')
+        assert 'evil.github.io' not in allowlist and registered_domain('a.evil.github.io') == 'evil.github.io'
+
+        # Hot reload picks up a rewritten file
+        with open(path, 'a') as f:
+            f.write(f'{args.entries + 1},newly-listed.example\n')
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        started = time.perf_counter()
+        reloaded = allowlist.reload(force=False)
+        print(f'reload: {time.perf_counter() - started:.2f}s')
+        assert reloaded and 'www.newly-listed.example' in allowlist
+
+
+if __name__ == '__main__':
+    main()
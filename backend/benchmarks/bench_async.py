@@ -0,0 +1,89 @@
+"""Compare sequential and concurrent scraping against a local stub server.
+
+Usage: python -m benchmarks.bench_async [--pages 200] [--hosts 4] [--latency 0.05]
+
+The stub server listens on several loopback addresses (one per simulated
+host), answers every request after a fixed latency and serves a small
+synthetic threat report.
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.async_scraper import AsyncWebScraper
+from app.scrapers import WebScraper
+from benchmarks.bench_extract import generate_corpus
+
+
+def start_stub_servers(hosts, latency, body, content_type=None):
+    """Start one threaded HTTP server per loopback host; returns base URLs.
+
+    body is served as a paragraph of an HTML page, or as it is with
+    content_type.
+    """
+    if content_type is None:
+        payload = f'<html><body><p>{body}</p></body></html>'.encode()
+        content_type = 'text/html; charset=utf-8'
+    else:
+        payload = body.encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    base_urls = []
+    for index in range(hosts):
+        server = ThreadingHTTPServer((f'127.0.0.{index + 1}', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_urls.append(f'http://127.0.0.{index + 1}:{server.server_address[1]}')
+    return base_urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--per-host', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='server latency per request in seconds')
+    parser.add_argument('--page-size', type=int, default=8 * 1024, help='characters of text per page')
+    args = parser.parse_args()
+
+    base_urls = start_stub_servers(args.hosts, args.latency, generate_corpus(args.page_size))
+    urls = [f'{base_urls[index % args.hosts]}/report/{index}' for index in range(args.pages)]
+
+    scraper = WebScraper()
+    started = time.perf_counter()
+    sequential = [scraper.scrape_url(url) for url in urls]
+    sequential_time = time.perf_counter() - started
+
+    async_scraper = AsyncWebScraper(scraper, per_host=args.per_host)
+    started = time.perf_counter()
+    concurrent = async_scraper.scrape_many(urls)
+    concurrent_time = time.perf_counter() - started
+
+    failures = sum(not result['success'] for result in sequential + concurrent)
+    if failures:
+        raise SystemExit(f'{failures} scrapes failed')
+    if [result['iocs'] for result in sequential] != [result['iocs'] for result in concurrent]:
+        raise SystemExit('Sequential and concurrent results differ')
+
+    print(f'{args.pages} pages, {args.hosts} hosts, {args.latency * 1000:.0f} ms latency')
+    print(f'sequential: {args.pages / sequential_time:8.1f} pages/sec')
+    print(f'concurrent: {args.pages / concurrent_time:8.1f} pages/sec '
+          f'({sequential_time / concurrent_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Compare one /scrape/batch call with a /scrape/adhoc call per URL.
+
+Usage: python -m benchmarks.bench_batch [--urls 500] [--hosts 8] [--latency 0.2] [--database-url URL]
+
+Serves synthetic reports from a stub server on --hosts loopback
+addresses, each answering after --latency seconds, and scrapes --urls of
+them through the job queue twice: queued one by one, each job fetched and
+committed on its own by one of the workers, and queued as one batch,
+whose jobs the workers claim in groups, fetch concurrently with a
+per-host limit and store in bulk. Reports URLs per second from the first
+request to the last result, and checks both ways found the same number of
+IOCs per URL. Every page holds the same IOCs, the worst case for row
+locks between workers storing results at the same time. The batch's results are read back through the streamed
+/scrape/batch response. Without --database-url a temporary SQLite file
+is used; a PostgreSQL database must have the schema (flask db upgrade).
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.bench_async import start_stub_servers
+from benchmarks.bench_extract import generate_corpus
+
+
+def _make_app(database_url, args):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db
+    app = create_app()
+    app.config['JOB_WORKERS'] = args.workers
+    app.config['JOB_POLL_INTERVAL'] = 0.1
+    app.config['JOB_BATCH_SIZE'] = args.batch_size
+    app.config['JOB_BATCH_PER_HOST'] = args.per_host
+    if database_url.startswith('sqlite'):
+        with app.app_context():
+            db.create_all()
+    return app
+
+
+def _wait(app, session_ids):
+    """Final sessions by id once none is pending or running"""
+    from app import db
+    from app.jobs import ACTIVE_STATUSES
+    from app.models import ScrapeSession
+
+    with app.app_context():
+        while True:
+            sessions = ScrapeSession.query.filter(ScrapeSession.id.in_(session_ids)).all()
+            if all(session.status not in ACTIVE_STATUSES for session in sessions):
+                return {session.id: session.to_dict() for session in sessions}
+            db.session.rollback()
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=500)
+    parser.add_argument('--hosts', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help='server latency per request in seconds')
+    parser.add_argument('--page-size', type=int, default=8 * 1024, help='characters of text per page')
+    parser.add_argument('--workers', type=int, default=4, help='job worker threads')
+    parser.add_argument('--batch-size', type=int, default=50, help='jobs of a batch a worker claims at once')
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url, args)
+    from app import db, job_queue
+
+    base_urls = start_stub_servers(args.hosts, args.latency, generate_corpus(args.page_size))
+    urls = [f'{base_urls[index % args.hosts]}/report/{index}' for index in range(args.urls)]
+    client = app.test_client()
+    job_queue.start()
+
+    started = time.perf_counter()
+    session_ids = [client.post('/api/scrape/adhoc', json={'url': url}).json['id'] for url in urls]
+    single = _wait(app, session_ids)
+    single_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = client.post('/api/scrape/batch', json={'urls': urls, 'stream': True})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    batch_time = time.perf_counter() - started
+    job_queue.stop()
+
+    batch = {line['session']['url']: line['session'] for line in lines if 'session' in line}
+    summary = lines[-1]['summary']
+    by_url = {session['url']: session for session in single.values()}
+    failed = [url for url in urls if by_url[url]['status'] != 'completed' or batch[url]['status'] != 'completed']
+    if failed:
+        raise SystemExit(f'{len(failed)} scrapes failed, e.g. {failed[0]}')
+    if any(by_url[url]['iocs_found'] != batch[url]['iocs_found'] for url in urls):
+        raise SystemExit('Batch and single scrapes found different IOCs')
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f'{dialect}: {args.urls} URLs on {args.hosts} hosts, {args.latency * 1000:.0f} ms latency, '
+          f'{args.workers} workers')
+    print(f'one by one: {args.urls / single_time:8.1f} URLs/sec')
+    print(f'batch:      {args.urls / batch_time:8.1f} URLs/sec ({single_time / batch_time:.1f}x); '
+          f'server reported {summary["urls_per_second"]} URLs/sec, {summary["iocs_found"]} IOCs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Compare batch confidence scoring against scoring each IOC's context.
+
+Usage: python -m benchmarks.bench_confidence [--size-mb 2] [--repeat 10] [--keyword-density 0.02]
+
+Scans synthetic documents, validates the candidates and scores them both
+ways: the old per-IOC loop (lowercase the context, test every keyword) and
+IOCExtractor._threat_scores, which lowercases the document once and only
+looks for the keywords it contains. Scores must be identical. The report
+is prose with --keyword-density extra threat keywords mixed in; the feed
+is one IOC per line under a short header.
+"""
+import argparse
+import ipaddress
+import random
+
+from app.ipfilter import PRIVATE_NETWORKS, parse_ip
+from app.models import IOCType
+from app.scrapers import THREAT_KEYWORDS, IOCExtractor
+from benchmarks.bench_extract import _best_of, _random_ioc, generate_corpus
+
+PRIVATE_RANGES = [ipaddress.ip_network(network) for network in PRIVATE_NETWORKS]
+
+
+def legacy_confidence(extractor, ioc_type, value, context):
+    """_calculate_confidence as it was, per IOC"""
+    confidence = 0.6
+    threat_keywords = [
+        'malware', 'threat', 'malicious', 'suspicious', 'infected', 'virus',
+        'trojan', 'backdoor', 'c2', 'command', 'control', 'botnet', 'phishing',
+        'attack', 'exploit', 'vulnerability', 'breach', 'compromise', 'incident',
+        'indicator', 'ioc', 'artifact', 'campaign', 'apt', 'actor'
+    ]
+    context_lower = context.lower()
+    threat_score = sum(1 for keyword in threat_keywords if keyword in context_lower)
+    confidence += min(0.3, threat_score * 0.05)
+
+    if ioc_type == IOCType.HASH:
+        if len(value) == 64:
+            confidence += 0.15
+        elif len(value) == 32:
+            confidence += 0.1
+    elif ioc_type == IOCType.FILENAME:
+        suspicious_extensions = ['.exe', '.scr', '.bat', '.cmd', '.pif', '.com', '.dll']
+        if any(value.lower().endswith(ext) for ext in suspicious_extensions):
+            confidence += 0.2
+    elif ioc_type == IOCType.IP_ADDRESS:
+        ip = ipaddress.ip_address(value)
+        if not any(ip in network for network in PRIVATE_RANGES):
+            confidence += 0.1
+    elif ioc_type == IOCType.URL:
+        suspicious_url_patterns = ['bit.ly', 'tinyurl', 'shortened', 'redirect']
+        if any(pattern in value.lower() for pattern in suspicious_url_patterns):
+            confidence += 0.1
+    return min(1.0, confidence)
+
+
+def candidates(extractor, text):
+    """Validated (type, value, start, end, address) in the order _build_iocs scores them"""
+    found = []
+    for ioc_type, spans in zip(extractor._pattern_types, extractor._scan(text)):
+        for start, end in spans:
+            value = text[start:end].strip()
+            address = parse_ip(value) if ioc_type == IOCType.IP_ADDRESS else None
+            if extractor._validate_ioc(ioc_type, value, False, address=address):
+                found.append((ioc_type, value, start, end, address))
+    return found
+
+
+def generate_feed(size, seed=1):
+    rng = random.Random(seed)
+    lines = ['# Botnet C2 indicators, updated hourly']
+    length = 0
+    while length < size:
+        ioc = _random_ioc(rng)
+        lines.append(ioc)
+        length += len(ioc) + 1
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=2)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--keyword-density', type=float, default=0.02)
+    args = parser.parse_args()
+
+    extractor = IOCExtractor(allowlists=[])
+    size = int(args.size_mb * 1024 * 1024)
+    rng = random.Random(3)
+    report = ' '.join(rng.choice(THREAT_KEYWORDS) if rng.random() < args.keyword_density else word
+                      for word in generate_corpus(size).split(' '))
+    feed = generate_feed(size)
+
+    for name, text in (('report', report), ('feed', feed)):
+        found = candidates(extractor, text)
+
+        def per_ioc():
+            return [legacy_confidence(extractor, ioc_type, value, extractor._get_context(text, start, end))
+                    for ioc_type, value, start, end, _ in found]
+
+        def batch():
+            scores = extractor._threat_scores(text, [(start, end) for _, _, start, end, _ in found])
+            return [extractor._calculate_confidence(ioc_type, value, '', address, score)
+                    for (ioc_type, value, _, _, address), score in zip(found, scores)]
+
+        old, expected = _best_of(per_ioc, args.repeat)
+        new, actual = _best_of(batch, args.repeat)
+        assert actual == expected, f'{name}: batch scores differ from per-IOC scores'
+        print(f'{name:>6}: {len(found)} IOCs in {len(text) / 1024 / 1024:.1f} MB: per-IOC {old * 1000:.1f} ms, '
+              f'batch {new * 1000:.1f} ms ({old / new:.1f}x)')
+
+    # Overlapping keywords, prefixes of each other, and text whose lowercase is longer
+    for sample in ('ioc2 1.2.3.4 c2c2 botnetattack', 'İstanbul apt actor 8.8.8.8 trojan',
+                   'malwaremalicious 5.6.7.8 ' + ' '.join(THREAT_KEYWORDS)):
+        spans = [(start, end) for _, _, start, end, _ in candidates(extractor, sample)]
+        expected = [extractor._threat_score(extractor._get_context(sample, start, end).lower())
+                    for start, end in spans]
+        assert extractor._threat_scores(sample, spans) == expected, sample
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Measure /api/iocs/export throughput and memory against loading every IOC.
+
+Usage: python -m benchmarks.bench_export [--rows 1000000] [--formats ndjson,csv,stix] [--database-url URL]
+
+Seeds --rows synthetic IOCs (as bench_search does, skipped if the table
+already holds that many), then exports the newest quarter, half and all
+of them with the since filter, each in a fresh process, and reports rows
+per second and how far the process's peak RSS grew during the export.
+The streamed export must stay flat as the row count doubles; the old way
+of exporting, every IOC loaded through the ORM and serialized with
+to_dict, is measured alongside and grows with the rows. Every exported
+row is counted and must match the filter. Without --database-url a
+temporary SQLite file is used; with a PostgreSQL URL the schema must exist.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.bench_search import _make_app, seed
+
+# seed_rows spaces the rows' first and last seen times this far apart
+SEED_START = datetime(2024, 1, 1)
+SEED_STEP = timedelta(seconds=7)
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure(database_url, mode, since):
+    """Export the IOCs seen since then in this process; prints rows, bytes,
+    seconds and RSS growth as JSON"""
+    app = _make_app(database_url)
+    from app import db
+    from app.models import IOC
+
+    client = app.test_client()
+    with app.app_context():
+        db.session.query(IOC.id).limit(1).all()
+    baseline = _peak_rss()
+    started = time.perf_counter()
+    if mode == 'orm':
+        # The old way: every row as an IOC entity, serialized in one piece
+        with app.app_context():
+            iocs = IOC.query.filter(IOC.last_seen >= since).order_by(IOC.id).all()
+            body = json.dumps([ioc.to_dict() for ioc in iocs])
+            rows, size = len(iocs), len(body)
+    else:
+        response = client.get('/api/iocs/export', query_string={'format': mode, 'since': since.isoformat()})
+        assert response.status_code == 200, response.status_code
+        rows = size = 0
+        tail = b''
+        for chunk in response.response:
+            chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+            size += len(chunk)
+            if mode == 'stix':
+                rows += chunk.count(b'"type": "indicator"')
+            else:
+                rows += chunk.count(b'\n')
+            tail = chunk
+        response.close()
+        if mode == 'csv':
+            rows -= 1  # header
+        if mode == 'stix':
+            assert tail.endswith(b']}\n'), 'bundle not closed'
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'rows': rows, 'bytes': size, 'seconds': elapsed, 'rss_growth': _peak_rss() - baseline}))
+
+
+def _run(database_url, mode, since):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_export', '--database-url', database_url,
+         '--measure', mode, '--since', since.isoformat()],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--formats', default='ndjson,csv,stix')
+    parser.add_argument('--database-url')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--since', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        _measure(args.database_url, args.measure, datetime.fromisoformat(args.since))
+        return
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url)
+
+    from app import db
+    from app.models import IOC
+
+    with app.app_context():
+        total = seed(db, IOC, args.rows)
+        dialect = db.engine.dialect.name
+    print(f'{dialect}: {total} rows')
+    print(f'{"export":>8} {"rows":>9} {"size":>9} {"rows/s":>9} {"RSS growth":>11}')
+
+    last = SEED_START + SEED_STEP * (total - 1)
+    for mode in args.formats.split(',') + ['orm']:
+        growth = []
+        for rows in (args.rows // 4, args.rows // 2, args.rows):
+            result = _run(database_url, mode, last - SEED_STEP * (rows - 1))
+            assert result['rows'] == rows, f'{mode}: exported {result["rows"]} rows, expected {rows}'
+            growth.append(result['rss_growth'])
+            print(f'{mode:>8} {rows:>9} {result["bytes"] / 2 ** 20:>7.1f}MB {rows / result["seconds"]:>9.0f} '
+                  f'{result["rss_growth"] / 2 ** 20:>9.1f}MB')
+        if mode != 'orm':
+            # Flat: doubling the rows adds no more than a few MB
+            assert growth[2] - growth[1] < 16 * 2 ** 20, f'{mode}: memory grows with the export'
+
+
+if __name__ == '__main__':
+    main()
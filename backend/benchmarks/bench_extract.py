@@ -0,0 +1,118 @@
+"""Compare single-pass IOC extraction against the per-pattern loop.
+
+Usage: python -m benchmarks.bench_extract [--sizes 1,2,5] [--repeat 3] [--seed 1]
+
+Sizes are in megabytes. Every run also checks that both engines return
+exactly the same IOC list.
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from app.scrapers import IOCExtractor
+
+WORDS = (
+    'the attacker used a malicious loader to deliver the payload while the '
+    'campaign targeted finance sectors observed command and control traffic '
+    'report analysis indicator threat actor infrastructure was hosted on'
+).split()
+
+
+def _random_ioc(rng):
+    kind = rng.randrange(10)
+    if kind == 0:
+        return '.'.join(str(rng.randrange(256)) for _ in range(4))
+    if kind == 1:
+        return ':'.join('%x' % rng.randrange(65536) for _ in range(rng.choice((3, 8)))) + rng.choice(('', '::1'))
+    if kind == 2:
+        return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))) + rng.choice(('.com', '.net', '.ru', '.info'))
+    if kind == 3:
+        host = ''.join(rng.choice(string.ascii_lowercase) for _ in range(8)) + '.org'
+        return f'{rng.choice(("http", "https", "ftp"))}://{host}/{rng.randrange(10**6)}/gate.php?id={rng.randrange(999)}'
+    if kind == 4:
+        return ''.join(rng.choice('0123456789abcdef') for _ in range(rng.choice((32, 40, 64, 128))))
+    if kind == 5:
+        return ''.join(rng.choice(string.ascii_letters) for _ in range(6)) + rng.choice(('.exe', '.dll', '.ps1', '.zip', '.docx'))
+    if kind == 6:
+        return rng.choice(('AS', 'ASN ', 'asn: ')) + str(rng.randrange(1, 400000))
+    if kind == 7:
+        return '10.0.%d.%d' % (rng.randrange(256), rng.randrange(256))
+    if kind == 8:
+        return 'cdn.example.com'
+    return ''.join(rng.choice('0123456789abcdef:') for _ in range(rng.randint(10, 50)))
+
+
+def generate_corpus(size, seed=1, ioc_density=0.05):
+    """Build roughly size characters of prose with embedded IOCs"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        token = _random_ioc(rng) if rng.random() < ioc_density else rng.choice(WORDS)
+        if rng.random() < 0.08:
+            token += rng.choice(('.', ',', '\n'))
+        parts.append(token)
+        length += len(token) + 1
+    return ' '.join(parts)
+
+
+def legacy_extract(extractor, text, include_private_ips=False):
+    """Reference implementation: one re.finditer pass per pattern"""
+    iocs = []
+    for ioc_type, patterns in extractor.patterns.items():
+        for pattern in patterns:
+            for match in re.finditer(pattern, text, re.IGNORECASE):
+                value = match.group().strip()
+                context = extractor._get_context(text, match.start(), match.end())
+                if extractor._validate_ioc(ioc_type, value, include_private_ips):
+                    iocs.append({
+                        'type': ioc_type,
+                        'value': value,
+                        'context': context,
+                        'context_offset': extractor._context_span(text, match.start(), match.end())[0],
+                        'confidence': extractor._calculate_confidence(ioc_type, value, context)
+                    })
+    seen = set()
+    unique_iocs = []
+    for ioc in iocs:
+        key = (ioc['type'], ioc['value'])
+        if key not in seen:
+            seen.add(key)
+            unique_iocs.append(ioc)
+    return unique_iocs
+
+
+def _best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,2,5', help='comma separated corpus sizes in MB')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    extractor = IOCExtractor()
+    print(f"{'size':>8} {'iocs':>8} {'per-pattern':>12} {'single-pass':>12} {'speedup':>8}")
+    for size_mb in (float(size) for size in args.sizes.split(',')):
+        text = generate_corpus(int(size_mb * 1024 * 1024), seed=args.seed)
+        legacy_time, expected = _best_of(lambda: legacy_extract(extractor, text), args.repeat)
+        single_time, actual = _best_of(lambda: extractor.extract_iocs(text), args.repeat)
+        if actual != expected:
+            raise SystemExit(f'Mismatch on {size_mb} MB corpus: {len(actual)} vs {len(expected)} IOCs')
+        print(f'{size_mb:>6.1f}MB {len(actual):>8} {legacy_time:>11.3f}s {single_time:>11.3f}s '
+              f'{legacy_time / single_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Compare structured-feed parsing against scanning feeds as text.
+
+Usage: python -m benchmarks.bench_feeds [--records 100000] [--repeat 3] [--window 65536]
+
+Generates a plain list, an abuse.ch-style CSV, NDJSON records and a STIX
+2.1 bundle of --records indicators each, and times IOC extraction with
+the text scan and with the feed's parser, in total and for finding the
+spans alone, before validation and scoring. Every indicator written to a
+feed must come out of its parser, and for lists, where the text scan sees
+clean value boundaries too, every parsed IOC must equal the text scan's.
+Streaming a feed through windows of --window characters must give
+the same IOCs as parsing it whole.
+"""
+import argparse
+import json
+import random
+import string
+import uuid
+
+from app.scrapers import WebScraper
+from benchmarks.bench_extract import _best_of
+
+
+def _random_indicator(rng):
+    """(STIX object path, value) of a random indicator"""
+    kind = rng.randrange(6)
+    if kind == 0:
+        return 'ipv4-addr:value', '.'.join([str(rng.randrange(11, 100))] + [str(rng.randrange(256)) for _ in range(3)])
+    if kind == 1:
+        return 'domain-name:value', ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 14))) \
+            + rng.choice(('.com', '.net', '.ru', '.info', '.xyz'))
+    if kind == 2:
+        host = ''.join(rng.choice(string.ascii_lowercase) for _ in range(10)) + '.top'
+        return 'url:value', f'http://{host}/{rng.randrange(10**6)}/bins/{rng.choice(("x86", "arm7", "mips"))}'
+    if kind == 3:
+        return "file:hashes.'SHA-256'", ''.join(rng.choice('0123456789abcdef') for _ in range(64))
+    if kind == 4:
+        return 'file:hashes.MD5', ''.join(rng.choice('0123456789abcdef') for _ in range(32))
+    return 'file:name', ''.join(rng.choice(string.ascii_letters) for _ in range(8)) + rng.choice(('.exe', '.dll'))
+
+
+FEED_FORMATS = ('list', 'csv', 'ndjson', 'stix')
+
+
+def generate_feeds(records, seed=1):
+    """{format: (text, content type, indicators written)}"""
+    return {feed_format: generate_feed(feed_format, records, seed) for feed_format in FEED_FORMATS}
+
+
+def generate_feed(feed_format, records, seed=1, header=True):
+    """(text, content type, indicators written) of one feed format; without
+    header, list and CSV feeds leave out their leading comment lines"""
+    rng = random.Random(seed)
+    indicators = [_random_indicator(rng) for _ in range(records)]
+    values = [value for _, value in indicators]
+
+    if feed_format == 'list':
+        lines = ['# Blocklist, one indicator per line', '# Updated daily', ''] if header else []
+        for index, value in enumerate(values):
+            if index % 1000 == 0:
+                lines.append(f'# --- block {index} ---')
+            lines.append(value)
+        return '\n'.join(lines) + '\n', 'text/plain', values
+
+    if feed_format == 'csv':
+        lines = ['################################################################',
+                 '# abuse.ch-style feed', '#',
+                 '# id,dateadded,url,url_status,threat,tags,urlhaus_link,reporter'] if header else []
+        for index, value in enumerate(values):
+            lines.append(f'"{index}","2024-05-{index % 28 + 1:02d} 12:00:00","{value}","online","malware_download",'
+                         f'"elf,mirai","https://urlhaus.abuse.ch/url/{index}/","reporter{index % 50}"')
+        return '\r\n'.join(lines) + '\r\n', 'text/csv', values
+
+    if feed_format == 'ndjson':
+        lines = []
+        for index, (path, value) in enumerate(indicators):
+            lines.append(json.dumps({
+                'id': index, 'indicator': value, 'type': path.split(':')[0], 'first_seen': '2024-05-01T12:00:00Z',
+                'threat_type': 'botnet_cc', 'malware': 'win.cobalt_strike', 'confidence_level': 75,
+                'reference': f'Seen with dropper{index % 97}.exe, see https://bazaar.example/{index}',
+            }))
+        return '\n'.join(lines) + '\n', 'application/x-ndjson', values
+
+    objects = []
+    for index, (path, value) in enumerate(indicators):
+        objects.append({
+            'type': 'indicator', 'spec_version': '2.1', 'id': f'indicator--{uuid.UUID(int=rng.getrandbits(128))}',
+            'created': '2024-05-01T12:00:00.000Z', 'modified': '2024-05-01T12:00:00.000Z',
+            'name': f'Malicious {path.split(":")[0]}', 'description': f'Indicator {index} of the campaign',
+            'indicator_types': ['malicious-activity'], 'pattern': f"[{path} = '{value}']",
+            'pattern_type': 'stix', 'valid_from': '2024-05-01T12:00:00Z',
+            'created_by_ref': 'identity--f431f809-377b-45e0-aa1c-6a4751cae5ff',
+        })
+    bundle = {'type': 'bundle', 'id': f'bundle--{uuid.UUID(int=rng.getrandbits(128))}', 'objects': objects}
+    return json.dumps(bundle, indent=2), 'application/stix+json;version=2.1', values
+
+
+def _by_key(iocs):
+    return {(ioc['type'], ioc['value']): ioc for ioc in iocs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--window', type=int, default=64 * 1024)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    scraper = WebScraper()
+    extractor = scraper.extractor
+    pattern_count = len(extractor._pattern_types)
+    print(f'{"feed":>8} {"size":>8} {"text scan":>10} {"parsed":>9} {"speedup":>8} '
+          f'{"spans only":>20} {"IOCs":>14}')
+    for name, (text, content_type, values) in generate_feeds(args.records, args.seed).items():
+        feed_format = scraper.feeds.detect(text, content_type)
+        assert feed_format is not None, f'{name} feed not recognized'
+        text_time, scanned = _best_of(lambda: extractor.extract_iocs(text), args.repeat)
+        parse_time, parsed = _best_of(
+            lambda: extractor.extract_iocs(text, scanner=scraper.feeds.scanner(feed_format)), args.repeat
+        )
+        scan_time, _ = _best_of(lambda: extractor._scan(text), args.repeat)
+        spans_time, _ = _best_of(
+            lambda: scraper.feeds.scanner(feed_format).scan(text, 0, len(text), [0] * pattern_count), args.repeat
+        )
+        print(f'{name:>8} {len(text) / 2 ** 20:>6.1f}MB {text_time:>9.2f}s {parse_time:>8.2f}s '
+              f'{text_time / parse_time:>7.1f}x {scan_time:>6.2f}s {spans_time:>5.2f}s {scan_time / spans_time:>5.1f}x '
+              f'{len(scanned):>6} {len(parsed):>6}')
+
+        found = {ioc['value'] for ioc in parsed}
+        missing = [value for value in values if value not in found]
+        assert not missing, f'{name}: {len(missing)} indicators not parsed, e.g. {missing[:3]}'
+        if feed_format == 'list':
+            by_key = _by_key(scanned)
+            assert all(by_key.get((ioc['type'], ioc['value'])) == ioc for ioc in parsed), \
+                f'{name}: parsed IOCs differ from the text scan'
+
+        # Streaming yields each window's IOCs in pattern order
+        chunks = [text[start:start + 4096] for start in range(0, len(text), 4096)]
+        streamed = extractor.iter_iocs(chunks, window_size=args.window, scanner=scraper.feeds.scanner(feed_format))
+        assert _by_key(streamed) == _by_key(parsed), f'{name}: streamed IOCs differ from parsing the whole feed'
+
+
+if __name__ == '__main__':
+    main()
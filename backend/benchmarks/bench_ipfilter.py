@@ -0,0 +1,120 @@
+"""Measure IP filtering against large CIDR lists.
+
+Usage: python -m benchmarks.bench_ipfilter [--prefixes 100000] [--checks 200000]
+
+Builds an IPRangeSet from --prefixes random IPv4 and IPv6 networks and times
+parse + membership checks for a mix of addresses inside and outside them.
+The old approach, ipaddress objects tested against each network in turn,
+is timed on a small sample and must agree with the interval lookups. Then
+times extraction from a corpus with and without the list excluded.
+"""
+import argparse
+import ipaddress
+import random
+import time
+
+from app.ipfilter import IPRangeSet, parse_ip
+from app.scrapers import IOCExtractor
+from benchmarks.bench_extract import _best_of, generate_corpus
+
+
+def generate_networks(count, seed=1):
+    """Mostly IPv4 prefixes between /12 and /30, a tenth IPv6 /32 to /64"""
+    rng = random.Random(seed)
+    networks = []
+    for i in range(count):
+        if i % 10 == 9:
+            length = rng.randint(32, 64)
+            address = rng.getrandbits(128) >> (128 - length) << (128 - length)
+            networks.append(ipaddress.IPv6Network((address, length)))
+        else:
+            length = rng.randint(12, 30)
+            address = rng.getrandbits(32) >> (32 - length) << (32 - length)
+            networks.append(ipaddress.IPv4Network((address, length)))
+    return networks
+
+
+def generate_addresses(networks, count, seed=2):
+    """Addresses inside listed networks, random IPv4 and random IPv6"""
+    rng = random.Random(seed)
+    addresses = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            network = rng.choice(networks)
+            offset = rng.randrange(network.num_addresses)
+            addresses.append(str(network.network_address + offset))
+        elif kind == 1:
+            addresses.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        else:
+            addresses.append(str(ipaddress.IPv6Address(rng.getrandbits(128))))
+    return addresses
+
+
+def legacy_contains(networks, value):
+    ip = ipaddress.ip_address(value)
+    for network in networks:
+        if ip in network:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prefixes', type=int, default=100000)
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--legacy-checks', type=int, default=200)
+    parser.add_argument('--corpus-mb', type=float, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    networks = generate_networks(args.prefixes)
+    addresses = generate_addresses(networks, args.checks)
+
+    started = time.perf_counter()
+    ranges = IPRangeSet(str(network) for network in networks)
+    print(f'build from {len(networks)} prefixes: {time.perf_counter() - started:.2f}s ({len(ranges)} ranges)')
+
+    started = time.perf_counter()
+    parsed = [parse_ip(value) for value in addresses]
+    parse_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for value in addresses:
+        ipaddress.ip_address(value)
+    ipaddress_time = time.perf_counter() - started
+    print(f'{"parse_ip":>16}: {len(addresses) / parse_time:10.0f} addresses/sec')
+    print(f'{"ip_address":>16}: {len(addresses) / ipaddress_time:10.0f} addresses/sec')
+
+    started = time.perf_counter()
+    hits = sum(ranges.contains(address) for address in parsed)
+    elapsed = time.perf_counter() - started
+    print(f'{"interval lookup":>16}: {len(parsed) / elapsed:10.0f} checks/sec ({hits} excluded)')
+
+    sample = addresses[:args.legacy_checks]
+    started = time.perf_counter()
+    expected = [legacy_contains(networks, value) for value in sample]
+    elapsed = time.perf_counter() - started
+    print(f'{"network loop":>16}: {len(sample) / elapsed:10.1f} checks/sec (on {len(sample)} addresses)')
+    assert [value in ranges for value in sample] == expected, 'interval lookup disagrees with the network loop'
+    assert [parse_ip(value) for value in sample] == [
+        (ipaddress.ip_address(value).version, int(ipaddress.ip_address(value))) for value in sample
+    ]
+    for value in ('01.2.3.4', '1.2.3.256', '1.2.3', '١.2.3.4', '::ffff:1.2.3.4', '1.2.3.4.5'):
+        try:
+            address = ipaddress.ip_address(value)
+            expected_address = (address.version, int(address))
+        except ValueError:
+            expected_address = None
+        assert parse_ip(value) == expected_address, f'parse_ip disagrees with ipaddress on {value!r}'
+
+    extractor = IOCExtractor(allowlists=[])
+    text = generate_corpus(int(args.corpus_mb * 1024 * 1024))
+    plain_time, plain = _best_of(lambda: extractor.extract_iocs(text), args.repeat)
+    filtered_time, filtered = _best_of(lambda: extractor.extract_iocs(text, excluded_networks=ranges), args.repeat)
+    assert [ioc for ioc in plain if ioc['type'].value != 'ip_address' or ioc['value'] not in ranges] == filtered
+    print(f'extract {args.corpus_mb} MB: {plain_time:.3f}s, {filtered_time:.3f}s with the list excluded '
+          f'({len(plain) - len(filtered)} IOCs dropped)')
+
+
+if __name__ == '__main__':
+    main()
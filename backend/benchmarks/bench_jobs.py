@@ -0,0 +1,169 @@
+"""Load-test the queued scrape endpoints against a slow stub site.
+
+Usage: python -m benchmarks.bench_jobs [--scrapes 200] [--concurrency 50] [--latencies 0.5,2] [--database-url URL]
+
+Serves the app with a fixed number of request slots (--server-threads,
+like gunicorn's workers times threads) and sends --scrapes POST
+/scrape/adhoc requests from one client and from --concurrency client
+threads, for each site latency. Request latency is compared with a
+synchronous route that scrapes inside the request, as the endpoint did
+before jobs were queued. Then the job workers start in the same process
+and --scrapes more requests are sent while they work; the queued scrapes
+must all complete, and one session is followed to the end through
+/sessions/<id>/events. Without
+--database-url a temporary SQLite file is used; a PostgreSQL database
+must have the schema (flask db upgrade).
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from benchmarks.bench_async import start_stub_servers
+from benchmarks.bench_extract import generate_corpus
+
+
+def _make_app(database_url, workers):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db
+    app = create_app()
+    app.config['JOB_WORKERS'] = workers
+    app.config['JOB_POLL_INTERVAL'] = 0.2
+    if database_url.startswith('sqlite'):
+        with app.app_context():
+            db.create_all()
+    return app
+
+
+def _add_sync_route(app, scraper):
+    """The pre-queue endpoint: scrape and store inside the request"""
+    from flask import jsonify, request
+    from app import services
+
+    def sync_scrape():
+        session, _ = services.scrape_url(scraper, request.get_json()['url'])
+        return jsonify(session.to_dict())
+
+    app.add_url_rule('/bench/scrape-sync', 'bench_scrape_sync', sync_scrape, methods=['POST'])
+
+
+def _limit_requests(wsgi_app, slots):
+    """Serve at most slots requests at a time, queueing the rest"""
+    semaphore = threading.BoundedSemaphore(slots)
+
+    def limited(environ, start_response):
+        with semaphore:
+            return list(wsgi_app(environ, start_response))
+
+    return limited
+
+
+def _post(url, data):
+    request = urllib.request.Request(url, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=600) as response:
+        body = json.load(response)
+    return time.perf_counter() - started, body
+
+
+def _load(endpoint, urls, concurrency):
+    """Latencies and response bodies of POSTing each URL"""
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(lambda url: _post(endpoint, {'url': url}), urls))
+    return [latency for latency, _ in results], [body for _, body in results]
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return (f'p50 {statistics.median(latencies) * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  '
+            f'max {latencies[-1] * 1000:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scrapes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latencies', default='0.5,2', help='stub site latencies per request in seconds')
+    parser.add_argument('--server-threads', type=int, default=4, help='requests the app serves at once')
+    parser.add_argument('--workers', type=int, default=8, help='job worker threads')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url, args.workers)
+
+    from app import db, job_queue
+    from app.jobs import ACTIVE_STATUSES
+    from app.models import ScrapeSession
+    from app.scrapers import WebScraper
+
+    _add_sync_route(app, WebScraper())
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, _limit_requests(app, args.server_threads), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    body = generate_corpus(8 * 1024)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f'{dialect}: {args.server_threads} request slots, {args.concurrency} clients, {args.workers} job workers')
+    # Enough requests to queue up behind every slot a few times
+    requests = args.server_threads * 4
+    for latency in (float(latency) for latency in args.latencies.split(',')):
+        site = start_stub_servers(1, latency, body)[0]
+        urls = [f'{site}/report/{index}' for index in range(requests)]
+        for name, endpoint in (('sync', f'{base}/bench/scrape-sync'), ('queued', f'{base}/api/scrape/adhoc')):
+            single, _ = _load(endpoint, urls[:args.server_threads], 1)
+            loaded, _ = _load(endpoint, urls, args.concurrency)
+            print(f'{latency * 1000:>6.0f} ms site {name:>7}  x1 {_summary(single)}')
+            print(f'{"":>14} {"":>7} x{args.concurrency:<3}{_summary(loaded)}')
+
+    # With the workers scraping in this process
+    urls = [f'{site}/report/{index}' for index in range(args.scrapes)]
+    job_queue.start()
+    started = time.perf_counter()
+    loaded, bodies = _load(f'{base}/api/scrape/adhoc', urls, args.concurrency)
+    enqueued = time.perf_counter() - started
+    print(f'{args.scrapes} queued while scraping: x{args.concurrency} {_summary(loaded)}  '
+          f'({args.scrapes / enqueued:.0f} requests/sec)')
+    assert all(body['status'] == 'pending' for body in bodies)
+
+    # Follow one queued session to the end
+    with urllib.request.urlopen(f'{base}/api/sessions/{bodies[-1]["id"]}/events', timeout=600) as response:
+        events = [json.loads(line[len(b'data: '):]) for line in response if line.startswith(b'data: ')]
+    assert events[-1]['status'] == 'completed', events[-1]
+
+    session_ids = [body['id'] for body in bodies]
+    with app.app_context():
+        while True:
+            statuses = dict(db.session.query(ScrapeSession.status, db.func.count())
+                            .filter(ScrapeSession.id.in_(session_ids)).group_by(ScrapeSession.status).all())
+            db.session.rollback()
+            if not any(statuses.get(status) for status in ACTIVE_STATUSES):
+                break
+            time.sleep(0.1)
+        drained = time.perf_counter() - started
+        found = db.session.query(db.func.min(ScrapeSession.iocs_found)).filter(
+            ScrapeSession.id.in_(session_ids)).scalar()
+    job_queue.stop()
+    server.shutdown()
+
+    assert statuses == {'completed': args.scrapes}, statuses
+    assert found > 0
+    print(f'{args.scrapes} queued scrapes completed in {drained:.1f}s ({args.scrapes / drained:.1f} scrapes/sec); '
+          f'streamed {len(events)} status events for session {session_ids[-1]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure extraction throughput of the process pool against core count.
+
+Usage: python -m benchmarks.bench_pool [--docs 200] [--page-size 65536] [--workers 1,2,4] [--huge-mb 8]
+
+Processes --docs synthetic HTML reports in this process with one
+WebScraper, then through ExtractionPool with each worker count, and
+reports documents per second. Pool start-up is timed separately; warm
+pools are what the scraper keeps. Then extracts one --huge-mb text split
+across the workers. Every pool result must equal the in-process one.
+Workers beyond the machine's cores can't add throughput.
+"""
+import argparse
+import os
+import time
+
+from app.extraction_pool import ExtractionPool
+from app.scrapers import WebScraper
+from benchmarks.bench_extract import _best_of, generate_corpus
+
+
+def generate_pages(count, size):
+    return [
+        f'<html><head><title>Report {index}</title></head><body><article><p>'
+        f'{generate_corpus(size, seed=index)}</p></article></body></html>'.encode()
+        for index in range(count)
+    ]
+
+
+def _untimed(results):
+    """Results without the stage timings, which differ from run to run"""
+    return [{key: value for key, value in result.items() if key != 'timings'} for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=64 * 1024, help='characters of text per page')
+    parser.add_argument('--workers', default=None, help='comma-separated worker counts (default 1,2,4,...,cores)')
+    parser.add_argument('--huge-mb', type=float, default=8)
+    parser.add_argument('--chunk-mb', type=float, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(count) for count in args.workers.split(',')]
+    else:
+        counts = sorted({1, cores} | {2 ** power for power in range(1, cores.bit_length()) if 2 ** power <= cores})
+    print(f'{cores} cores')
+
+    content_type = 'text/html; charset=utf-8'
+    pages = generate_pages(args.docs, args.page_size)
+    scraper = WebScraper()
+    started = time.perf_counter()
+    expected = [scraper.process_content(page.decode(), content_type) for page in pages]
+    elapsed = time.perf_counter() - started
+    print(f'{"in-process":>12}: {len(pages) / elapsed:8.1f} docs/sec')
+
+    text = generate_corpus(int(args.huge_mb * 1024 * 1024), seed=99)
+    huge_time, huge_expected = _best_of(lambda: scraper.extractor.extract_iocs(text), args.repeat)
+    print(f'{"huge text":>12}: {huge_time:.2f}s in-process ({len(huge_expected)} IOCs)')
+
+    for workers in counts:
+        started = time.perf_counter()
+        chunk_size = int(args.chunk_mb * 1024 * 1024)
+        pool = ExtractionPool(workers, split_size=chunk_size, chunk_size=chunk_size)
+        pool.warm()
+        startup = time.perf_counter() - started
+        with pool:
+            started = time.perf_counter()
+            futures = [pool.submit(page, content_type, 'utf-8') for page in pages]
+            results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+            assert _untimed(results) == _untimed(expected), f'{workers} workers: results differ from in-process extraction'
+
+            split_time, split = _best_of(lambda: pool.extract_iocs(text), args.repeat)
+            assert split == huge_expected, f'{workers} workers: split extraction differs from a single scan'
+        print(f'{workers:>3} workers: {len(pages) / elapsed:8.1f} docs/sec, start-up {startup:.2f}s, '
+              f'huge text {split_time:.2f}s in {len(pool._chunk_bounds(text))} chunks')
+
+    # Chunk boundaries inside matches: an IPv6 address and a URL crossing
+    # every boundary, and filename runs that must not be cut
+    with ExtractionPool(min(2, cores), split_size=0, chunk_size=997, overlap=256) as pool:
+        extractor = pool.scraper.extractor
+        samples = [
+            generate_corpus(64 * 1024, seed=5),
+            ' '.join(['fe80:1:2:3::4:5:6', 'see http://evil.org/a/b.exe?x=1', 'my payload file.exe',
+                      'ASN: 1234', 'deadbeef' * 8] * 800),
+            'x' * 5000 + ' report final.docx ' + 'y' * 5000,
+        ]
+        for sample in samples:
+            assert pool.extract_iocs(sample) == extractor.extract_iocs(sample), 'split extraction differs'
+            assert pool.extract_iocs(sample, context_size=0) == extractor.extract_iocs(sample, context_size=0)
+
+
+if __name__ == '__main__':
+    main()
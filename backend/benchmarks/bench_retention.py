@@ -0,0 +1,200 @@
+"""Time deleting a source and the retention policies on a populated database.
+
+Usage: python -m benchmarks.bench_retention [--sessions 500] [--sightings 50] [--months 12] [--batch-size 1000] [--database-url URL] [--json PATH]
+
+Fills the database with sources of --sessions finished sessions each,
+spread over the last --months months, every session with --sightings
+sightings of a shared pool of IOCs. One source is deleted as DELETE
+/sources/<id> used to: loading its sessions, their sightings and IOCs
+into the ORM and deleting them object by object. Another is deleted
+through the route and purged by app.retention, in batches of
+--batch-size sessions; exactly its rows must go and the third source
+must keep all of its own. Then the session age policy keeps half of the
+months (on PostgreSQL, dropping the sighting partitions of the rest) and
+the count policy keeps 10 sessions per source; both must leave exactly
+the expected sessions and sightings. Without --database-url a temporary
+SQLite file is used; a PostgreSQL database must have the schema (flask
+db upgrade) and should be one the benchmark may empty. With --json the
+timings are also written to PATH, for benchmarks.compare.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+
+from benchmarks.bench_jobs import _make_app
+from benchmarks.results import write_results
+
+SOURCES = ('orm', 'purge', 'kept')
+KEEP_PER_SOURCE = 10
+
+
+def _populate(sessions_per_source, sightings, months, now):
+    """Sources named as SOURCES with their sessions and sightings; returns
+    {name: source id}"""
+    from app import db
+    from app.models import IOC, IOCSighting, IOCType, ScrapeSession, SourceURL, ioc_value_hash
+    from app.retention import create_sighting_partitions, sightings_partitioned
+
+    span = timedelta(days=30 * months)
+    with db.engine.begin() as connection:
+        if sightings_partitioned(connection):
+            create_sighting_partitions(connection, (now - span).date(), now.date())
+    values = [f'198.51.{index // 250}.{index % 250 + 1}' for index in range(sightings * 4)]
+    db.session.execute(insert(IOC), [
+        {'ioc_type': IOCType.IP_ADDRESS, 'value': value, 'value_hash': ioc_value_hash(IOCType.IP_ADDRESS, value),
+         'first_seen': now - span, 'last_seen': now}
+        for value in values
+    ])
+    ioc_ids = [ioc_id for ioc_id, in db.session.query(IOC.id).order_by(IOC.id)]
+    source_ids = {}
+    for name in SOURCES:
+        source = SourceURL(url=f'http://bench.invalid/{name}', name=name)
+        db.session.add(source)
+        db.session.flush()
+        source_ids[name] = source.id
+        started = [now - span * (index + 0.5) / sessions_per_source for index in range(sessions_per_source)]
+        db.session.execute(insert(ScrapeSession), [
+            {'source_url_id': source.id, 'url': source.url, 'status': 'completed', 'started_at': at,
+             'completed_at': at, 'iocs_found': sightings}
+            for at in started
+        ])
+        session_rows = db.session.query(ScrapeSession.id, ScrapeSession.started_at).filter(
+            ScrapeSession.source_url_id == source.id).all()
+        for offset, (session_id, at) in enumerate(session_rows):
+            db.session.execute(insert(IOCSighting), [
+                {'ioc_id': ioc_ids[(offset + index) % len(ioc_ids)], 'scrape_session_id': session_id,
+                 'context': f'seen at {value}', 'confidence': 0.9, 'seen_at': at}
+                for index, value in enumerate(values[:sightings])
+            ])
+        db.session.commit()
+    return source_ids
+
+
+def _orm_delete(source_id):
+    """Delete a source as the ORM cascades used to, loading every row"""
+    from app import db
+    from app.models import SourceURL
+
+    source = db.session.get(SourceURL, source_id)
+    with db.session.no_autoflush:
+        for session in source.scrape_sessions:
+            for sighting in session.sightings:
+                db.session.delete(sighting)
+            for ioc in session.iocs:
+                ioc.scrape_session_id = None
+            if session.document is not None:
+                db.session.delete(session.document)
+            db.session.delete(session)
+        db.session.delete(source)
+    db.session.commit()
+
+
+def _counts(source_id):
+    """Sessions and sightings of a source"""
+    from app import db
+    from app.models import IOCSighting, ScrapeSession
+
+    sessions = db.session.query(func.count()).filter(ScrapeSession.source_url_id == source_id).scalar()
+    sightings = db.session.query(func.count()).select_from(IOCSighting).join(ScrapeSession).filter(
+        ScrapeSession.source_url_id == source_id).scalar()
+    return sessions, sightings
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=500, help='sessions of each source')
+    parser.add_argument('--sightings', type=int, default=50, help='sightings of each session')
+    parser.add_argument('--months', type=int, default=12, help='months the sessions are spread over')
+    parser.add_argument('--batch-size', type=int, default=1000, help='RETENTION_BATCH_SIZE')
+    parser.add_argument('--database-url')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url, 1)
+    app.config['RETENTION_BATCH_SIZE'] = args.batch_size
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    from app import db, retention
+    from app.models import IOCSighting, ScrapeSession, SourceURL
+
+    client = app.test_client()
+    now = datetime.utcnow()
+    results = []
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        print(f'{dialect}: {len(SOURCES)} sources of {args.sessions} sessions with {args.sightings} sightings each')
+        source_ids = _populate(args.sessions, args.sightings, args.months, now)
+        expected = (args.sessions, args.sessions * args.sightings)
+        for name, source_id in source_ids.items():
+            if _counts(source_id) != expected:
+                raise SystemExit(f'Source {name} holds {_counts(source_id)} sessions and sightings, not {expected}')
+
+        seconds, _ = _timed(_orm_delete, source_ids['orm'])
+        if _counts(source_ids['orm']) != (0, 0):
+            raise SystemExit('The ORM delete left rows behind')
+        print(f'{"ORM cascade delete":>24} {seconds:>8.3f}s')
+        results.append({'name': 'delete/orm', 'seconds': seconds, 'sessions': args.sessions})
+
+        response_seconds, response = _timed(client.delete, f'/api/sources/{source_ids["purge"]}')
+        if response.status_code != 204:
+            raise SystemExit(f'DELETE /sources/{source_ids["purge"]}: {response.status_code}')
+        db.session.remove()
+        seconds, counts = _timed(retention.run_once)
+        print(f'{"DELETE /sources/<id>":>24} {response_seconds:>8.3f}s')
+        print(f'{"retention purge":>24} {seconds:>8.3f}s, {counts["sessions"]} sessions')
+        results.append({'name': 'delete/request', 'seconds': response_seconds, 'sessions': args.sessions})
+        results.append({'name': 'delete/purge', 'seconds': seconds, 'sessions': args.sessions})
+        if counts['sources'] != 1 or counts['sessions'] != args.sessions:
+            raise SystemExit(f'The purge deleted {counts}, not 1 source and {args.sessions} sessions')
+        if db.session.get(SourceURL, source_ids['purge']) is not None or _counts(source_ids['purge']) != (0, 0):
+            raise SystemExit('The purged source left rows behind')
+        if _counts(source_ids['kept']) != expected:
+            raise SystemExit(f'The kept source lost rows: {_counts(source_ids["kept"])} of {expected}')
+
+        days = 30 * args.months // 2
+        cutoff = now - timedelta(days=days)
+        kept = ScrapeSession.query.filter(ScrapeSession.started_at >= cutoff).count()
+        app.config['SESSION_RETENTION_DAYS'] = days
+        seconds, counts = _timed(retention.run_once, now)
+        app.config['SESSION_RETENTION_DAYS'] = 0
+        print(f'{"age policy":>24} {seconds:>8.3f}s, {counts["sessions"]} sessions, '
+              f'{counts["partitions"]} sighting partitions dropped')
+        results.append({'name': 'retention/age', 'seconds': seconds, 'sessions': counts['sessions']})
+        if ScrapeSession.query.count() != kept or ScrapeSession.query.filter(ScrapeSession.started_at < cutoff).count():
+            raise SystemExit(f'The age policy left {ScrapeSession.query.count()} sessions, not {kept}')
+        if IOCSighting.query.count() != kept * args.sightings:
+            raise SystemExit(f'The age policy left {IOCSighting.query.count()} sightings, not {kept * args.sightings}')
+
+        app.config['SESSION_RETENTION_PER_SOURCE'] = KEEP_PER_SOURCE
+        seconds, counts = _timed(retention.run_once, now)
+        app.config['SESSION_RETENTION_PER_SOURCE'] = 0
+        print(f'{"count policy":>24} {seconds:>8.3f}s, {counts["sessions"]} sessions')
+        results.append({'name': 'retention/count', 'seconds': seconds, 'sessions': counts['sessions']})
+        newest = ScrapeSession.query.filter(ScrapeSession.source_url_id == source_ids['kept']).order_by(
+            ScrapeSession.started_at.desc()).limit(KEEP_PER_SOURCE).all()
+        remaining = ScrapeSession.query.all()
+        if sorted(session.id for session in remaining) != sorted(session.id for session in newest):
+            raise SystemExit(f'The count policy left {len(remaining)} sessions, not the newest {len(newest)}')
+        if IOCSighting.query.count() != len(newest) * args.sightings:
+            raise SystemExit(f'The count policy left {IOCSighting.query.count()} sightings')
+
+    if args.json:
+        write_results(args.json, 'bench_retention', args, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Time the API routes end to end against a stub site and a database.
+
+Usage: python -m benchmarks.bench_routes [--kinds html,text,ndjson] [--size 256KB] [--scrapes 20] [--workers 2] [--repeat 5] [--database-url URL] [--json PATH]
+
+Serves a benchmarks.corpus document of each kind from a local stub HTTP
+server and scrapes --scrapes URLs of it through POST /api/scrape/adhoc
+and the job workers running in this process. Each URL is a new path, so
+every scrape fetches, extracts and stores the whole document. The time
+from the first request to the last finished session is reported per
+scrape; every scrape must complete and find the same IOCs. Then the read
+routes are timed through the test client on the stored IOCs: the first
+page of /iocs, a value search, a cursor page, uncached /iocs/stats,
+/sessions and the NDJSON export of every IOC. Without --database-url a
+temporary SQLite file is used; a PostgreSQL database must have the schema
+(flask db upgrade). With --json the timings are also written to PATH, for
+benchmarks.compare.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.bench_async import start_stub_servers
+from benchmarks.bench_batch import _wait
+from benchmarks.bench_extract import _best_of
+from benchmarks.bench_jobs import _make_app
+from benchmarks.corpus import CONTENT_TYPES, format_size, generate, parse_size
+from benchmarks.results import write_results
+
+
+def _get(client, path, **query):
+    response = client.get(path, query_string=query)
+    assert response.status_code == 200, f'{path}: {response.status_code}'
+    return response.get_data()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kinds', default='html,text,ndjson')
+    parser.add_argument('--size', type=parse_size, default='256KB', help='size of each served document')
+    parser.add_argument('--scrapes', type=int, default=20, help='scrapes of each kind of document')
+    parser.add_argument('--workers', type=int, default=2, help='job worker threads')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url, args.workers)
+    app.config['IOC_STATS_TTL'] = 0
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    from app import db, job_queue
+    from app.models import IOC
+
+    client = app.test_client()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f'{dialect}: {args.scrapes} scrapes of each {format_size(args.size)} document, {args.workers} workers')
+    results = []
+    job_queue.start()
+    for kind in args.kinds.split(','):
+        document = generate(kind, args.size, args.seed)
+        site = start_stub_servers(1, 0, document, CONTENT_TYPES[kind])[0]
+        urls = [f'{site}/{kind}/{index}' for index in range(args.scrapes)]
+        started = time.perf_counter()
+        session_ids = [client.post('/api/scrape/adhoc', json={'url': url}).json['id'] for url in urls]
+        sessions = _wait(app, session_ids)
+        elapsed = time.perf_counter() - started
+
+        failed = [session for session in sessions.values() if session['status'] != 'completed']
+        if failed:
+            raise SystemExit(f'{len(failed)} {kind} scrapes failed: {failed[0].get("error_message")}')
+        found = {session['iocs_found'] for session in sessions.values()}
+        if len(found) != 1:
+            raise SystemExit(f'Scrapes of the same {kind} document found {sorted(found)} IOCs')
+        seconds = elapsed / args.scrapes
+        name = f'scrape/{kind}/{format_size(args.size)}'
+        print(f'{name:>28} {seconds * 1000:>9.1f}ms per scrape, {args.scrapes / elapsed:>6.1f}/s, '
+              f'{found.pop()} IOCs each')
+        results.append({'name': name, 'seconds': seconds, 'bytes': len(document), 'scrapes': args.scrapes})
+    job_queue.stop()
+
+    with app.app_context():
+        total = IOC.query.count()
+        value = IOC.query.order_by(IOC.id.desc()).first().value
+    reads = {
+        'iocs/page': lambda: _get(client, '/api/iocs', per_page=50),
+        'iocs/search': lambda: _get(client, '/api/iocs', search=value),
+        'iocs/cursor': lambda: _get(client, '/api/iocs', cursor='', per_page=50),
+        'iocs/stats': lambda: _get(client, '/api/iocs/stats'),
+        'sessions': lambda: _get(client, '/api/sessions'),
+        'iocs/export': lambda: _get(client, '/api/iocs/export', format='ndjson'),
+    }
+    for name, read in reads.items():
+        seconds, body = _best_of(read, args.repeat)
+        if name == 'iocs/export':
+            exported = body.count(b'\n')
+            if exported != total:
+                raise SystemExit(f'The export holds {exported} of {total} IOCs')
+        print(f'{name:>28} {seconds * 1000:>9.1f}ms, {len(body)} bytes')
+        results.append({'name': name, 'seconds': seconds, 'bytes': len(body), 'iocs': total})
+
+    if args.json:
+        write_results(args.json, 'bench_routes', args, results)
+
+
+if __name__ == '__main__':
+    main()
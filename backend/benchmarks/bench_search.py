@@ -0,0 +1,154 @@
+"""Measure /api/iocs search latency on a seeded IOC table.
+
+Usage: python -m benchmarks.bench_search [--rows 2000000] [--database-url URL] [--repeat 5]
+
+Seeds --rows synthetic IOCs (skipped if the table already holds that many),
+then times the first page of the IOC list for several searches through
+app.search.filter_by_value, against the old unindexed ILIKE '%term%'. On
+PostgreSQL the old plan is reproduced by disabling index scans for the
+transaction. Both paths must return the same rows. Without --database-url
+a temporary SQLite file is used; with a PostgreSQL URL the schema must
+exist.
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.bench_extract import _best_of
+
+
+def _make_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app, db
+    app = create_app()
+    if database_url.startswith('sqlite'):
+        with app.app_context():
+            db.create_all()
+    return app
+
+
+WORDS = ['update', 'cdn', 'mail', 'secure', 'login', 'files', 'api', 'static', 'portal', 'drive']
+TLDS = ['com', 'net', 'org', 'ru', 'cn', 'info', 'io', 'xyz']
+
+
+def seed_rows(count, seed=1, start=0):
+    """Deterministic IOC rows for the iocs table"""
+    from app.models import IOCType, ioc_value_hash
+
+    rng = random.Random(seed + start)
+    base = datetime(2024, 1, 1)
+    for i in range(start, start + count):
+        kind = i % 5
+        label = f'{rng.choice(WORDS)}{i}'
+        if kind == 0:
+            ioc_type, value = IOCType.HASH, hashlib.sha256(str(i).encode()).hexdigest()
+        elif kind == 1:
+            ioc_type, value = IOCType.IP_ADDRESS, f'{i >> 24 & 255 or 1}.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+        elif kind == 2:
+            ioc_type, value = IOCType.DOMAIN, f'{label}.{rng.choice(WORDS)}.{rng.choice(TLDS)}'
+        elif kind == 3:
+            ioc_type, value = IOCType.URL, f'https://{label}.{rng.choice(TLDS)}/{rng.choice(WORDS)}/{i}.php'
+        else:
+            ioc_type, value = IOCType.FILENAME, f'{label}_{rng.choice(WORDS)}.exe'
+        seen = base + timedelta(seconds=i * 7)
+        yield {
+            'ioc_type': ioc_type,
+            'value': value,
+            'value_hash': ioc_value_hash(ioc_type, value),
+            'context': None,
+            'confidence': 0.5,
+            'sighting_count': 1,
+            'first_seen': seen,
+            'last_seen': seen
+        }
+
+
+def seed(db, IOC, rows, batch_size=20000):
+    from sqlalchemy import insert
+
+    existing = db.session.query(IOC).count()
+    if existing >= rows:
+        return existing
+    print(f'seeding {rows - existing} rows...')
+    batch = []
+    for row in seed_rows(rows - existing, start=existing):
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(insert(IOC), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(IOC), batch)
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ANALYZE iocs'))
+        db.session.commit()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = _make_app(database_url)
+
+    from sqlalchemy import desc
+    from app import db, search
+    from app.models import IOC, IOCType
+
+    with app.app_context():
+        total = seed(db, IOC, args.rows)
+        print(f'{db.engine.dialect.name}: {total} rows')
+
+        sample = next(seed_rows(1, start=args.rows // 2 // 5 * 5))
+        searches = [
+            ('hash (exact)', sample['value'], None),
+            ('ip (exact)', next(seed_rows(1, start=args.rows // 3 // 5 * 5 + 1))['value'], None),
+            ('substring', 'portal77', None),
+            ('rare suffix', 'secure12345.', None),
+            ('no match', 'zzqqxx', None),
+            ('type + substring', '.ru', IOCType.DOMAIN),
+        ]
+
+        def page(query):
+            return [(ioc.id, ioc.value) for ioc in query.order_by(desc(IOC.first_seen)).limit(50)]
+
+        def legacy(term, ioc_type):
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(db.text('SET LOCAL enable_indexscan = off'))
+                db.session.execute(db.text('SET LOCAL enable_bitmapscan = off'))
+            query = IOC.query.filter(IOC.value.ilike(f'%{term}%'))
+            if ioc_type is not None:
+                query = query.filter(IOC.ioc_type == ioc_type)
+            try:
+                return page(query)
+            finally:
+                db.session.rollback()
+
+        def indexed(term, ioc_type):
+            query = search.filter_by_value(IOC.query, term, ioc_type)
+            if ioc_type is not None:
+                query = query.filter(IOC.ioc_type == ioc_type)
+            try:
+                return page(query)
+            finally:
+                db.session.rollback()
+
+        for name, term, ioc_type in searches:
+            old, expected = _best_of(lambda: legacy(term, ioc_type), args.repeat)
+            new, found = _best_of(lambda: indexed(term, ioc_type), args.repeat)
+            assert found == expected, f'{name}: indexed search returned different rows'
+            print(f'{name:>18}: {len(found):3d} hits  ILIKE {old * 1000:9.1f} ms  '
+                  f'indexed {new * 1000:8.1f} ms  ({old / new:6.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Compare start-up time and request throughput of the development server and gunicorn.
+
+Usage: python -m benchmarks.bench_serve [--servers dev,gunicorn] [--workers 2] [--threads 4] [--concurrency 16] [--seconds 5] [--iocs 1000] [--database-url URL] [--json PATH]
+
+Migrates the database (flask db upgrade) and stores --iocs IOCs, then
+starts each server as its own process: python run.py, and gunicorn with
+gunicorn.conf.py and --workers preforked workers of --threads threads
+each. Start-up is the time from launching the process to the first
+successful /api/health. Each path is then requested by --concurrency
+client threads for --seconds, one connection per request, and the
+requests per second and latency percentiles are reported; every response
+must be a 200. Both servers run the app as deployed, with the scrape job
+workers and retention started. Without --database-url a temporary SQLite
+file is used. With --json the timings are also written to PATH, for
+benchmarks.compare.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from benchmarks.results import write_results
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ('/api/health', '/api/iocs?per_page=50', '/api/iocs/stats')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _command(server, args):
+    if server == 'dev':
+        return [sys.executable, 'run.py'], {}
+    if server == 'gunicorn':
+        return ([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}', 'wsgi:app'],
+                {'WEB_WORKERS': str(args.workers), 'WEB_THREADS': str(args.threads)})
+    raise SystemExit(f'Unknown server: {server}')
+
+
+def _populate(database_url, count):
+    """Migrate the schema and store count IOCs"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'db', 'upgrade'], cwd=BACKEND, env=env,
+                   check=True, capture_output=True)
+    os.environ['DATABASE_URL'] = database_url
+    from sqlalchemy import insert
+    from app import create_app, db
+    from app.models import IOC, IOCType, ioc_value_hash
+
+    now = datetime.utcnow()
+    with create_app().app_context():
+        values = [f'bench-{index}.example.net' for index in range(count)]
+        db.session.execute(insert(IOC), [
+            {'ioc_type': IOCType.DOMAIN, 'value': value, 'value_hash': ioc_value_hash(IOCType.DOMAIN, value),
+             'first_seen': now, 'last_seen': now}
+            for value in values
+        ])
+        db.session.commit()
+
+
+def _start(server, args, database_url):
+    """Launch the server; returns the process, its base URL and the seconds until it answered"""
+    port = _free_port()
+    command, env = _command(server, args)
+    command = [part.format(port=port) for part in command]
+    env = dict(os.environ, DATABASE_URL=database_url, PORT=str(port), **env)
+    env.pop('FLASK_ENV', None)
+    base = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while True:
+        if process.poll() is not None:
+            raise SystemExit(f'{server} exited with status {process.returncode} while starting')
+        try:
+            with urllib.request.urlopen(f'{base}/api/health', timeout=1) as response:
+                if response.status == 200:
+                    return process, base, time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        if time.perf_counter() - started > 120:
+            process.kill()
+            raise SystemExit(f'{server} did not answer within 120s')
+        time.sleep(0.01)
+
+
+def _stop(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _load(url, concurrency, seconds):
+    """Latencies of requesting url from concurrency threads for seconds; a
+    non-200 response is a failure"""
+    latencies = []
+    failures = []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                status = str(e)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', default='dev,gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads of each gunicorn worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--seconds', type=float, default=5, help='load on each path')
+    parser.add_argument('--iocs', type=int, default=1000, help='IOCs stored before serving')
+    parser.add_argument('--database-url')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    _populate(database_url, args.iocs)
+    print(f'{database_url.split(":", 1)[0]}: {args.iocs} IOCs, {args.concurrency} clients, {os.cpu_count()} cpus; '
+          f'gunicorn with {args.workers} workers of {args.threads} threads')
+
+    results = []
+    for server in args.servers.split(','):
+        process, base, startup = _start(server, args, database_url)
+        try:
+            print(f'{server:>9} start-up {startup:>7.2f}s')
+            results.append({'name': f'{server}/startup', 'seconds': startup})
+            for path in PATHS:
+                latencies, failures, elapsed = _load(base + path, args.concurrency, args.seconds)
+                if failures or not latencies:
+                    raise SystemExit(f'{server} {path}: {len(failures)} failed requests, e.g. {failures[:1]}')
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                rate = len(latencies) / elapsed
+                print(f'{"":>9} {path:<24} {rate:>8.0f} req/s  p50 {statistics.median(latencies) * 1000:>7.1f} ms  '
+                      f'p99 {p99 * 1000:>7.1f} ms')
+                results.append({'name': f'{server}{path}', 'seconds': 1 / rate, 'requests_per_second': rate,
+                                'p50': statistics.median(latencies), 'p99': p99})
+        finally:
+            _stop(process)
+
+    if args.json:
+        write_results(args.json, 'bench_serve', args, results)
+
+
+if __name__ == '__main__':
+    main()
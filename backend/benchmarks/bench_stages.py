@@ -0,0 +1,129 @@
+"""Time each stage of IOC extraction on the synthetic corpora.
+
+Usage: python -m benchmarks.bench_stages [--kinds html,text,list,csv,ndjson,stix,adversarial] [--sizes 10KB,1MB] [--ioc-density 0.05] [--repeat 3] [--json PATH]
+
+Generates a benchmarks.corpus document of each kind and size and runs the
+stages of WebScraper.process_content on it one at a time, in the order it
+runs them: parse (the visible text of HTML, and feed detection), extract
+(the regex scan, or for feeds the parser, finding spans), dedupe (the
+first span of each type and value), validate (IOCExtractor._validate_ioc
+on those) and score (threat keywords, context and confidence). The IOCs
+the stages build must equal extract_iocs's. total is process_content as
+a whole. With --json the timings are also written to PATH, for
+benchmarks.compare.
+"""
+import argparse
+
+from app.ipfilter import parse_ip
+from app.models import IOCType
+from app.scrapers import CONTEXT_SIZE, WebScraper
+from benchmarks.bench_extract import _best_of
+from benchmarks.corpus import CONTENT_TYPES, KINDS, format_size, generate, parse_size
+from benchmarks.results import write_results
+
+STAGES = ('parse', 'extract', 'dedupe', 'validate', 'score')
+
+
+def run_stages(scraper, raw, content_type):
+    """{stage: function of the previous stage's output}, and the input of
+    the first"""
+    extractor = scraper.extractor
+
+    def parse(raw):
+        text, _ = scraper.analyzed_text(raw, content_type)
+        return text, scraper.feed_format(raw, content_type)
+
+    def extract(parsed):
+        text, feed_format = parsed
+        if feed_format is None:
+            spans = extractor._scan(text)
+        else:
+            spans = scraper.feeds.scanner(feed_format).scan(text, 0, len(text), [0] * len(extractor._pattern_types))
+        return text, spans
+
+    def dedupe(scanned):
+        text, spans = scanned
+        seen = set()
+        unique = []
+        for ioc_type, pattern_spans in zip(extractor._pattern_types, spans):
+            type_key = ioc_type.value
+            for start, end in pattern_spans:
+                value = text[start:end].strip()
+                if (type_key, value) not in seen:
+                    seen.add((type_key, value))
+                    unique.append((ioc_type, value, start, end))
+        return text, unique
+
+    def validate(deduped):
+        text, unique = deduped
+        candidates = []
+        for ioc_type, value, start, end in unique:
+            address = parse_ip(value) if ioc_type == IOCType.IP_ADDRESS else None
+            if extractor._validate_ioc(ioc_type, value, False, None, address):
+                candidates.append((ioc_type, value, start, end, address))
+        return text, candidates
+
+    def score(validated):
+        text, candidates = validated
+        threat_scores = extractor._threat_scores(text, [(start, end) for _, _, start, end, _ in candidates])
+        iocs = []
+        for (ioc_type, value, start, end, address), threat_score in zip(candidates, threat_scores):
+            offset, length = extractor._context_span(text, start, end, CONTEXT_SIZE)
+            context = text[offset:offset + length]
+            iocs.append({
+                'type': ioc_type,
+                'value': value,
+                'context': context,
+                'context_offset': offset,
+                'confidence': extractor._calculate_confidence(ioc_type, value, context, address, threat_score)
+            })
+        return iocs
+
+    return {'parse': parse, 'extract': extract, 'dedupe': dedupe, 'validate': validate, 'score': score}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kinds', default=','.join(KINDS))
+    parser.add_argument('--sizes', default='10KB,1MB', help='comma separated document sizes, e.g. 10KB,1MB,500MB')
+    parser.add_argument('--ioc-density', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    scraper = WebScraper()
+    results = []
+    print(f'{"document":>18} ' + ' '.join(f'{stage:>9}' for stage in STAGES + ('total',)) + f' {"MB/s":>7} {"iocs":>7}')
+    for kind in args.kinds.split(','):
+        content_type = CONTENT_TYPES[kind]
+        for size in (parse_size(size) for size in args.sizes.split(',')):
+            raw = generate(kind, size, args.seed, args.ioc_density)
+            stages = run_stages(scraper, raw, content_type)
+            times = {}
+            output = raw
+            for stage in STAGES:
+                times[stage], output = _best_of(lambda: stages[stage](output), args.repeat)
+            times['total'], result = _best_of(lambda: scraper.process_content(raw, content_type), args.repeat)
+
+            text, feed_format = stages['parse'](raw)
+            expected = scraper.extractor.extract_iocs(
+                text, scanner=scraper.feeds.scanner(feed_format) if feed_format is not None else None
+            )
+            if output != expected:
+                raise SystemExit(f'{kind} {format_size(size)}: stages built {len(output)} IOCs, '
+                                 f'extract_iocs {len(expected)}')
+
+            document = f'{kind}/{format_size(size)}'
+            print(f'{document:>18} ' + ' '.join(f'{times[stage] * 1000:>7.1f}ms' for stage in STAGES + ('total',))
+                  + f' {len(raw) / 2 ** 20 / times["total"]:>7.1f} {len(output):>7}')
+            for stage, seconds in times.items():
+                results.append({'name': f'{document}/{stage}', 'seconds': seconds, 'bytes': len(raw),
+                                'iocs': result['total_iocs'] if 'total_iocs' in result else len(output)})
+
+    if args.json:
+        write_results(args.json, 'bench_stages', args, results)
+
+
+if __name__ == '__main__':
+    main()
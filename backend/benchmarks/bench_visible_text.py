@@ -0,0 +1,73 @@
+"""Compare visible-text extraction with lxml against BeautifulSoup.
+
+Usage: python -m benchmarks.bench_visible_text [--sizes 0.1,1,5] [--repeat 3]
+
+Times both engines on synthetic report pages of each size (in MB) with
+navigation, scripts, styles, comments and hidden elements mixed into the
+prose. That the two return the same text, on these pages, edge cases and
+fuzzed markup, is checked by tests/test_visible_text.py.
+"""
+import argparse
+import random
+
+from app.scrapers import WebScraper
+from app.visible_text import visible_text
+from benchmarks.bench_extract import _best_of, generate_corpus
+
+PAGE_HEAD = (
+    '<!DOCTYPE html><html><head><title>Threat report</title><meta charset="utf-8">'
+    '<style>.hidden { display: none }</style><script>window.config = {};</script></head><body>'
+    '<nav><ul>' + ''.join(f'<li><a href="/section/{index}">Section {index}</a></li>' for index in range(40))
+    + '</ul></nav><article>'
+)
+PAGE_TAIL = '</article><footer aria-hidden="true">Footer</footer></body></html>'
+
+
+def generate_page(size, seed=1, ioc_density=0.05):
+    """A report page of about size characters"""
+    return PAGE_HEAD + page_body(size, seed, ioc_density) + PAGE_TAIL
+
+
+def page_body(size, seed=1, ioc_density=0.05):
+    """The article of a report page: prose with embedded IOCs in paragraphs
+    and tables, some of it hidden, in scripts or in comments"""
+    rng = random.Random(seed)
+    words = generate_corpus(size, seed=seed, ioc_density=ioc_density).split(' ')
+    body = []
+    for start in range(0, len(words), 60):
+        paragraph = ' '.join(words[start:start + 60])
+        kind = rng.random()
+        if kind < 0.05:
+            body.append(f'<div style="display:none">{paragraph}</div>')
+        elif kind < 0.08:
+            body.append(f'<span class="sr-only">{paragraph}</span>')
+        elif kind < 0.10:
+            body.append(f'<script>var data = "{paragraph}";</script>')
+        elif kind < 0.12:
+            body.append(f'<!-- {paragraph} -->')
+        elif kind < 0.20:
+            cells = ''.join(f'<td>{word}</td>' for word in words[start:start + 60:6])
+            body.append(f'<table class="iocs"><tr>{cells}</tr></table>')
+        else:
+            body.append(f'<p class="content">{paragraph} <a href="/ref/{start}">ref</a> <b>{start}</b></p>')
+    return ''.join(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='0.1,1,5')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    scraper = WebScraper()
+    print(f'{"size":>8} {"text":>9} {"bs4":>9} {"lxml":>9} {"speedup":>8}')
+    for size in (float(size) for size in args.sizes.split(',')):
+        page = generate_page(int(size * 1024 * 1024), args.seed)
+        soup_time, expected = _best_of(lambda: scraper.soup_visible_text(page), args.repeat)
+        lxml_time, _ = _best_of(lambda: visible_text(page), args.repeat)
+        print(f'{size:>6}MB {len(expected):>9} {soup_time:>8.3f}s {lxml_time:>8.3f}s {soup_time / lxml_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Compare two JSON benchmark results and flag regressions.
+
+Usage: python -m benchmarks.compare BASELINE CURRENT [--threshold 0.1] [--min-seconds 0.005]
+
+BASELINE and CURRENT are files written with --json by the same benchmark,
+e.g. before and after a change. Prints every result in both with its
+seconds and the change, and exits with status 1 if any got slower by more
+than --threshold (a fraction). Results under --min-seconds in both files
+are too noisy to flag. Results in only one of the files are listed but
+not compared.
+"""
+import argparse
+import sys
+
+from benchmarks.results import read_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='results never flagged below this time')
+    args = parser.parse_args()
+
+    baseline, current = read_results(args.baseline), read_results(args.current)
+    if baseline['benchmark'] != current['benchmark']:
+        raise SystemExit(f'Results of different benchmarks: {baseline["benchmark"]} and {current["benchmark"]}')
+    for label, results in (('baseline', baseline), ('current', current)):
+        environment = results['environment']
+        print(f'{label:>8}: {(environment["commit"] or "?")[:12]}{"+" if environment["dirty"] else ""} '
+              f'{environment["time"]}, Python {environment["python"]}, {environment["cpus"]} cpus')
+
+    before = {result['name']: result for result in baseline['results']}
+    after = {result['name']: result for result in current['results']}
+    width = max(map(len, list(before) + list(after) + ['result']))
+    print(f'{"result":<{width}} {"baseline":>10} {"current":>10} {"change":>8}')
+    regressions = []
+    for name in list(before) + [name for name in after if name not in before]:
+        if name not in after or name not in before:
+            print(f'{name:<{width}} only in {"baseline" if name in before else "current"}')
+            continue
+        old, new = before[name]['seconds'], after[name]['seconds']
+        change = new / old - 1 if old else 0.0
+        flag = ''
+        if change > args.threshold and max(old, new) >= args.min_seconds:
+            regressions.append(name)
+            flag = '  regression'
+        print(f'{name:<{width}} {old:>9.4f}s {new:>9.4f}s {change:>+7.1%}{flag}')
+
+    if regressions:
+        print(f'{len(regressions)} of {len(after)} results slower by more than {args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
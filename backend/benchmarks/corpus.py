@@ -0,0 +1,152 @@
+"""Write a deterministic synthetic document for the benchmarks.
+
+Usage: python -m benchmarks.corpus KIND SIZE [--seed 1] [--ioc-density 0.05] [--output PATH]
+
+KIND is text (prose with embedded IOCs, as bench_extract's), html (a
+report page, as bench_visible_text's), list, csv, ndjson or stix (feeds,
+as bench_feeds's) or adversarial (the bench_adversarial cases in turn).
+SIZE is in bytes, with an optional KB, MB or GB suffix: 10KB to 500MB
+and beyond, since documents are built in blocks of BLOCK_SIZE characters,
+each from a seed of its own, and written as they are built. The same
+arguments always give the same bytes; the SHA-256 printed at the end
+tells whether two machines benchmark the same document. --ioc-density is
+the share of prose tokens that are IOCs in text and html; feeds hold one
+indicator per record. Text and adversarial documents are exactly SIZE
+characters, the others end with the record or markup that crosses it.
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+from typing import Iterator
+
+from benchmarks.bench_adversarial import ADVERSARIAL_INPUTS
+from benchmarks.bench_extract import generate_corpus
+from benchmarks.bench_feeds import FEED_FORMATS, generate_feed
+from benchmarks.bench_visible_text import PAGE_HEAD, PAGE_TAIL, page_body
+
+BLOCK_SIZE = 1024 * 1024
+KINDS = ('text', 'html') + FEED_FORMATS + ('adversarial',)
+CONTENT_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'list': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'stix': 'application/stix+json;version=2.1',
+    'adversarial': 'text/plain; charset=utf-8',
+}
+SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*([KMG]?)B?', re.IGNORECASE)
+
+
+def parse_size(size):
+    """Bytes of a size such as 4096, 10KB or 1.5MB"""
+    match = SIZE.fullmatch(str(size).strip())
+    if match is None:
+        raise ValueError(f'Invalid size: {size}')
+    return int(float(match.group(1)) * 1024 ** ' KMG'.index(match.group(2).upper() or ' '))
+
+
+def format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        scale = 1024 ** ('KMG'.index(unit[0]) + 1)
+        if size >= scale:
+            return f'{size / scale:.1f}{unit}'
+    return f'{size}B'
+
+
+def _block_seed(seed, index):
+    # random.Random hashes str seeds with SHA-512, the same on every run
+    return f'{seed}/{index}'
+
+
+def _feed_blocks(feed_format, size, seed) -> Iterator[str]:
+    """Feed records in blocks of about BLOCK_SIZE; a STIX bundle's objects
+    are written one block at a time between its opening and closing"""
+    if feed_format == 'stix':
+        bundle = json.loads(generate_feed('stix', 0, seed)[0])
+        head = f'{{"type": "bundle", "id": "{bundle["id"]}", "objects": [\n'
+        yield head
+        size -= len(head)
+    written = 0
+    # A few records first, to learn how long they are
+    records = 16
+    index = 0
+    while written < size:
+        text = generate_feed(feed_format, records, _block_seed(seed, index), header=index == 0)[0]
+        if feed_format == 'stix':
+            separator = ',\n' if index else ''
+            text = separator + ',\n'.join(json.dumps(item) for item in json.loads(text)['objects'])
+        yield text
+        written += len(text)
+        # Records of about BLOCK_SIZE next time, or of what is left
+        record_size = len(text) / records
+        records = max(1, int(min(BLOCK_SIZE, size - written) / record_size) + 1)
+        index += 1
+    if feed_format == 'stix':
+        yield '\n]}\n'
+
+
+def iter_corpus(kind, size, seed=1, ioc_density=0.05) -> Iterator[str]:
+    """A document of kind and about size characters, in blocks"""
+    if kind in FEED_FORMATS:
+        yield from _feed_blocks(kind, size, seed)
+        return
+    if kind == 'html':
+        yield PAGE_HEAD
+        size -= len(PAGE_HEAD) + len(PAGE_TAIL)
+
+    cases = list(ADVERSARIAL_INPUTS.values())
+    written = 0
+    index = 0
+    while written < size:
+        length = min(BLOCK_SIZE, size - written)
+        if kind == 'text':
+            block = generate_corpus(length, seed=_block_seed(seed, index), ioc_density=ioc_density) + ' '
+            block = block[:size - written]
+        elif kind == 'html':
+            block = page_body(length, seed=_block_seed(seed, index), ioc_density=ioc_density)
+        elif kind == 'adversarial':
+            block = (cases[index % len(cases)](length) + '\n')[:size - written]
+        else:
+            raise ValueError(f'Unknown corpus kind: {kind}')
+        yield block
+        written += len(block)
+        index += 1
+
+    if kind == 'html':
+        yield PAGE_TAIL
+
+
+def generate(kind, size, seed=1, ioc_density=0.05):
+    """iter_corpus as one string"""
+    return ''.join(iter_corpus(kind, size, seed, ioc_density))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('size', type=parse_size)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ioc-density', type=float, default=0.05)
+    parser.add_argument('--output', help='file to write; standard output by default')
+    args = parser.parse_args()
+
+    digest = hashlib.sha256()
+    written = 0
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for block in iter_corpus(args.kind, args.size, args.seed, args.ioc_density):
+            output.write(block)
+            data = block.encode()
+            digest.update(data)
+            written += len(data)
+    finally:
+        if args.output:
+            output.close()
+    print(f'{args.kind} {format_size(written)} ({written} bytes), sha256 {digest.hexdigest()}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
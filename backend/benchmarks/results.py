@@ -0,0 +1,50 @@
+"""JSON result files of the benchmarks, for comparing runs between commits.
+
+A file holds the benchmark's name, its arguments, the environment it ran
+in (commit, Python, platform, cores) and a list of results. Each result
+has a unique name within the file and a number of seconds, lower being
+better, plus whatever else the benchmark reports. benchmarks.compare
+matches results by name across two files.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def environment():
+    """Where and on what the benchmark ran"""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                                  cwd=os.path.dirname(__file__)).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def write_results(path, benchmark, args, results):
+    """Write results, a list of dicts with 'name' and 'seconds', to path"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'benchmark': benchmark,
+            'arguments': vars(args),
+            'environment': environment(),
+            'results': results,
+        }, f, indent=2)
+        f.write('\n')
+
+
+def read_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
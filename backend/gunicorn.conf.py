@@ -0,0 +1,72 @@
+"""Production serving: gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is loaded once in the master (preload_app) and the workers are
+forked from it, sharing the warm IOCExtractor copy-on-write. Each worker
+then starts its own scrape job workers and retention thread, as run.py
+does, since threads don't survive a fork. The schema must be migrated
+beforehand (flask --app wsgi db upgrade).
+"""
+import gc
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger('gunicorn.error')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('WEB_THREADS') or 4)
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT') or 60)
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT') or 30)
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+
+# One connection per request thread and job worker, and one each for the
+# retention pass and its lock; read by create_app when the app is loaded
+if os.environ.get('JOB_WORKERS_ENABLED', 'true').lower() == 'true':
+    _job_workers = int(os.environ.get('JOB_WORKERS') or 4)
+else:
+    _job_workers = 0
+if not os.environ.get('DATABASE_POOL_SIZE'):
+    os.environ['DATABASE_POOL_SIZE'] = str(threads + _job_workers + 2)
+
+
+def when_ready(server):
+    from wsgi import app
+
+    if app.config['SCHEDULER_ENABLED']:
+        logger.warning('SCHEDULER_ENABLED is ignored by gunicorn workers; run scheduler.py once per database')
+
+
+def pre_fork(server, worker):
+    # Objects of the preloaded app are never collected, so the collector
+    # doesn't write to (and copy) the pages the workers share
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import db
+    from wsgi import app
+
+    # Connections opened while loading the app belong to the master
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    from app import job_queue, retention
+    from wsgi import app
+
+    if app.config['JOB_WORKERS_ENABLED']:
+        job_queue.start()
+    if app.config['RETENTION_ENABLED']:
+        retention.start()
+
+
+def worker_exit(server, worker):
+    from app import job_queue, retention
+
+    # Running jobs finish rather than wait out JOB_LEASE in another worker
+    job_queue.stop()
+    retention.stop()
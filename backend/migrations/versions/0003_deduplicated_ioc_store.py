@@ -0,0 +1,112 @@
+"""deduplicated ioc store
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 22:50:01.752329
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import IOCType, ioc_value_hash
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ioc_sightings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ioc_id', sa.Integer(), nullable=False),
+    sa.Column('scrape_session_id', sa.Integer(), nullable=False),
+    sa.Column('context', sa.Text(), nullable=True),
+    sa.Column('confidence', sa.Float(), nullable=True),
+    sa.Column('seen_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ioc_id'], ['iocs.id'], ),
+    sa.ForeignKeyConstraint(['scrape_session_id'], ['scrape_sessions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ioc_sightings_ioc_id'), ['ioc_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ioc_sightings_scrape_session_id'), ['scrape_session_id'], unique=False)
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('value_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('sighting_count', sa.Integer(), nullable=True))
+
+    # Key existing rows; normalization lives in Python, so hash in batches
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            'SELECT id, ioc_type, value FROM iocs WHERE id > :last_id ORDER BY id LIMIT 5000'
+        ), {'last_id': last_id}).all()
+        if not rows:
+            break
+        bind.execute(sa.text('UPDATE iocs SET value_hash = :value_hash WHERE id = :id'), [
+            {'id': id, 'value_hash': ioc_value_hash(IOCType[ioc_type], value)} for id, ioc_type, value in rows
+        ])
+        last_id = rows[-1].id
+
+    # Every old row becomes a sighting of the lowest-id row with the same key
+    op.execute("""
+        INSERT INTO ioc_sightings (ioc_id, scrape_session_id, context, confidence, seen_at)
+        SELECT canonical.id, iocs.scrape_session_id, iocs.context, iocs.confidence, iocs.last_seen
+        FROM iocs
+        JOIN (SELECT ioc_type, value_hash, MIN(id) AS id FROM iocs GROUP BY ioc_type, value_hash) AS canonical
+          ON canonical.ioc_type = iocs.ioc_type AND canonical.value_hash = iocs.value_hash
+    """)
+    op.execute("""
+        UPDATE iocs SET
+            first_seen = (SELECT MIN(seen_at) FROM ioc_sightings WHERE ioc_id = iocs.id),
+            last_seen = (SELECT MAX(seen_at) FROM ioc_sightings WHERE ioc_id = iocs.id),
+            confidence = (SELECT MAX(confidence) FROM ioc_sightings WHERE ioc_id = iocs.id),
+            sighting_count = (SELECT COUNT(*) FROM ioc_sightings WHERE ioc_id = iocs.id),
+            scrape_session_id = (SELECT scrape_session_id FROM ioc_sightings WHERE ioc_id = iocs.id
+                                 ORDER BY seen_at DESC, id DESC LIMIT 1),
+            context = (SELECT context FROM ioc_sightings WHERE ioc_id = iocs.id
+                       ORDER BY seen_at DESC, id DESC LIMIT 1)
+        WHERE id IN (SELECT ioc_id FROM ioc_sightings)
+    """)
+    op.execute('DELETE FROM iocs WHERE id NOT IN (SELECT ioc_id FROM ioc_sightings)')
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.alter_column('value_hash',
+               existing_type=sa.String(length=64),
+               nullable=False)
+        batch_op.alter_column('scrape_session_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
+        batch_op.create_unique_constraint('uq_iocs_type_value_hash', ['ioc_type', 'value_hash'])
+
+
+def downgrade():
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_iocs_type_value_hash', type_='unique')
+
+    # Expand sightings back into one row per session and drop the unique rows
+    bind = op.get_bind()
+    last_id = bind.execute(sa.text('SELECT MAX(id) FROM iocs')).scalar() or 0
+    op.execute("""
+        INSERT INTO iocs (scrape_session_id, ioc_type, value, value_hash, context, confidence, first_seen, last_seen)
+        SELECT ioc_sightings.scrape_session_id, iocs.ioc_type, iocs.value, iocs.value_hash,
+               ioc_sightings.context, ioc_sightings.confidence, ioc_sightings.seen_at, ioc_sightings.seen_at
+        FROM ioc_sightings JOIN iocs ON iocs.id = ioc_sightings.ioc_id
+    """)
+    with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ioc_sightings_scrape_session_id'))
+        batch_op.drop_index(batch_op.f('ix_ioc_sightings_ioc_id'))
+
+    op.drop_table('ioc_sightings')
+    bind.execute(sa.text('DELETE FROM iocs WHERE id <= :last_id'), {'last_id': last_id})
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.alter_column('scrape_session_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+        batch_op.drop_column('sighting_count')
+        batch_op.drop_column('value_hash')
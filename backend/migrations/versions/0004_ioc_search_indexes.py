@@ -0,0 +1,49 @@
+"""ioc search indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 23:02:08.838647
+
+"""
+from alembic import op
+
+from app.models import pg_trgm_available
+from app.search import create_sqlite_fts, drop_sqlite_fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.create_index('ix_iocs_first_seen', ['first_seen'], unique=False)
+        batch_op.create_index('ix_iocs_type_first_seen', ['ioc_type', 'first_seen'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Without contrib, substring searches fall back to sequential scans
+        if not pg_trgm_available(bind):
+            return
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_iocs_value_trgm', 'iocs', ['value'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'value': 'gin_trgm_ops'})
+    elif bind.dialect.name == 'sqlite':
+        # Batch migrations that recreate iocs on SQLite drop these triggers;
+        # such migrations must call create_sqlite_fts again afterwards
+        create_sqlite_fts(bind)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_iocs_value_trgm')
+    elif bind.dialect.name == 'sqlite':
+        drop_sqlite_fts(bind)
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.drop_index('ix_iocs_type_first_seen')
+        batch_op.drop_index('ix_iocs_first_seen')
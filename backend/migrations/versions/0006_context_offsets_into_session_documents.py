@@ -0,0 +1,65 @@
+"""context offsets into session documents
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 23:43:01.366160
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.search import create_sqlite_fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scrape_documents',
+    sa.Column('scrape_session_id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['scrape_session_id'], ['scrape_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('scrape_session_id')
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        # Lets substr() read only the chunks holding a context
+        op.execute('ALTER TABLE scrape_documents ALTER COLUMN content SET STORAGE EXTERNAL')
+
+    with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('context_offset', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('context_length', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('context_offset', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('context_length', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    # Copy contexts stored as offsets back into the context columns
+    for table in ('iocs', 'ioc_sightings'):
+        op.execute(
+            f'UPDATE {table} SET context = ('
+            'SELECT substr(scrape_documents.content, '
+            f'{table}.context_offset + 1, {table}.context_length) FROM scrape_documents '
+            f'WHERE scrape_documents.scrape_session_id = {table}.scrape_session_id'
+            f') WHERE context_offset IS NOT NULL'
+        )
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.drop_column('context_length')
+        batch_op.drop_column('context_offset')
+
+    with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+        batch_op.drop_column('context_length')
+        batch_op.drop_column('context_offset')
+
+    op.drop_table('scrape_documents')
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # Dropping columns recreated iocs without its FTS triggers
+        create_sqlite_fts(bind)
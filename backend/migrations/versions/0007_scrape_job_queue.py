@@ -0,0 +1,41 @@
+"""scrape job queue
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:39:20.358911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scrape_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('scrape_session_id', sa.Integer(), nullable=False),
+    sa.Column('url', sa.Text(), nullable=True),
+    sa.Column('options', sa.JSON(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('locked_by', sa.String(length=255), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['scrape_session_id'], ['scrape_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('scrape_session_id')
+    )
+
+
+def downgrade():
+    # Queued scrapes would never run
+    op.execute(
+        "UPDATE scrape_sessions SET status = 'failed', error_message = 'Job queue removed' "
+        'WHERE id IN (SELECT scrape_session_id FROM scrape_jobs)'
+    )
+    op.drop_table('scrape_jobs')
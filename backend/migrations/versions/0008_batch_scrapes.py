@@ -0,0 +1,50 @@
+"""batch scrapes
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:45:28.714263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('scrape_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_scrape_jobs_batch_id'), ['batch_id'], unique=False)
+
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('url', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_scrape_sessions_batch_id'), ['batch_id'], unique=False)
+
+    # URLs of earlier source scrapes and of queued ad-hoc ones
+    op.execute(
+        'UPDATE scrape_sessions SET url = ('
+        'SELECT url FROM source_urls WHERE source_urls.id = scrape_sessions.source_url_id'
+        ') WHERE source_url_id IS NOT NULL'
+    )
+    op.execute(
+        'UPDATE scrape_sessions SET url = ('
+        'SELECT url FROM scrape_jobs WHERE scrape_jobs.scrape_session_id = scrape_sessions.id'
+        ') WHERE source_url_id IS NULL'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_scrape_sessions_batch_id'))
+        batch_op.drop_column('batch_id')
+        batch_op.drop_column('url')
+
+    with op.batch_alter_table('scrape_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_scrape_jobs_batch_id'))
+        batch_op.drop_column('batch_id')
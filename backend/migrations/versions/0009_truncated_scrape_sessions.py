@@ -0,0 +1,26 @@
+"""truncated scrape sessions
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 02:10:41.382906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('truncated', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.drop_column('truncated')
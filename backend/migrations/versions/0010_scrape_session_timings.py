@@ -0,0 +1,40 @@
+"""scrape session timings
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 09:42:17.516204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fetch_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('parse_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('extract_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('validate_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('persist_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('bytes_fetched', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('matches', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rejected', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.drop_column('rejected')
+        batch_op.drop_column('matches')
+        batch_op.drop_column('bytes_fetched')
+        batch_op.drop_column('persist_seconds')
+        batch_op.drop_column('validate_seconds')
+        batch_op.drop_column('extract_seconds')
+        batch_op.drop_column('parse_seconds')
+        batch_op.drop_column('fetch_seconds')
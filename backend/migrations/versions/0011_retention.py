@@ -0,0 +1,173 @@
+"""retention: cascading deletes, deleted sources and monthly sighting partitions
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 11:05:52.204118
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.search import create_sqlite_fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+# PostgreSQL's names for the constraints, given to SQLite's unnamed ones so
+# batch mode can drop them
+NAMING_CONVENTION = {
+    'fk': '%(table_name)s_%(column_0_name)s_fkey',
+    'uq': '%(table_name)s_%(column_0_name)s_key',
+}
+# (table, column, referred table, ON DELETE) of the foreign keys that now
+# delete or unlink their rows with the row they refer to
+FOREIGN_KEYS = (
+    ('scrape_sessions', 'source_url_id', 'source_urls', 'CASCADE'),
+    ('iocs', 'scrape_session_id', 'scrape_sessions', 'SET NULL'),
+    ('ioc_sightings', 'ioc_id', 'iocs', 'CASCADE'),
+    ('ioc_sightings', 'scrape_session_id', 'scrape_sessions', 'CASCADE'),
+)
+SIGHTING_COLUMNS = 'id, ioc_id, scrape_session_id, context, context_offset, context_length, confidence, seen_at'
+# Months partitioned ahead of the current one; app.retention keeps it up
+PARTITIONS_AHEAD = 2
+
+
+def _months(first, last):
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        yield month
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _replace_foreign_key(table, column, referred, ondelete):
+    name = f'{table}_{column}_fkey'
+    with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def _sightings_table(partitioned):
+    """CREATE TABLE of ioc_sightings, partitioned by month or as before"""
+    ondelete = ' ON DELETE CASCADE' if partitioned else ''
+    return f"""
+        CREATE TABLE ioc_sightings (
+            id INTEGER NOT NULL DEFAULT nextval('ioc_sightings_id_seq'),
+            ioc_id INTEGER NOT NULL,
+            scrape_session_id INTEGER NOT NULL,
+            context TEXT,
+            context_offset INTEGER,
+            context_length INTEGER,
+            confidence FLOAT,
+            seen_at TIMESTAMP WITHOUT TIME ZONE {'NOT NULL' if partitioned else 'NULL'},
+            CONSTRAINT ioc_sightings_pkey PRIMARY KEY ({'id, seen_at' if partitioned else 'id'}),
+            CONSTRAINT ioc_sightings_ioc_id_fkey FOREIGN KEY (ioc_id) REFERENCES iocs (id){ondelete},
+            CONSTRAINT ioc_sightings_scrape_session_id_fkey FOREIGN KEY (scrape_session_id)
+                REFERENCES scrape_sessions (id){ondelete}
+        ){' PARTITION BY RANGE (seen_at)' if partitioned else ''}
+    """
+
+
+def _rebuild_sightings(partitioned):
+    """Copy ioc_sightings into a new table, partitioned by month of seen_at or not"""
+    bind = op.get_bind()
+    op.execute('ALTER TABLE ioc_sightings RENAME TO ioc_sightings_old')
+    op.execute('ALTER INDEX ioc_sightings_pkey RENAME TO ioc_sightings_old_pkey')
+    op.execute('ALTER INDEX ix_ioc_sightings_ioc_id RENAME TO ix_ioc_sightings_old_ioc_id')
+    op.execute('ALTER INDEX ix_ioc_sightings_scrape_session_id RENAME TO ix_ioc_sightings_old_scrape_session_id')
+    op.execute(_sightings_table(partitioned))
+    if partitioned:
+        first, last = bind.execute(sa.text('SELECT MIN(seen_at), MAX(seen_at) FROM ioc_sightings_old')).one()
+        now = datetime.utcnow()
+        last = max(last or now, now).date()
+        for _ in range(PARTITIONS_AHEAD):
+            last = _next_month(last)
+        for month in _months(first or now, last):
+            op.execute(
+                f"CREATE TABLE ioc_sightings_y{month.year:04d}m{month.month:02d} PARTITION OF ioc_sightings "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            )
+        # Rows of months without a partition yet, until app.retention adds it
+        op.execute('CREATE TABLE ioc_sightings_default PARTITION OF ioc_sightings DEFAULT')
+    op.execute(f'INSERT INTO ioc_sightings ({SIGHTING_COLUMNS}) SELECT {SIGHTING_COLUMNS} FROM ioc_sightings_old')
+    op.execute('ALTER SEQUENCE ioc_sightings_id_seq OWNED BY ioc_sightings.id')
+    op.execute('DROP TABLE ioc_sightings_old')
+    op.create_index('ix_ioc_sightings_ioc_id', 'ioc_sightings', ['ioc_id'], unique=False)
+    op.create_index('ix_ioc_sightings_scrape_session_id', 'ioc_sightings', ['scrape_session_id'], unique=False)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # seen_at becomes the partition key, so it can't be null
+    bind.execute(sa.text("""
+        UPDATE ioc_sightings SET seen_at = COALESCE(
+            (SELECT completed_at FROM scrape_sessions WHERE scrape_sessions.id = ioc_sightings.scrape_session_id),
+            :now)
+        WHERE seen_at IS NULL
+    """), {'now': datetime.utcnow()})
+
+    # Deleted sources stay until their sessions are purged, and don't hold on to their URL
+    with op.batch_alter_table('source_urls', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.drop_constraint('source_urls_url_key', type_='unique')
+        batch_op.create_index('uq_source_urls_url', ['url'], unique=True,
+                              postgresql_where=sa.text('deleted_at IS NULL'),
+                              sqlite_where=sa.text('deleted_at IS NULL'))
+
+    # Unlinking a deleted session's IOCs looks them up by session
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_iocs_scrape_session_id'), ['scrape_session_id'], unique=False)
+
+    if bind.dialect.name == 'postgresql':
+        for table, column, referred, ondelete in FOREIGN_KEYS[:2]:
+            _replace_foreign_key(table, column, referred, ondelete)
+        _rebuild_sightings(partitioned=True)
+    else:
+        for table, column, referred, ondelete in FOREIGN_KEYS:
+            _replace_foreign_key(table, column, referred, ondelete)
+        with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+            batch_op.alter_column('seen_at', existing_type=sa.DateTime(), nullable=False)
+        if bind.dialect.name == 'sqlite':
+            # Rebuilding iocs dropped the FTS triggers
+            create_sqlite_fts(bind)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        _rebuild_sightings(partitioned=False)
+        for table, column, referred, _ in FOREIGN_KEYS[:2]:
+            _replace_foreign_key(table, column, referred, None)
+    else:
+        with op.batch_alter_table('ioc_sightings', schema=None) as batch_op:
+            batch_op.alter_column('seen_at', existing_type=sa.DateTime(), nullable=True)
+        for table, column, referred, _ in FOREIGN_KEYS:
+            _replace_foreign_key(table, column, referred, None)
+
+    with op.batch_alter_table('iocs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_iocs_scrape_session_id'))
+    if bind.dialect.name == 'sqlite':
+        create_sqlite_fts(bind)
+
+    # Sources waiting to be purged go with their sessions, as deleting them used to
+    source_ids = sa.text('SELECT id FROM source_urls WHERE deleted_at IS NOT NULL')
+    session_ids = sa.text(f'SELECT id FROM scrape_sessions WHERE source_url_id IN ({source_ids.text})')
+    op.execute(f'UPDATE iocs SET scrape_session_id = NULL WHERE scrape_session_id IN ({session_ids.text})')
+    for table in ('ioc_sightings', 'scrape_documents', 'scrape_jobs'):
+        op.execute(f'DELETE FROM {table} WHERE scrape_session_id IN ({session_ids.text})')
+    op.execute(f'DELETE FROM scrape_sessions WHERE id IN ({session_ids.text})')
+    op.execute(f'DELETE FROM source_urls WHERE id IN ({source_ids.text})')
+    with op.batch_alter_table('source_urls', schema=None) as batch_op:
+        batch_op.drop_index('uq_source_urls_url', postgresql_where=sa.text('deleted_at IS NULL'),
+                            sqlite_where=sa.text('deleted_at IS NULL'))
+        batch_op.create_unique_constraint('source_urls_url_key', ['url'])
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,29 @@
+"""scrape session running_at
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 14:05:31.208417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('running_at', sa.DateTime(), nullable=True))
+
+    # Job workers used to overwrite started_at when they claimed a session
+    op.execute("UPDATE scrape_sessions SET running_at = started_at WHERE status <> 'pending'")
+
+
+def downgrade():
+    with op.batch_alter_table('scrape_sessions', schema=None) as batch_op:
+        batch_op.drop_column('running_at')
@@ -1,13 +1,27 @@
-from app import create_app, db
+from app import create_app, job_queue, retention, scheduler
 import os
 
 app = create_app()
 
+# Development server; the schema comes from `flask --app run db upgrade`, and
+# production serves wsgi.py with gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
-    app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
+    # The debug reloader runs this script twice: a parent that only watches
+    # files, and the child serving requests, which it sets WERKZEUG_RUN_MAIN in
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # In-process scheduler for single-process setups; use scheduler.py otherwise
+        if app.config['SCHEDULER_ENABLED']:
+            scheduler.start()
+        
+        # Scrape job workers; set JOB_WORKERS_ENABLED=false when worker.py runs them
+        if app.config['JOB_WORKERS_ENABLED']:
+            job_queue.start()
+        
+        # Purges deleted sources and applies the retention policies; scheduler.py runs it too
+        if app.config['RETENTION_ENABLED']:
+            retention.start()
+    
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,10 @@
+from app import create_app, retention, scheduler
+import logging
+
+app = create_app()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if app.config['RETENTION_ENABLED']:
+        retention.start()
+    scheduler.run_forever()
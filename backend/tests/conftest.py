@@ -0,0 +1,68 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+REPORT = '<html><body><p>Callbacks to 203.0.113.7 and evil-c2.example.net were seen.</p></body></html>'
+
+
+@pytest.fixture
+def slow_site():
+    """Start a threaded HTTP server answering every GET with body (REPORT
+    by default) after latency seconds, or with drip, one byte of it every
+    drip seconds; returns (base URL, list of request times)"""
+    servers = []
+
+    def start(latency, drip=None, body=REPORT, content_type='text/html; charset=utf-8'):
+        requests = []
+        payload = body.encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                requests.append(time.monotonic())
+                time.sleep(latency)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                if drip is None:
+                    self.wfile.write(payload)
+                    return
+                for index in range(len(payload)):
+                    self.wfile.write(payload[index:index + 1])
+                    self.wfile.flush()
+                    time.sleep(drip)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}', requests
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on a new SQLite database, with one job worker thread that
+    the test starts; stopped afterwards"""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "test.db"}')
+    from app import create_app, db, job_queue
+
+    app = create_app()
+    app.config.update(JOB_WORKERS=1, JOB_POLL_INTERVAL=0.1, IOC_STATS_TTL=0)
+    with app.app_context():
+        db.create_all()
+    yield app
+    job_queue.stop()
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,50 @@
+import time
+
+from app.async_scraper import AsyncWebScraper
+from app.scrapers import WebScraper
+
+
+def test_requests_queued_behind_per_host_limit_do_not_time_out(slow_site):
+    # 12 requests, 2 at a time, 0.3s each: the last wait about 1.5s for a
+    # slot, well past the connect timeout, which must only time the socket
+    site, requests = slow_site(0.3)
+    scraper = AsyncWebScraper(WebScraper(), concurrency=50, per_host=2, timeout=5, connect_timeout=0.2)
+
+    results = scraper.scrape_many([f'{site}/report/{index}' for index in range(12)])
+
+    assert [result.get('error') for result in results] == [None] * 12
+    assert all(result['success'] for result in results)
+    assert len(requests) == 12
+
+
+def test_per_host_limit_holds(slow_site):
+    site, requests = slow_site(0.2)
+    scraper = AsyncWebScraper(WebScraper(), concurrency=50, per_host=3)
+
+    scraper.scrape_many([f'{site}/report/{index}' for index in range(9)])
+
+    # Three waves of three requests 0.2s apart
+    requests.sort()
+    assert requests[3] - requests[0] >= 0.15
+    assert requests[6] - requests[3] >= 0.15
+
+
+def test_read_timeout_still_applies(slow_site):
+    site, _ = slow_site(1.0)
+    scraper = AsyncWebScraper(WebScraper(), per_host=1, timeout=0.2)
+
+    result, = scraper.scrape_many([f'{site}/report'])
+
+    assert not result['success']
+
+
+def test_timeout_bounds_a_slow_drip(slow_site):
+    # A byte every 0.1s never trips a read timeout; the request's total must
+    site, _ = slow_site(0, drip=0.1)
+    scraper = AsyncWebScraper(WebScraper(), per_host=1, timeout=0.5)
+
+    started = time.monotonic()
+    result, = scraper.scrape_many([f'{site}/report'])
+
+    assert not result['success']
+    assert time.monotonic() - started < 3
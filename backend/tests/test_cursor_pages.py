@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, persistence
+from app.models import IOC, IOCType, ScrapeSession
+
+START = datetime(2026, 3, 1)
+
+
+def _walk(client, path, key, per_page, cursor='', **params):
+    """Follow next_cursor from cursor, the first page by default; returns
+    the ids of each page"""
+    pages = []
+    while cursor is not None:
+        response = client.get(path, query_string={'cursor': cursor, 'per_page': per_page, **params})
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append([item['id'] for item in body[key]])
+        cursor = body['next_cursor']
+    return pages
+
+
+def _flatten(pages):
+    return [id for page in pages for id in page]
+
+
+@pytest.fixture
+def iocs(app):
+    """25 IOCs first seen at three instants, so most share first_seen;
+    returns their ids newest first"""
+    with app.app_context():
+        for batch, count in enumerate((10, 7, 8)):
+            session = ScrapeSession(url=f'http://feeds.invalid/{batch}', status='completed')
+            db.session.add(session)
+            db.session.flush()
+            persistence.save_iocs(session.id, [
+                {'type': IOCType.DOMAIN, 'value': f'host-{batch}-{index}.badhost.ru', 'context': None,
+                 'confidence': 0.9}
+                for index in range(count)
+            ], START + timedelta(hours=batch))
+        db.session.commit()
+        return [ioc.id for ioc in IOC.query.order_by(IOC.first_seen.desc(), IOC.id.desc())]
+
+
+@pytest.fixture
+def sessions(app):
+    """23 sessions, most sharing started_at; returns their ids newest first"""
+    with app.app_context():
+        rows = [ScrapeSession(url=f'http://feeds.invalid/{index}', status='completed',
+                              started_at=START + timedelta(minutes=index // 5))
+                for index in range(23)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [session.id for session in sorted(rows, key=lambda row: (row.started_at, row.id), reverse=True)]
+
+
+@pytest.mark.parametrize('per_page', [1, 4, 7, 25, 50])
+def test_ioc_pages_neither_overlap_nor_skip_tied_rows(app, iocs, per_page):
+    pages = _walk(app.test_client(), '/api/iocs', 'iocs', per_page)
+
+    assert _flatten(pages) == iocs
+    assert all(len(page) == per_page for page in pages[:-1])
+
+
+@pytest.mark.parametrize('per_page', [1, 5, 6, 23])
+def test_session_pages_neither_overlap_nor_skip_tied_rows(app, sessions, per_page):
+    pages = _walk(app.test_client(), '/api/sessions', 'sessions', per_page)
+
+    assert _flatten(pages) == sessions
+    assert all(len(page) == per_page for page in pages[:-1])
+
+
+def test_filtered_pages_keep_to_the_filter(app, iocs):
+    pages = _walk(app.test_client(), '/api/iocs', 'iocs', 3, search='host-1-')
+
+    with app.app_context():
+        expected = [id for id in iocs if db.session.get(IOC, id).value.startswith('host-1-')]
+    assert _flatten(pages) == expected
+
+
+def test_rows_added_while_paging_do_not_shift_later_pages(app, sessions):
+    client = app.test_client()
+    first = client.get('/api/sessions', query_string={'cursor': '', 'per_page': 10}).get_json()
+    with app.app_context():
+        db.session.add(ScrapeSession(url='http://feeds.invalid/new', status='completed',
+                                     started_at=START + timedelta(days=1)))
+        db.session.commit()
+
+    rest = _walk(client, '/api/sessions', 'sessions', 10, first['next_cursor'])
+
+    assert [session['id'] for session in first['sessions']] + _flatten(rest) == sessions
+
+
+def test_count_exact_gives_the_total(app, iocs):
+    body = app.test_client().get('/api/iocs', query_string={'cursor': '', 'per_page': 5, 'count': 'exact'}).get_json()
+
+    assert body['total'] == len(iocs)
+    assert 'total' not in app.test_client().get('/api/iocs', query_string={'cursor': ''}).get_json()
+
+
+@pytest.mark.parametrize('params', [
+    {'cursor': 'not-a-cursor'},
+    {'cursor': '', 'count': 'roughly'},
+    {'cursor': '', 'per_page': 0},
+])
+def test_bad_cursor_requests_are_rejected(app, params):
+    response = app.test_client().get('/api/sessions', query_string=params)
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,42 @@
+import pytest
+
+from app.scrapers import IOCExtractor
+from benchmarks.bench_extract import generate_corpus, legacy_extract
+
+
+def _chunks(text, size):
+    return (text[start:start + size] for start in range(0, len(text), size))
+
+
+def _sorted(iocs):
+    # A stream yields each window's IOCs by type, so only the set is comparable
+    return sorted(iocs, key=lambda ioc: (ioc['type'].value, ioc['value']))
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_single_pass_matches_per_pattern_scan(seed):
+    extractor = IOCExtractor()
+    text = generate_corpus(200_000, seed=seed)
+
+    assert extractor.extract_iocs(text) == legacy_extract(extractor, text)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_stream_matches_whole_text(chunk_size):
+    extractor = IOCExtractor()
+    text = generate_corpus(50_000, seed=4)
+
+    streamed = list(extractor.iter_iocs(_chunks(text, chunk_size), window_size=2048, overlap=512))
+
+    assert _sorted(streamed) == _sorted(extractor.extract_iocs(text))
+
+
+def test_stream_finds_iocs_split_across_chunks():
+    extractor = IOCExtractor()
+    text = 'beacon to 203.0.113.45 then evil-domain.example.org, hash ' + 'd41d8cd98f00b204e9800998ecf8427e'
+    expected = extractor.extract_iocs(text)
+
+    streamed = list(extractor.iter_iocs(_chunks(text, 5), window_size=16, overlap=64))
+
+    assert {ioc['value'] for ioc in expected} >= {'203.0.113.45', 'd41d8cd98f00b204e9800998ecf8427e'}
+    assert _sorted(streamed) == _sorted(expected)
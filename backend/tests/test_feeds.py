@@ -0,0 +1,17 @@
+import pytest
+
+from app.feeds import FeedParser, LineScanner
+from app.scrapers import IOCExtractor
+
+
+def test_incomplete_scanner_fails_when_created():
+    class HeaderOnlyScanner(LineScanner):
+        pass
+
+    with pytest.raises(TypeError, match='_scan_lines'):
+        HeaderOnlyScanner(FeedParser(IOCExtractor()))
+
+
+@pytest.mark.parametrize('feed_format', ['list', 'csv', 'json'])
+def test_feed_formats_have_complete_scanners(feed_format):
+    assert FeedParser(IOCExtractor()).scanner(feed_format) is not None
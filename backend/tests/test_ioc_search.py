@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from app import db, persistence
+from app.models import IOCType, ScrapeSession
+
+HASH = 'd41d8cd98f00b204e9800998ecf8427e'
+IOCS = [
+    (IOCType.IP_ADDRESS, '1.2.3.4'),
+    (IOCType.IP_ADDRESS, '11.2.3.45'),
+    (IOCType.IP_ADDRESS, '2001:db8::1'),
+    (IOCType.URL, 'http://1.2.3.4/gate.php'),
+    (IOCType.URL, f'http://evil.example.net/{HASH}.exe'),
+    (IOCType.HASH, HASH),
+    (IOCType.DOMAIN, 'evil.example.net'),
+]
+
+
+@pytest.fixture
+def client(app):
+    with app.app_context():
+        session = ScrapeSession(url='http://feeds.invalid/', status='completed')
+        db.session.add(session)
+        db.session.flush()
+        persistence.save_iocs(session.id, [
+            {'type': ioc_type, 'value': value, 'context': None, 'confidence': 0.9} for ioc_type, value in IOCS
+        ], datetime.utcnow())
+        db.session.commit()
+    return app.test_client()
+
+
+def _values(client, **params):
+    response = client.get('/api/iocs', query_string={'per_page': 100, **params})
+    assert response.status_code == 200
+    return sorted(ioc['value'] for ioc in response.get_json()['iocs'])
+
+
+def test_complete_ip_matches_values_containing_it(client):
+    assert _values(client, search='1.2.3.4') == ['1.2.3.4', '11.2.3.45', 'http://1.2.3.4/gate.php']
+
+
+def test_complete_ip_with_another_type_filter(client):
+    assert _values(client, search='1.2.3.4', type='url') == ['http://1.2.3.4/gate.php']
+
+
+def test_complete_ip_with_its_type_filter(client):
+    assert _values(client, search='1.2.3.4', type='ip_address') == ['1.2.3.4', '11.2.3.45']
+
+
+def test_complete_hash_matches_urls_containing_it(client):
+    assert _values(client, search=HASH.upper()) == [HASH, f'http://evil.example.net/{HASH}.exe']
+
+
+def test_other_spelling_of_an_address_matches_it(client):
+    assert _values(client, search='2001:db8:0:0::1') == ['2001:db8::1']
+
+
+def test_substring_search(client):
+    assert _values(client, search='evil.example', type='domain') == ['evil.example.net']
+    assert _values(client, search='ex') == ['evil.example.net', f'http://evil.example.net/{HASH}.exe']
@@ -0,0 +1,52 @@
+from app import db, services
+from app.models import IOCSighting, ScrapeSession
+from app.scrapers import WebScraper
+
+REPORTS = [
+    '<html><body><p>Beacons to 203.0.113.7 and Evil-C2.badhost.ru this week.</p></body></html>',
+    '<html><body><p>Still beaconing: evil-c2.badhost.ru. and 203.0.113.7, also EVIL-C2.BADHOST.RU.</p></body></html>',
+]
+
+
+def _scrape_reports(slow_site):
+    """Scrape each report into its own session; returns the session ids"""
+    scraper = WebScraper()
+    session_ids = []
+    for report in REPORTS:
+        site, _ = slow_site(0, body=report)
+        session = ScrapeSession(url=site, status='running')
+        db.session.add(session)
+        db.session.flush()
+        services.run_scrape(scraper, session, site)
+        db.session.commit()
+        session_ids.append(session.id)
+    return session_ids
+
+
+def test_repeat_scrapes_update_one_ioc_per_indicator(app, slow_site):
+    with app.app_context():
+        first, second = _scrape_reports(slow_site)
+        sessions = [db.session.get(ScrapeSession, session_id) for session_id in (first, second)]
+
+    iocs = app.test_client().get('/api/iocs').get_json()['iocs']
+
+    assert sorted((ioc['ioc_type'], ioc['value'].lower()) for ioc in iocs) == [
+        ('domain', 'evil-c2.badhost.ru'), ('ip_address', '203.0.113.7')
+    ]
+    for ioc in iocs:
+        assert ioc['sighting_count'] == 2
+        assert ioc['first_seen'] == sessions[0].completed_at.isoformat()
+        assert ioc['last_seen'] == sessions[1].completed_at.isoformat()
+        assert ioc['scrape_session_id'] == second
+
+
+def test_each_session_has_one_sighting_per_indicator(app, slow_site):
+    with app.app_context():
+        session_ids = _scrape_reports(slow_site)
+        assert IOCSighting.query.count() == 4
+
+    client = app.test_client()
+    for session_id in session_ids:
+        sightings = client.get(f'/api/sessions/{session_id}/iocs').get_json()['iocs']
+        assert len(sightings) == 2
+        assert len({sighting['id'] for sighting in sightings}) == 2
@@ -0,0 +1,115 @@
+import threading
+from datetime import datetime, timedelta
+
+from app import db, job_queue
+from app.models import ScrapeJob
+
+from tests.test_session_pages import _wait_for
+
+
+def _configure(app, **config):
+    """Set the claim settings start() would, without starting workers"""
+    app.config.update(config)
+    job_queue.lease = app.config['JOB_LEASE']
+    job_queue.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+    job_queue.batch_size = app.config['JOB_BATCH_SIZE']
+
+
+def _expire_leases(app):
+    with app.app_context():
+        ScrapeJob.query.update({ScrapeJob.locked_at: datetime.utcnow() - timedelta(seconds=job_queue.lease + 1)})
+        db.session.commit()
+
+
+def test_racing_workers_never_claim_a_job_twice(app):
+    _configure(app)
+    with app.app_context():
+        for index in range(40):
+            job_queue.enqueue(f'http://feeds.invalid/{index}')
+        job_ids = sorted(job.id for job in ScrapeJob.query)
+    claims = {}
+    barrier = threading.Barrier(4)
+
+    def worker(name):
+        claimed = claims[name] = []
+        with app.app_context():
+            barrier.wait()
+            while True:
+                job_ids = job_queue._claim(name)
+                if not job_ids:
+                    return
+                claimed += job_ids
+
+    threads = [threading.Thread(target=worker, args=(f'worker-{index}',)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [job_id for job_ids in claims.values() for job_id in job_ids]
+    assert sorted(claimed) == job_ids
+    with app.app_context():
+        assert {job.attempts for job in ScrapeJob.query} == {1}
+
+
+def test_claimed_job_is_held_until_its_lease_expires(app):
+    _configure(app, JOB_LEASE=600)
+    with app.app_context():
+        job_queue.enqueue('http://feeds.invalid/report')
+        job_id, = job_queue._claim('dead-worker')
+
+        assert job_queue._claim('other-worker') == []
+
+    _expire_leases(app)
+    with app.app_context():
+        assert job_queue._claim('other-worker') == [job_id]
+        job = db.session.get(ScrapeJob, job_id)
+        assert (job.locked_by, job.attempts) == ('other-worker', 2)
+
+
+def test_expired_job_is_run_again(app, slow_site):
+    site, requests = slow_site(0)
+    _configure(app)
+    with app.app_context():
+        session_id = job_queue.enqueue(f'{site}/report').id
+        job_queue._claim('dead-worker')
+    _expire_leases(app)
+
+    job_queue.start()
+    session = _wait_for(app, session_id)
+
+    assert session.status == 'completed'
+    assert session.iocs_found == 1
+    assert len(requests) == 1
+    with app.app_context():
+        assert ScrapeJob.query.count() == 0
+
+
+def test_job_is_abandoned_after_max_attempts(app):
+    _configure(app, JOB_MAX_ATTEMPTS=2)
+    with app.app_context():
+        session = job_queue.enqueue('http://feeds.invalid/report')
+        for attempt in range(2):
+            job_ids = job_queue._claim(f'worker-{attempt}')
+            assert [job for job, _ in job_queue._start(job_ids)]
+            _expire_leases(app)
+
+        job_ids = job_queue._claim('worker-2')
+        assert job_queue._start(job_ids) == []
+
+        db.session.refresh(session)
+        assert session.status == 'failed'
+        assert session.error_message == 'Scrape abandoned after 2 interrupted attempts'
+        assert ScrapeJob.query.count() == 0
+
+
+def test_batch_jobs_are_claimed_together_up_to_the_batch_size(app):
+    _configure(app, JOB_BATCH_SIZE=3)
+    with app.app_context():
+        job_queue.enqueue('http://feeds.invalid/alone')
+        job_queue.enqueue_batch([(f'http://feeds.invalid/{index}', None) for index in range(5)])
+        batch = [job.id for job in ScrapeJob.query.filter(ScrapeJob.batch_id.isnot(None)).order_by(ScrapeJob.id)]
+
+        assert len(job_queue._claim('worker')) == 1
+        assert job_queue._claim('worker') == batch[:3]
+        assert job_queue._claim('worker') == batch[3:]
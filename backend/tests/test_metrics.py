@@ -0,0 +1,21 @@
+import pytest
+
+from app import metrics
+
+
+def test_incomplete_metric_fails_when_created():
+    class Gauge(metrics.Metric):
+        kind = 'gauge'
+
+    with pytest.raises(TypeError, match='_samples'):
+        Gauge('ioc_test_gauge', 'A gauge without samples.')
+    assert all(metric.name != 'ioc_test_gauge' for metric in metrics.REGISTRY)
+
+
+def test_render_histogram_buckets():
+    metrics.scrape_bytes.observe(2000)
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE ioc_scrape_bytes histogram' in lines
+    assert any(line.startswith('ioc_scrape_bytes_bucket{le="4096"} ') for line in lines)
+    assert any(line.startswith('ioc_scrape_bytes_count ') for line in lines)
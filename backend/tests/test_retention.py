@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from app import db, persistence, retention, services
+from app.models import IOC, IOCType, ScrapeSession, SourceURL
+
+
+def _scrape(source, started_at, values):
+    """A completed session of source that found values, at started_at"""
+    session = ScrapeSession(source_url_id=source.id, url=source.url, status='completed', started_at=started_at,
+                            completed_at=started_at)
+    db.session.add(session)
+    db.session.flush()
+    persistence.save_iocs(session.id, [
+        {'type': IOCType.DOMAIN, 'value': value, 'context': None, 'confidence': 0.9} for value in values
+    ], started_at)
+    db.session.commit()
+    return session
+
+
+def _skip(source):
+    """A scrape of source skipped as unchanged, now"""
+    session = ScrapeSession(source_url_id=source.id, url=source.url, status='running')
+    db.session.add(session)
+    db.session.flush()
+    services.store_scrape_result(session, {'success': True, 'skipped': 'unchanged', 'validators': source.validators()},
+                                 source)
+    db.session.commit()
+    return session
+
+
+def _sources(*names):
+    sources = [SourceURL(url=f'http://feeds.invalid/{name}', name=name) for name in names]
+    db.session.add_all(sources)
+    db.session.commit()
+    return sources
+
+
+def test_unchanged_source_keeps_its_iocs_past_the_retention_window(app):
+    app.config['IOC_RETENTION_DAYS'] = 30
+    with app.app_context():
+        unchanged, gone = _sources('unchanged', 'gone')
+        long_ago = datetime.utcnow() - timedelta(days=90)
+        _scrape(unchanged, long_ago, ['still-published.example.net'])
+        _scrape(gone, long_ago, ['no-longer-published.example.net'])
+        _skip(unchanged)
+
+        counts = retention.run_once()
+
+        assert counts['iocs'] == 1
+        assert [ioc.value for ioc in IOC.query] == ['still-published.example.net']
+
+
+def test_session_policies_keep_the_newest_completed_session(app):
+    app.config.update(SESSION_RETENTION_DAYS=30, SESSION_RETENTION_PER_SOURCE=1, IOC_RETENTION_DAYS=30)
+    with app.app_context():
+        source, = _sources('unchanged')
+        now = datetime.utcnow()
+        _scrape(source, now - timedelta(days=120), ['old.example.net'])
+        newest = _scrape(source, now - timedelta(days=90), ['still-published.example.net'])
+        _skip(source)
+        skipped = _skip(source)
+
+        retention.run_once()
+
+        assert sorted(session.id for session in ScrapeSession.query) == [newest.id, skipped.id]
+        # A later skip still has the sightings of the unchanged content to refresh
+        later = _skip(source)
+        assert [(ioc.value, ioc.last_seen) for ioc in IOC.query] == [('still-published.example.net',
+                                                                     later.completed_at)]
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, scheduler
+from app.models import ScrapeSession, SourceURL
+from app.scheduler import _timestamp
+
+
+@pytest.fixture
+def running_scheduler(app):
+    """Start the scheduler without jitter on the sources the test added;
+    stopped afterwards"""
+    app.config.update(SCHEDULER_JITTER=0, SCHEDULER_WORKERS=2, SCHEDULER_SYNC_INTERVAL=0.2)
+    yield scheduler.start
+    scheduler.stop()
+
+
+def _sources(app, *rows):
+    """Add sources from (url, scrape_interval, last_scraped); returns their ids"""
+    with app.app_context():
+        sources = [SourceURL(url=url, name=url, scrape_interval=interval, last_scraped=last_scraped)
+                   for url, interval, last_scraped in rows]
+        db.session.add_all(sources)
+        db.session.commit()
+        return [source.id for source in sources]
+
+
+def _due(scheduler):
+    """Due time of each scheduled source, from its live heap entry, in heap order"""
+    with scheduler._condition:
+        live = [entry for entry in scheduler._heap if scheduler._versions.get(entry[1]) == entry[2]]
+    return {source_id: due for due, source_id, _ in sorted(live)}
+
+
+def test_sources_are_due_one_interval_after_their_last_scrape(app, running_scheduler):
+    now = datetime.utcnow()
+    hourly, daily, overdue = _sources(app, ('http://feeds.invalid/hourly', 3600, now - timedelta(minutes=10)),
+                                      ('http://feeds.invalid/daily', 86400, now - timedelta(hours=1)),
+                                      ('http://feeds.invalid/overdue', 86400, now - timedelta(days=30)))
+    with app.app_context():
+        SourceURL.query.filter_by(id=overdue).update({'active': False})
+        db.session.commit()
+
+    running_scheduler()
+
+    assert _due(scheduler) == {
+        hourly: _timestamp(now - timedelta(minutes=10)) + 3600,
+        daily: _timestamp(now - timedelta(hours=1)) + 86400,
+    }
+
+
+def test_updating_a_source_recomputes_its_due_time(app, running_scheduler):
+    last_scraped = datetime.utcnow() - timedelta(minutes=10)
+    source_id, = _sources(app, ('http://feeds.invalid/report', 3600, last_scraped))
+    running_scheduler()
+    client = app.test_client()
+
+    client.put(f'/api/sources/{source_id}', json={'scrape_interval': 7200})
+    assert _due(scheduler) == {source_id: _timestamp(last_scraped) + 7200}
+
+    client.put(f'/api/sources/{source_id}', json={'active': False})
+    assert _due(scheduler) == {}
+
+    client.put(f'/api/sources/{source_id}', json={'active': True})
+    assert _due(scheduler) == {source_id: _timestamp(last_scraped) + 7200}
+
+
+def test_frequent_updates_do_not_grow_the_heap(app, running_scheduler):
+    source_id, = _sources(app, ('http://feeds.invalid/report', 3600, datetime.utcnow()))
+    running_scheduler()
+    with app.app_context():
+        source = db.session.get(SourceURL, source_id)
+        for _ in range(500):
+            scheduler.source_changed(source)
+
+    assert len(scheduler._heap) <= 2 * len(scheduler._versions) + 65
+    assert list(_due(scheduler)) == [source_id]
+
+
+def test_changes_from_other_processes_are_picked_up_by_sync(app, running_scheduler):
+    source_id, = _sources(app, ('http://feeds.invalid/report', 3600, datetime.utcnow()))
+    running_scheduler()
+
+    with app.app_context():
+        SourceURL.query.filter_by(id=source_id).update({'active': False, 'updated_at': datetime.utcnow()})
+        db.session.commit()
+    time.sleep(0.5)
+
+    assert _due(scheduler) == {}
+
+
+def test_due_source_is_scraped_every_interval(app, slow_site, running_scheduler):
+    site, requests = slow_site(0)
+    due, later = _sources(app, (f'{site}/due', 1, None), (f'{site}/later', 3600, datetime.utcnow()))
+
+    running_scheduler()
+    time.sleep(2.5)
+
+    assert len(requests) in (2, 3)
+    with app.app_context():
+        assert {session.source_url_id for session in ScrapeSession.query} == {due}
@@ -0,0 +1,25 @@
+import json
+
+from app import job_queue
+from app.async_scraper import AsyncWebScraper
+
+
+def test_same_host_batch_larger_than_per_host_completes(app, slow_site):
+    site, requests = slow_site(0.3)
+    app.config['JOB_BATCH_PER_HOST'] = 2
+    job_queue.start()
+    # As JobQueue.start builds it, with a connect timeout shorter than the
+    # wait of the URLs queued behind the per-host limit
+    job_queue.async_scraper = AsyncWebScraper(
+        job_queue.scraper, concurrency=app.config['JOB_BATCH_SIZE'], per_host=2, connect_timeout=0.2
+    )
+    urls = [f'{site}/report/{index}' for index in range(12)]
+
+    response = app.test_client().post('/api/scrape/batch', json={'urls': urls, 'stream': True})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    sessions = [line['session'] for line in lines if 'session' in line]
+    assert [session.get('error_message') for session in sessions] == [None] * 12
+    assert {session['status'] for session in sessions} == {'completed'}
+    assert lines[-1]['summary']['completed'] == 12
+    assert len(requests) == 12
@@ -0,0 +1,41 @@
+import time
+
+from app import db, job_queue
+from app.models import ScrapeSession
+
+
+def _wait_for(app, session_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with app.app_context():
+            session = db.session.get(ScrapeSession, session_id)
+            if session.status not in ('pending', 'running'):
+                return session
+        time.sleep(0.05)
+    raise AssertionError(f'session {session_id} did not finish')
+
+
+def _ids(response):
+    return [session['id'] for session in response.get_json()['sessions']]
+
+
+def test_running_a_queued_session_keeps_its_place_between_pages(app, slow_site):
+    site, _ = slow_site(0)
+    client = app.test_client()
+    with app.app_context():
+        queued = job_queue.enqueue(f'{site}/report').id
+        later = [ScrapeSession(url=f'{site}/{index}', status='completed') for index in range(3)]
+        db.session.add_all(later)
+        db.session.commit()
+        later = [session.id for session in later]
+
+    first = client.get('/api/sessions', query_string={'cursor': '', 'per_page': 2})
+    assert _ids(first) == [later[2], later[1]]
+
+    job_queue.start()
+    session = _wait_for(app, queued)
+    assert session.status == 'completed'
+    assert session.running_at >= session.started_at
+
+    second = client.get('/api/sessions', query_string={'cursor': first.get_json()['next_cursor'], 'per_page': 2})
+    assert _ids(second) == [later[0], queued]
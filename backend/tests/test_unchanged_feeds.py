@@ -0,0 +1,58 @@
+import pytest
+
+from app import scrapers
+from app.scrapers import WebScraper
+
+FEED = ''.join(f'198.51.100.{index}\nbad-{index}.example.net\n' for index in range(1, 200))
+
+
+@pytest.fixture
+def feed(slow_site):
+    site, requests = slow_site(0, body=FEED, content_type='text/plain; charset=utf-8')
+    return f'{site}/feed.txt', requests
+
+
+def _no_extraction(*args, **kwargs):
+    raise AssertionError('an unchanged feed was extracted')
+
+
+def test_unchanged_feed_is_skipped_before_extraction(feed):
+    url, _ = feed
+    scraper = WebScraper()
+    first = scraper.scrape_url(url)
+    assert first['success'] and first['iocs']
+
+    scraper.extractor.iter_iocs = _no_extraction
+    second = scraper.scrape_url(url, validators=first['validators'])
+
+    assert second['skipped'] == 'unchanged'
+    assert second['iocs'] == []
+    assert second['validators'] == first['validators']
+    assert second['bytes_fetched'] == len(FEED)
+
+
+def test_changed_feed_is_extracted(feed):
+    url, _ = feed
+    scraper = WebScraper()
+    first = scraper.scrape_url(url)
+
+    result = scraper.scrape_url(url, validators=dict(first['validators'], body_digest='0' * 64))
+
+    assert 'skipped' not in result
+    assert len(result['iocs']) == len(first['iocs'])
+
+
+def test_large_feed_is_streamed(feed, monkeypatch):
+    url, _ = feed
+    scraper = WebScraper()
+    buffered = scraper.scrape_url(url)
+    monkeypatch.setattr(scrapers, 'BUFFERED_BODY_SIZE', 1024)
+    first = scraper.scrape_url(url)
+
+    # Only known to be unchanged once streamed through the extractor
+    second = scraper.scrape_url(url, validators=first['validators'])
+
+    assert first['validators']['body_digest'] == second['validators']['body_digest']
+    assert second['skipped'] == 'unchanged'
+    assert first['iocs'] == buffered['iocs']
+    assert first['validators'] == buffered['validators']
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from app.scrapers import WebScraper
+from app.visible_text import visible_text
+from benchmarks.bench_visible_text import generate_page
+
+TAGS = ('div', 'p', 'span', 'a', 'b', 'ul', 'li', 'table', 'tr', 'td', 'pre', 'textarea', 'select', 'option',
+        'br', 'img', 'svg', 'iframe', 'ruby', 'rt', 'rp', 'template', 'script', 'style', 'noscript',
+        'head', 'title', 'meta', 'link', 'body', 'html')
+ATTRIBUTES = (
+    'style="display:none"', 'style="DISPLAY:none"', 'style="color:red; display: none"',
+    'style="visibility:hidden"', 'style="visibility :hidden"', 'class="hidden"', 'class="x hidden"',
+    'class="HIDDEN"', 'class="a\xa0sr-only"', 'class="visually-hidden\tb"', 'class="hiddenx"', 'class=""',
+    'aria-hidden="true"', 'aria-hidden="TRUE"', 'aria-hidden="false"', 'hidden', 'HIDDEN=""', 'id="x"',
+    'href="http://evil.example.net/a"',
+)
+TEXTS = ('foo', 'bar 1.2.3.4', 'evil.com', '\xa0', '  ', '\n', '&nbsp;', '&amp;x', ' em', 'x​y',
+         '<', '>', '&', 'ünï')
+
+# Documents where lxml and BeautifulSoup build different trees: a leading
+# BOM, text before the first element, text after </html> (also after a
+# hidden html element), template, rt and rp strings, an XML declaration
+# and markup that can leave libxml2 looping
+EDGE_CASES = (
+    '', '   ', 'plain text', '﻿<p>x</p>', '<ünï', '<d=', 'r</html>\no', '<!DOCTYPE>r</html>\no',
+    '<html style="display:none">x</html> em', '<html hidden><p>x</p></html>y</html>z',
+    'foo<!-- c -->bar<script>x</script>baz', '<ruby>kan<rt>KAN</rt>tail</ruby>',
+    '<template>t</template>after', '<p class="a\xa0sr-only">x</p>y',
+    '<?xml version="1.0" encoding="utf-8"?><html><body>hi</body></html>',
+)
+
+
+def random_markup(rng, depth=0):
+    """A fragment of messy markup: unclosed and stray tags, nested html and
+    body tags, comments, processing instructions, entities, odd whitespace
+    and every hiding attribute in upper and lower case"""
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        if kind < 0.35:
+            parts.append(rng.choice(TEXTS))
+        elif kind < 0.40:
+            parts.append(f'<!-- c {rng.choice(TEXTS)} -->')
+        elif kind < 0.42:
+            parts.append('<?php x ?>')
+        elif kind < 0.44:
+            parts.append('<![CDATA[cd]]>')
+        elif kind < 0.46:
+            parts.append(f'</{rng.choice(TAGS)}>')
+        elif depth < 6:
+            tag = rng.choice(TAGS)
+            attributes = ' '.join(rng.sample(ATTRIBUTES, rng.randint(0, 2)))
+            close = '' if rng.random() < 0.1 else f'</{tag}>'
+            parts.append(f'<{tag} {attributes}>{random_markup(rng, depth + 1)}{close}')
+    markup = ''.join(parts)
+    if depth == 0 and rng.random() < 0.3:
+        markup = f'<!DOCTYPE html><html><body>{markup}</body></html>'
+    return markup
+
+
+@pytest.mark.parametrize('markup', EDGE_CASES)
+def test_edge_cases_match_beautifulsoup(markup):
+    scraper = WebScraper()
+
+    assert scraper.extract_visible_text(markup) == scraper.soup_visible_text(markup)
+
+
+def test_text_before_first_element_is_left_to_beautifulsoup():
+    assert visible_text('<ünï') is None
+    assert visible_text('<p>x</p>') == WebScraper().soup_visible_text('<p>x</p>')
+
+
+def test_report_page_matches_beautifulsoup():
+    page = generate_page(100 * 1024)
+
+    assert visible_text(page) == WebScraper().soup_visible_text(page)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_markup_matches_beautifulsoup(seed):
+    scraper = WebScraper()
+    rng = random.Random(seed)
+    fallbacks = 0
+    for _ in range(1000):
+        markup = random_markup(rng)
+        text = visible_text(markup)
+        if text is None:
+            fallbacks += 1
+        else:
+            assert text == scraper.soup_visible_text(markup), markup
+    # Only documents with text before their first element go to BeautifulSoup
+    assert fallbacks < 200
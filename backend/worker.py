@@ -0,0 +1,12 @@
+from app import create_app, job_queue, metrics
+import logging
+import os
+
+app = create_app()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # This process's scrape metrics, as the API serves its own at /api/metrics
+    if os.environ.get('METRICS_PORT'):
+        metrics.serve(int(os.environ['METRICS_PORT']))
+    job_queue.run_forever()
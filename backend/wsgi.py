@@ -0,0 +1,8 @@
+from app import create_app
+from app.scrapers import shared_extractor
+
+app = create_app()
+
+# Loaded once in the gunicorn master (preload_app), so the extractor's compiled
+# patterns and allowlists are built before the fork and shared by the workers
+shared_extractor()
@@ -73,7 +73,22 @@ export default {
     return api.get('/sessions', { params })
   },
   
+  getSession(sessionId) {
+    return api.get(`/sessions/${sessionId}`)
+  },
+  
   getSessionIOCs(sessionId) {
     return api.get(`/sessions/${sessionId}/iocs`)
+  },
+  
+  // Scrapes are queued; poll the session until it is no longer pending or running
+  async waitForSession(sessionId, interval = 1000) {
+    for (;;) {
+      const response = await api.get(`/sessions/${sessionId}`)
+      if (!['pending', 'running'].includes(response.data.status)) {
+        return response
+      }
+      await new Promise(resolve => setTimeout(resolve, interval))
+    }
   }
 } 
\ No newline at end of file